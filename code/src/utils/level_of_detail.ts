@@ -42,6 +42,49 @@ const createLevelOfDetail = async (config: LevelOfDetailConfiguration, postLoad?
     return lod;
 }
 
+// Creates a LoD object from a file written by write_lod_binary (helpers/progressive_meshes/lod_export.py)
+// Every level shares one position buffer, distances[i] is used for level i (most detailed first)
+const createLevelOfDetailFromBinary = async (url: string, distances: number[], material?: THREE.Material): Promise<THREE.LOD> => {
+    const response = await fetch(url);
+    const buffer = await response.arrayBuffer();
 
+    const header = new DataView(buffer, 0, 16);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
 
-export { createLevelOfDetail };
\ No newline at end of file
+    if(magic !== "LOD1" || header.getUint32(4, true) !== 1) {
+        throw new Error("Unsupported level of detail binary");
+    }
+
+    const vertexCount = header.getUint32(8, true);
+    const levelCount = header.getUint32(12, true);
+
+    if(distances.length < levelCount) {
+        throw new Error(`Expected ${levelCount} distances, received ${distances.length}`);
+    }
+
+    // Level table rows are (target, face offset, face count)
+    const levelTable = new Uint32Array(buffer, 16, levelCount * 3);
+    let offset = 16 + levelCount * 12;
+
+    const positions = new THREE.BufferAttribute(new Float32Array(buffer, offset, vertexCount * 3), 3);
+    offset += vertexCount * 12;
+
+    const lod = new THREE.LOD();
+    const levelMaterial = material ?? new THREE.MeshStandardMaterial({ metalness: 0 });
+
+    for(let level = 0; level < levelCount; level++) {
+        const faceOffset = levelTable[level * 3 + 1];
+        const faceCount = levelTable[level * 3 + 2];
+
+        const geometry = new THREE.BufferGeometry();
+        geometry.setAttribute("position", positions);
+        geometry.setIndex(new THREE.BufferAttribute(new Uint32Array(buffer, offset + faceOffset * 12, faceCount * 3), 1));
+        geometry.computeVertexNormals();
+
+        lod.addLevel(new THREE.Mesh(geometry, levelMaterial), distances[level]);
+    }
+
+    return lod;
+}
+
+export { createLevelOfDetail, createLevelOfDetailFromBinary };
\ No newline at end of file
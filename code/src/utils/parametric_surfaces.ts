@@ -1,4 +1,4 @@
-import { BufferGeometry, Material, Mesh, PerspectiveCamera, Points, PointsMaterial, Vector2, Vector3, Vector4 } from "three";
+import { BufferAttribute, BufferGeometry, Material, Mesh, PerspectiveCamera, Points, PointsMaterial, Vector2, Vector3, Vector4 } from "three";
 import { ParametricGeometry } from "three/examples/jsm/geometries/ParametricGeometry";
 import { binomial } from "./binomial_coeff";
 import { Registerable } from "./registerable";
@@ -421,4 +421,38 @@ const createCubicBezierCurve = (p_0: Vector2, p_1: Vector2, p_2: Vector2, p_3: V
     }
 }
 
-export { ParametricSurface, BezierSurface, BSplineSurface, NURBSSurface, LODParametricBinder, createCubicBezierCurve };
\ No newline at end of file
+// Loads a surface precomputed by write_surface_binary (helpers/parametric_surfaces/surface_export.py)
+// so it does not need to be tessellated at page load, the typed arrays are views over the downloaded buffer
+const loadSurfaceMesh = async (url: string): Promise<BufferGeometry> => {
+    const response = await fetch(url);
+    const buffer = await response.arrayBuffer();
+
+    const header = new DataView(buffer, 0, 16);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+
+    if(magic !== "PSM1" || header.getUint32(4, true) !== 1) {
+        throw new Error("Unsupported surface mesh binary");
+    }
+
+    const vertexCount = header.getUint32(8, true);
+    const indexCount = header.getUint32(12, true);
+
+    let offset = 16;
+    const positions = new Float32Array(buffer, offset, vertexCount * 3);
+    offset += vertexCount * 12;
+    const normals = new Float32Array(buffer, offset, vertexCount * 3);
+    offset += vertexCount * 12;
+    const uvs = new Float32Array(buffer, offset, vertexCount * 2);
+    offset += vertexCount * 8;
+    const indices = new Uint32Array(buffer, offset, indexCount);
+
+    const geometry = new BufferGeometry();
+    geometry.setAttribute("position", new BufferAttribute(positions, 3));
+    geometry.setAttribute("normal", new BufferAttribute(normals, 3));
+    geometry.setAttribute("uv", new BufferAttribute(uvs, 2));
+    geometry.setIndex(new BufferAttribute(indices, 1));
+
+    return geometry;
+}
+
+export { ParametricSurface, BezierSurface, BSplineSurface, NURBSSurface, LODParametricBinder, createCubicBezierCurve, loadSurfaceMesh };
\ No newline at end of file
@@ -19,6 +19,121 @@ interface ReductionRecord {
     polygons: string[][];
 }
 
+// Everything needed to construct a ProgressiveMesh
+interface ProgressiveMeshData {
+    vertices: VertexData[];
+    faces: string[][];
+    maxVertices: number;
+    maxFaces: number;
+    reductionData: ReductionRecord[];
+}
+
+// Parses the binary container written by helpers/progressive_meshes/progressive_binary.py
+// Every block is 4 byte aligned so it can be viewed as a typed array without copying the buffer
+const parseProgressiveMeshBinary = (buffer: ArrayBuffer): ProgressiveMeshData => {
+    const header = new DataView(buffer, 0, 72);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+
+    if(magic !== "PMB2" || header.getUint32(4, true) !== 2) {
+        throw new Error("Unsupported progressive mesh binary");
+    }
+
+    const vertexCount = header.getUint32(8, true);
+    const faceCount = header.getUint32(12, true);
+    const recordCount = header.getUint32(16, true);
+    const recordPolygonCount = header.getUint32(20, true);
+    const nameCount = header.getUint32(24, true);
+    const nameBytes = header.getUint32(28, true);
+    const indexBytes = header.getUint32(40, true);
+    const positionBits = header.getUint32(44, true);
+    const origin = [0, 1, 2].map(k => header.getFloat32(48 + k * 4, true));
+    const scale = [0, 1, 2].map(k => header.getFloat32(60 + k * 4, true));
+
+    let offset = 72;
+
+    // Views the next block and moves past it and its padding to the next 4 byte boundary
+    const take = <T>(create: (at: number, length: number) => T, length: number, elementBytes: number): T => {
+        const view = create(offset, length);
+        offset += Math.ceil(length * elementBytes / 4) * 4;
+        return view;
+    }
+
+    const takeIndices = (length: number) => indexBytes === 2 ?
+        take((at, n) => new Uint16Array(buffer, at, n), length, 2) :
+        take((at, n) => new Uint32Array(buffer, at, n), length, 4);
+
+    // Quantised positions are steps of scale from origin
+    const takePositions = (length: number): Float32Array => {
+        if(positionBits === 0) {
+            return take((at, n) => new Float32Array(buffer, at, n), length, 4);
+        }
+
+        const steps = take((at, n) => new Uint16Array(buffer, at, n), length, 2);
+        return Float32Array.from(steps, (step, i) => origin[i % 3] + step * scale[i % 3]);
+    }
+
+    const vertexBlock = takePositions(vertexCount * 3);
+    const faceBlock = takeIndices(faceCount * 3);
+    const recordI = take((at, n) => new Uint32Array(buffer, at, n), recordCount, 4);
+    const recordNames = takeIndices(recordCount * 3);
+    const polygonCounts = take((at, n) => new Uint16Array(buffer, at, n), recordCount, 2);
+    const recordCoords = takePositions(recordCount * 6);
+    const polygonBlock = takeIndices(recordPolygonCount * 3);
+    const nameOffsets = take((at, n) => new Uint32Array(buffer, at, n), nameCount + 1, 4);
+    const nameData = new Uint8Array(buffer, offset, nameBytes);
+
+    const decoder = new TextDecoder();
+    const names: string[] = [];
+
+    for(let i = 0; i < nameCount; i++) {
+        names.push(decoder.decode(nameData.subarray(nameOffsets[i], nameOffsets[i + 1])));
+    }
+
+    const vertices: VertexData[] = [];
+
+    for(let i = 0; i < vertexCount; i++) {
+        vertices.push({ name: names[i], coords: Array.from(vertexBlock.subarray(i * 3, i * 3 + 3)) });
+    }
+
+    const toNames = (block: Uint16Array | Uint32Array, start: number, count: number): string[][] => {
+        const polygons: string[][] = [];
+
+        for(let i = start; i < start + count; i++) {
+            polygons.push([names[block[i * 3]], names[block[i * 3 + 1]], names[block[i * 3 + 2]]]);
+        }
+
+        return polygons;
+    }
+
+    const reductionData: ReductionRecord[] = [];
+    let polygonStart = 0;
+
+    // Record columns: m, x and y name ids are one row each, x coords precede all y coords
+    for(let i = 0; i < recordCount; i++) {
+        const coordsAt = (row: number) => Array.from(recordCoords.subarray((row * recordCount + i) * 3, (row * recordCount + i) * 3 + 3));
+
+        reductionData.push({
+            i: recordI[i],
+            mName: names[recordNames[i]],
+            xName: names[recordNames[recordCount + i]],
+            xCoords: coordsAt(0),
+            yName: names[recordNames[2 * recordCount + i]],
+            yCoords: coordsAt(1),
+            polygons: toNames(polygonBlock, polygonStart, polygonCounts[i])
+        });
+
+        polygonStart += polygonCounts[i];
+    }
+
+    return {
+        vertices,
+        faces: toNames(faceBlock, 0, faceCount),
+        maxVertices: header.getUint32(32, true),
+        maxFaces: header.getUint32(36, true),
+        reductionData
+    };
+}
+
 // Defines the reconstruction process of an edge-collapsed mesh
 class ProgressiveMesh {
     // We predefine these to prevent resizing the geometry which is very costly (and laggy!)
@@ -248,4 +363,45 @@ class ProgressiveMesh {
     }
 }
 
-export { ProgressiveMesh };
\ No newline at end of file
+// Streams the chunked refinement data written by helpers/progressive_meshes/chunked_delivery.py
+// The mesh is returned as soon as the base has loaded and each chunk is applied as it arrives
+// A chunk that fails to load stops the refinement and is passed to onError (console.error by default)
+const streamRefinementChunks = async (baseUrl: string, onError: (error: unknown) => void = console.error): Promise<ProgressiveMesh> => {
+    const fetchJson = async (file: string) => {
+        const response = await fetch(`${baseUrl}/${file}`);
+
+        if(!response.ok) {
+            throw new Error(`Failed to fetch ${baseUrl}/${file}: ${response.status} ${response.statusText}`);
+        }
+
+        return response.json();
+    }
+
+    const index = await fetchJson("index.json");
+    const base = await fetchJson(index.base);
+    const mesh = new ProgressiveMesh(base.vertices, base.polygons, base.maximums.vertices, base.maximums.polygons, []);
+
+    const refine = async () => {
+        for(const chunk of index.chunks) {
+            const { records } = await fetchJson(chunk.file);
+
+            // Records are already in refinement order, each one is stepped immediately
+            for(const record of records as ReductionRecord[]) {
+                mesh.addToReductionBuffer(record);
+            }
+        }
+    }
+
+    refine().catch(onError);
+    return mesh;
+}
+
+// Loads a container written by OBJModel.to_binary, the mesh starts fully reduced with every record buffered
+const loadProgressiveMeshBinary = async (url: string): Promise<ProgressiveMesh> => {
+    const response = await fetch(url);
+    const data = parseProgressiveMeshBinary(await response.arrayBuffer());
+
+    return new ProgressiveMesh(data.vertices, data.faces, data.maxVertices, data.maxFaces, data.reductionData);
+}
+
+export { ProgressiveMesh, loadProgressiveMeshBinary, streamRefinementChunks };
\ No newline at end of file
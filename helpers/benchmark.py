@@ -0,0 +1,334 @@
+## Headless benchmarks of the decimation and surface helpers, results go to a JSON file so runs can be compared
+
+from typing import Any, Callable, Dict, List, Optional
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# The helpers are flat scripts that import each other by module name
+HELPERS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PROGRESSIVE_MESHES_DIRECTORY = os.path.join(HELPERS_DIRECTORY, "progressive_meshes")
+PARAMETRIC_SURFACES_DIRECTORY = os.path.join(HELPERS_DIRECTORY, "parametric_surfaces")
+sys.path[:0] = [PROGRESSIVE_MESHES_DIRECTORY, PARAMETRIC_SURFACES_DIRECTORY]
+
+from obj_model import process_obj_file, write_obj_file
+from bezier_surface import generate_bezier_surface
+from bspline_basis import clear_basis_cache
+from bspline_surface import generate_bspline_surface
+from nurbs_surface import generate_nurbs_surface
+
+"""
+Every benchmark is a function registered with @benchmark_case that receives a Benchmark fixture and one input size,
+like pytest-benchmark it calls benchmark(target, setup=...) with the code to time, setup runs before every round and is
+not timed, its return value is passed to target
+
+Each case is timed over a number of rounds (wall time) and then run once more under tracemalloc for the peak
+Python allocation, the two are kept apart as tracing slows the code down
+Decimation runs on synthetic subdivided spheres and bumpy grids of increasing size and on chair_max.obj
+
+Example: python benchmark.py --output results.json --compare baseline.json --filter reduce --engines queue batched
+"""
+
+# Input sizes per group, "quick" keeps a run under a minute
+SIZES = {
+    "quick": {
+        "meshes": ["sphere:2", "sphere:3", "grid:24", "chair_max.obj"],
+        "samples": [32, 128]
+    },
+    "full": {
+        "meshes": ["sphere:2", "sphere:3", "sphere:4", "grid:24", "grid:48", "grid:96", "chair_max.obj"],
+        "samples": [32, 128, 512, 1024]
+    }
+}
+
+# Decimation stops at this fraction of the original polygon count
+REDUCTION_RATIO = 0.5
+
+BENCHMARK_CASES: Dict[str, Dict[str, Any]] = {}
+
+def benchmark_case(group: str, parameter: str, per_engine: bool = False):
+    # Registers the decorated function, it is run once per value of SIZES[scale][parameter]
+    # and, with per_engine, once per collapse engine given on the command line (context["engine"])
+    def register(function):
+        BENCHMARK_CASES[function.__name__] = {
+            "group": group,
+            "parameter": parameter,
+            "per_engine": per_engine,
+            "function": function
+        }
+
+        return function
+
+    return register
+
+class Benchmark:
+    def __init__(self, rounds: int, measure_memory: bool):
+        self.rounds = rounds
+        self.measure_memory = measure_memory
+        self.times: List[float] = []
+        self.peak_memory: Optional[int] = None
+        self.extra_info: Dict[str, Any] = {}
+
+    def __call__(self, target: Callable, setup: Optional[Callable] = None):
+        result = None
+
+        for _ in range(self.rounds):
+            arguments = setup() if setup is not None else ()
+
+            start = time.perf_counter()
+            result = target(*arguments)
+            self.times.append(time.perf_counter() - start)
+
+        if self.measure_memory:
+            arguments = setup() if setup is not None else ()
+
+            tracemalloc.start()
+            target(*arguments)
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "rounds": len(self.times),
+            "min": min(self.times),
+            "max": max(self.times),
+            "mean": statistics.mean(self.times),
+            "median": statistics.median(self.times),
+            "stddev": statistics.stdev(self.times) if len(self.times) > 1 else 0.0,
+            "peak_memory": self.peak_memory,
+            "extra_info": self.extra_info
+        }
+
+def icosphere(subdivisions: int):
+    # Returns (vertices, faces) of a unit icosahedron split subdivisions times, 20 * 4^subdivisions triangles
+    t = (1 + math.sqrt(5)) / 2
+    vertices = [(-1, t, 0), (1, t, 0), (-1, -t, 0), (1, -t, 0), (0, -1, t), (0, 1, t), (0, -1, -t), (0, 1, -t), (t, 0, -1), (t, 0, 1), (-t, 0, -1), (-t, 0, 1)]
+    vertices = [tuple(c / math.sqrt(1 + t * t) for c in vertex) for vertex in vertices]
+    faces = [
+        (0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11), (1, 5, 9), (5, 11, 4), (11, 10, 2), (10, 7, 6), (7, 1, 8),
+        (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9), (4, 9, 5), (2, 4, 11), (6, 2, 10), (8, 6, 7), (9, 8, 1)
+    ]
+
+    for _ in range(subdivisions):
+        midpoints = {}
+
+        def midpoint(a, b):
+            key = (min(a, b), max(a, b))
+
+            if key not in midpoints:
+                x, y, z = [(vertices[a][k] + vertices[b][k]) / 2 for k in range(3)]
+                length = math.sqrt(x * x + y * y + z * z)
+                vertices.append((x / length, y / length, z / length))
+                midpoints[key] = len(vertices) - 1
+
+            return midpoints[key]
+
+        next_faces = []
+
+        for a, b, c in faces:
+            ab, bc, ca = midpoint(a, b), midpoint(b, c), midpoint(c, a)
+            next_faces.extend([(a, ab, ca), (b, bc, ab), (c, ca, bc), (ab, bc, ca)])
+
+        faces = next_faces
+
+    return vertices, faces
+
+def bumpy_grid(size: int):
+    # Returns (vertices, faces) of a size x size grid of cells over a gentle height field, 2 * size^2 triangles
+    vertices = [(i / size, j / size, 0.1 * math.sin(4 * i / size) * math.cos(3 * j / size)) for i in range(size + 1) for j in range(size + 1)]
+    faces = []
+
+    for i in range(size):
+        for j in range(size):
+            a, b = i * (size + 1) + j, (i + 1) * (size + 1) + j
+            faces.extend([(a, b, b + 1), (a, b + 1, a + 1)])
+
+    return vertices, faces
+
+SYNTHETIC_MESHES = {
+    "sphere": icosphere,
+    "grid": bumpy_grid
+}
+
+def resolve_mesh(mesh: str, directory: str) -> str:
+    # "sphere:3" / "grid:48" are written to directory as .obj files, anything else is a path next to the decimation helpers
+    if ":" not in mesh:
+        return os.path.join(PROGRESSIVE_MESHES_DIRECTORY, mesh)
+
+    kind, size = mesh.split(":")
+    assert kind in SYNTHETIC_MESHES.keys(), f"Unknown synthetic mesh {kind}, expected one of {list(SYNTHETIC_MESHES.keys())}"
+
+    file_name = os.path.join(directory, f"{kind}_{size}.obj")
+
+    if not os.path.exists(file_name):
+        vertices, faces = SYNTHETIC_MESHES[kind](int(size))
+
+        with open(file_name, "w") as fp:
+            fp.write("".join(f"v {x} {y} {z}\n" for x, y, z in vertices))
+            fp.write("".join(f"f {a + 1} {b + 1} {c + 1}\n" for a, b, c in faces))
+
+    return file_name
+
+def reduce_to_ratio(model, engine: str):
+    target = int(model.maximum_polygons * REDUCTION_RATIO)
+
+    # reduce reports its stopping reason on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.reduce(None, lambda iterations, polygons: polygons <= target, engine=engine)
+
+    return model
+
+@benchmark_case("decimation", "meshes")
+def bench_process_obj_file(benchmark: Benchmark, mesh: str, context: Dict[str, Any]):
+    model = benchmark(process_obj_file, setup=lambda: (mesh,))
+    benchmark.extra_info["polygons"] = model.maximum_polygons
+
+@benchmark_case("decimation", "meshes", per_engine=True)
+def bench_reduce(benchmark: Benchmark, mesh: str, context: Dict[str, Any]):
+    model = benchmark(lambda model: reduce_to_ratio(model, context["engine"]), setup=lambda: (process_obj_file(mesh),))
+
+    # Mean time per collapse
+    iterations = len(model.reduction_records)
+    benchmark.extra_info["iterations"] = iterations
+    benchmark.extra_info["per_iteration"] = statistics.mean(benchmark.times) / max(iterations, 1)
+
+@benchmark_case("decimation", "meshes")
+def bench_to_json(benchmark: Benchmark, mesh: str, context: Dict[str, Any]):
+    model = reduce_to_ratio(process_obj_file(mesh), context["engines"][0])
+    save = os.path.join(context["directory"], "reduced.json")
+
+    benchmark(lambda: model.to_json(save=save, readable=False))
+    benchmark.extra_info["bytes"] = os.path.getsize(save)
+
+@benchmark_case("decimation", "meshes")
+def bench_write_obj_file(benchmark: Benchmark, mesh: str, context: Dict[str, Any]):
+    model = reduce_to_ratio(process_obj_file(mesh), context["engines"][0])
+    save = os.path.join(context["directory"], "reduced.rr.obj")
+
+    benchmark(lambda: write_obj_file(model, write_reduction_records=True, file_name=save))
+    benchmark.extra_info["bytes"] = os.path.getsize(save)
+
+def surface_control_points():
+    # Shared by the surface cases, a 4 x 4 Bezier net and a 7 x 6 B-spline / NURBS net
+    rng = np.random.default_rng(0)
+    bezier = np.stack(list(np.meshgrid(np.arange(4.0), np.arange(4.0), indexing="ij")) + [rng.uniform(-1, 1, (4, 4))], axis=-1)
+    net = np.stack(list(np.meshgrid(np.arange(7.0), np.arange(6.0), indexing="ij")) + [rng.uniform(-1, 1, (7, 6))], axis=-1)
+    weights = rng.uniform(0.5, 2, (7, 6, 1))
+
+    return bezier, net, np.concatenate([net, weights], axis=-1)
+
+@benchmark_case("surfaces", "samples")
+def bench_generate_bezier_surface(benchmark: Benchmark, samples: int, context: Dict[str, Any]):
+    bezier, _, _ = surface_control_points()
+    benchmark(lambda: generate_bezier_surface(bezier, samples), setup=lambda: clear_basis_cache() or ())
+
+@benchmark_case("surfaces", "samples")
+def bench_generate_bspline_surface(benchmark: Benchmark, samples: int, context: Dict[str, Any]):
+    _, net, _ = surface_control_points()
+    U, V = [0, 0, 0, 0, 1, 2, 3, 4, 4, 4, 4], [0, 0, 0, 1, 2, 3, 4, 4, 4]
+    benchmark(lambda: generate_bspline_surface(7, 6, U, V, 3, 2, net, samples), setup=lambda: clear_basis_cache() or ())
+
+@benchmark_case("surfaces", "samples")
+def bench_generate_nurbs_surface(benchmark: Benchmark, samples: int, context: Dict[str, Any]):
+    _, _, net = surface_control_points()
+    U, V = [0, 0, 0, 0, 1, 2, 3, 4, 4, 4, 4], [0, 0, 0, 1, 2, 3, 4, 4, 4]
+    benchmark(lambda: generate_nurbs_surface(net, U, V, 3, 2, samples), setup=lambda: clear_basis_cache() or ())
+
+def run_benchmarks(scale: str, filters: List[str], engines: List[str], rounds: int, measure_memory: bool) -> List[Dict[str, Any]]:
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        context = {"engines": engines, "directory": directory}
+
+        for name, case in BENCHMARK_CASES.items():
+            if len(filters) > 0 and not any(pattern in name for pattern in filters):
+                continue
+
+            for value in SIZES[scale][case["parameter"]]:
+                argument = resolve_mesh(value, directory) if case["parameter"] == "meshes" else value
+
+                for engine in (engines if case["per_engine"] else [None]):
+                    label = f"{value} [{engine}]" if engine is not None else str(value)
+                    benchmark = Benchmark(rounds, measure_memory)
+                    case["function"](benchmark, argument, {**context, "engine": engine})
+
+                    result = {"name": name, "group": case["group"], "input": label, **benchmark.summary()}
+                    results.append(result)
+
+                    memory = f"{result['peak_memory'] / 1e6:.1f} MB" if result["peak_memory"] is not None else "-"
+                    print(f"{name:<32} {label:<24} {result['mean'] * 1e3:>10.2f} ms  {memory:>10}")
+
+    return results
+
+def compare_results(results: List[Dict[str, Any]], baseline_file: str, threshold: float):
+    # Prints the change in the fastest round against an earlier results file, slower than threshold is flagged
+    # (the minimum is the least affected by other load on the machine)
+    with open(baseline_file) as fp:
+        baseline = {(result["name"], result["input"]): result for result in json.load(fp)["results"]}
+
+    print(f"\nCompared with {baseline_file}")
+
+    for result in results:
+        previous = baseline.get((result["name"], result["input"]))
+
+        if previous is None:
+            continue
+
+        ratio = result["min"] / previous["min"]
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{result['name']:<32} {result['input']:<24} {ratio:>7.2f}x{flag}")
+
+def main(arguments: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the decimation and surface helpers")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    parser.add_argument("--scale", choices=list(SIZES.keys()), default="quick", help="set of input sizes to run")
+    parser.add_argument("--filter", nargs="*", default=[], help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--engines", nargs="+", default=["queue"], help="collapse engines timed by the per engine benchmarks, the first one prepares the models of the others")
+    parser.add_argument("--rounds", type=int, default=3, help="timed rounds per benchmark")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc round")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare the fastest rounds with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    options = parser.parse_args(arguments)
+
+    assert options.rounds > 0, f"Expected at least one round, received {options.rounds}"
+
+    results = run_benchmarks(options.scale, options.filter, options.engines, options.rounds, not options.no_memory)
+
+    with open(options.output, "w") as fp:
+        json.dump({
+            "created": time.time(),
+            "machine": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "processor": platform.processor()
+            },
+            "settings": {
+                "scale": options.scale,
+                "engines": options.engines,
+                "rounds": options.rounds
+            },
+            "results": results
+        }, fp, indent=2)
+
+    print(f"Results written to {options.output}")
+
+    if options.compare is not None:
+        compare_results(results, options.compare, options.threshold)
+
+if __name__ == "__main__":
+    main()
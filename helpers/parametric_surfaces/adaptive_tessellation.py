@@ -0,0 +1,193 @@
+## Adaptive alternative to the uniform grids of tessellation.py, produces the same mesh dictionaries as surface_export.py
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+from bspline_surface import evaluate_surface_points
+from derivatives import nurbs_surface_point_derivatives
+from surface_export import normalise_vectors
+
+"""
+Curvature driven tessellation of B-spline and NURBS surfaces
+Parameter space is split as a quadtree, a cell is subdivided while the surface at any probe (PROBE_OFFSETS)
+is further than chord_tolerance from the linear estimate through its corners, measured along the surface normal,
+or while the normals at its corners and centre differ by more than normal_tolerance degrees
+
+Cells are addressed on an integer lattice of 2^(max_depth + 1) steps per axis so every corner and centre is exact
+A leaf with no finer neighbours becomes two triangles, a leaf with hanging vertices on its edges (from smaller neighbours)
+becomes a fan around its centre through every vertex on its boundary, so neighbouring leaves always share their edge vertices
+and the triangulation is crack free without balancing the tree
+"""
+
+# Points probed inside each cell as fractions of the cell: the centre (twice, once per triangle diagonal),
+# the midpoints of the bottom, right, top and left edges and the centres of the four quarters
+PROBE_OFFSETS = np.array([
+    [0.5, 0.5], [0.5, 0.5],
+    [0.5, 0], [1, 0.5], [0.5, 1], [0, 0.5],
+    [0.25, 0.25], [0.75, 0.25], [0.75, 0.75], [0.25, 0.75]
+])
+# Linear estimate of each probe from the corners (bottom left, bottom right, top right, top left)
+# The centre is compared with both diagonals as the leaf may be split along either of them
+PROBE_WEIGHTS = np.array([
+    [0.5, 0, 0.5, 0],
+    [0, 0.5, 0, 0.5],
+    [0.5, 0.5, 0, 0],
+    [0, 0.5, 0.5, 0],
+    [0, 0, 0.5, 0.5],
+    [0.5, 0, 0, 0.5],
+    [0.5625, 0.1875, 0.0625, 0.1875],
+    [0.1875, 0.5625, 0.1875, 0.0625],
+    [0.0625, 0.1875, 0.5625, 0.1875],
+    [0.1875, 0.0625, 0.1875, 0.5625]
+])
+CORNER_OFFSETS = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+
+def _refine(evaluate, to_parameters, lattice, chord_tolerance, normal_tolerance, max_depth, min_depth):
+    # Returns the leaves as (i, j, size) in lattice units
+    size = lattice >> min_depth
+    starts = np.arange(0, lattice, size)
+    i, j = np.meshgrid(starts, starts, indexing="ij")
+    cells = np.stack([i.ravel(), j.ravel(), np.full(i.size, size)], axis=1)
+
+    leaves = []
+    depth = min_depth
+    cos_tolerance = np.cos(np.radians(normal_tolerance)) if normal_tolerance is not None else None
+
+    while len(cells) > 0:
+        if depth >= max_depth:
+            leaves.append(cells)
+            break
+
+        origins = cells[:, None, :2]
+        sizes = cells[:, None, 2:]
+        corners = (origins + CORNER_OFFSETS * sizes).reshape(-1, 2)
+        probes = (origins + PROBE_OFFSETS * sizes).reshape(-1, 2)
+
+        corner_points, corner_normals = evaluate(*to_parameters(corners))
+        probe_points, probe_normals = evaluate(*to_parameters(probes))
+
+        corner_points = corner_points.reshape(len(cells), 4, 3)
+        probe_points = probe_points.reshape(len(cells), len(PROBE_OFFSETS), 3)
+
+        # Only the offset along the surface normal is visible, sliding within the surface
+        # (a non-uniform parameterisation of a flat region) does not need more triangles
+        estimates = np.einsum("pc,kcd->kpd", PROBE_WEIGHTS, corner_points)
+        probe_normals = probe_normals.reshape(len(cells), len(PROBE_OFFSETS), 3)
+        deviation = np.abs(np.einsum("kpd,kpd->kp", probe_points - estimates, probe_normals))
+
+        # Fall back to the full distance where the normal is degenerate
+        degenerate = np.linalg.norm(probe_normals, axis=-1) < 0.5
+        deviation[degenerate] = np.linalg.norm(probe_points - estimates, axis=-1)[degenerate]
+        split = deviation.max(axis=1) > chord_tolerance
+
+        if cos_tolerance is not None:
+            corner_normals = corner_normals.reshape(len(cells), 4, 3)
+            centre_normals = probe_normals[:, :1]
+            # Degenerate (zero) normals give a zero dot product, only compare where both normals exist
+            dots = np.einsum("kcd,kod->kc", corner_normals, centre_normals)
+            valid = (np.linalg.norm(corner_normals, axis=-1) > 0.5) & (np.linalg.norm(centre_normals, axis=-1) > 0.5)
+            split |= np.any(valid & (dots < cos_tolerance), axis=1)
+
+        leaves.append(cells[~split])
+
+        parents = cells[split]
+        half = parents[:, 2] // 2
+        children = []
+
+        for di, dj in CORNER_OFFSETS:
+            children.append(np.stack([parents[:, 0] + di * half, parents[:, 1] + dj * half, half], axis=1))
+
+        cells = np.concatenate(children) if len(parents) > 0 else parents
+        depth += 1
+
+    return np.concatenate(leaves)
+
+def _triangulate(leaves):
+    # Lattice coordinates of every corner, indexed by row and column to find hanging vertices along each edge
+    vertex_ids = {}
+    rows = {}
+    columns = {}
+
+    def vertex(i, j):
+        if (i, j) not in vertex_ids:
+            vertex_ids[(i, j)] = len(vertex_ids)
+
+        return vertex_ids[(i, j)]
+
+    for i, j, size in leaves.tolist():
+        for di, dj in CORNER_OFFSETS.tolist():
+            ci, cj = i + di * size, j + dj * size
+            vertex(ci, cj)
+            rows.setdefault(cj, set()).add(ci)
+            columns.setdefault(ci, set()).add(cj)
+
+    rows = {j: sorted(values) for j, values in rows.items()}
+    columns = {i: sorted(values) for i, values in columns.items()}
+
+    def between(values, start, end):
+        return values[bisect_left(values, start):bisect_right(values, end)]
+
+    triangles = []
+
+    for i, j, size in leaves.tolist():
+        # Walk the boundary in the same order as the corners of grid_faces, dropping the repeated corners
+        loop = [(x, j) for x in between(rows[j], i, i + size)][:-1]
+        loop += [(i + size, y) for y in between(columns[i + size], j, j + size)][:-1]
+        loop += [(x, j + size) for x in between(rows[j + size], i, i + size)[::-1]][:-1]
+        loop += [(i, y) for y in between(columns[i], j, j + size)[::-1]][:-1]
+
+        ids = [vertex(x, y) for x, y in loop]
+
+        if len(ids) == 4:
+            a, b, c, d = ids
+            triangles.append((a, b, c))
+            triangles.append((a, c, d))
+            continue
+
+        centre = vertex(i + size // 2, j + size // 2)
+
+        for k in range(len(ids)):
+            triangles.append((centre, ids[k], ids[(k + 1) % len(ids)]))
+
+    lattice_coords = np.array(list(vertex_ids.keys()), dtype=np.int64).reshape(-1, 2)
+    return lattice_coords, np.array(triangles, dtype=np.uint32).reshape(-1, 3)
+
+def _adaptive_mesh(evaluate, u_range, v_range, chord_tolerance, normal_tolerance, max_depth, min_depth):
+    assert 0 <= min_depth <= max_depth, f"Expected 0 <= min_depth <= max_depth, received {min_depth} and {max_depth}"
+
+    # One extra level so the centre of the smallest cell is still a lattice point
+    lattice = 1 << (max_depth + 1)
+
+    def to_parameters(coords):
+        fractions = coords / lattice
+        return u_range[0] + (u_range[1] - u_range[0]) * fractions[:, 0], v_range[0] + (v_range[1] - v_range[0]) * fractions[:, 1]
+
+    leaves = _refine(evaluate, to_parameters, lattice, chord_tolerance, normal_tolerance, max_depth, min_depth)
+    lattice_coords, indices = _triangulate(leaves)
+    positions, normals = evaluate(*to_parameters(lattice_coords))
+
+    return {
+        "positions": np.ascontiguousarray(positions, dtype=np.float32),
+        "normals": np.ascontiguousarray(normals, dtype=np.float32),
+        "uvs": np.ascontiguousarray(lattice_coords / lattice, dtype=np.float32),
+        "indices": indices
+    }
+
+def adaptive_bspline_mesh(control_points, U, V, p, q, chord_tolerance=1e-3, normal_tolerance=None, max_depth=8, min_depth=2):
+    control_points = np.asarray(control_points, dtype=np.float64)
+
+    def evaluate(us, vs):
+        S, S_u, S_v = evaluate_surface_points(U, V, p, q, control_points, us, vs, derivatives=True)
+        return S, normalise_vectors(np.cross(S_u, S_v))
+
+    return _adaptive_mesh(evaluate, (U[p], U[-p - 1]), (V[q], V[-q - 1]), chord_tolerance, normal_tolerance, max_depth, min_depth)
+
+def adaptive_nurbs_mesh(control_points, U, V, p, q, chord_tolerance=1e-3, normal_tolerance=None, max_depth=8, min_depth=2):
+    # control_points are [x, y, z, w]
+    control_points = np.asarray(control_points, dtype=np.float64)
+
+    def evaluate(us, vs):
+        derivatives = nurbs_surface_point_derivatives(control_points, U, V, p, q, us, vs, order=1)
+        return derivatives["S"], normalise_vectors(np.cross(derivatives["S_u"], derivatives["S_v"]))
+
+    return _adaptive_mesh(evaluate, (U[p], U[-p - 1]), (V[q], V[-q - 1]), chord_tolerance, normal_tolerance, max_depth, min_depth)
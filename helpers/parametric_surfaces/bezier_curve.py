@@ -4,7 +4,8 @@ from typing import List
 
 import matplotlib.pyplot as plt
 import numpy as np
-from vector import Vector2
+from curve_evaluation import bezier_curve_points
+from vector import Vector2, VectorArray
 
 def create_linear_bezier_curve(p_0: Vector2, p_1: Vector2):
     return lambda t: p_0 + (p_1 - p_0).scale(t)
@@ -27,19 +28,9 @@ def create_bezier_curve(ps: List[Vector2]):
             assert 1==0, "Invalid number of points"
 
 def plot_curve(control_points, points=50, show=True, color="blue"):
-    B = create_bezier_curve(control_points)
-    assert B is not None
-    ts = np.linspace(0, 1, points)
-
-    xs = []
-    ys = []
-
-    for t in ts:
-        point = B(t)
-        xs.append(point.x)
-        ys.append(point.y)
-
-    plt.scatter(xs, ys, color=color)
+    # Any number of control points, see curve_evaluation.py
+    curve = VectorArray(bezier_curve_points(control_points, np.linspace(0, 1, points)))
+    plt.scatter(curve.x, curve.y, color=color)
 
     bxs = []
     bys = []
@@ -53,5 +44,6 @@ def plot_curve(control_points, points=50, show=True, color="blue"):
     if show:
         plt.show()
         
-plot_curve([Vector2(0, 0), Vector2(0.3, 0.2), Vector2(0.7, 1.2), Vector2(1, 0.7)], show=False)
-plot_curve([Vector2(1, 0.7), Vector2(1.3, 0.2), Vector2(1.7, -0.1), Vector2(2, 0)], color="green")
\ No newline at end of file
+if __name__ == "__main__":
+    plot_curve([Vector2(0, 0), Vector2(0.3, 0.2), Vector2(0.7, 1.2), Vector2(1, 0.7)], show=False)
+    plot_curve([Vector2(1, 0.7), Vector2(1.3, 0.2), Vector2(1.7, -0.1), Vector2(2, 0)], color="green")
\ No newline at end of file
@@ -1,8 +1,9 @@
 ## This code was used for experimentation - see code/src/utils/parametric_surfaces.ts for the final implementation
 
 import numpy as np
-import math
 import matplotlib.pyplot as plt
+from collections import OrderedDict
+from functools import lru_cache
 
 """
 Closely followed: https://pages.mtu.edu/~shene/COURSES/cs3621/NOTES/spline/B-spline/bspline-basis.html
@@ -12,6 +13,11 @@ More complex than Bezier:
 """
 
 def bspline_basis(i, p, U):
+    # Scalar N_{i,p}, kept for plotting single basis functions
+    # The recursion is memoized per (i, p, u) so the shared lower degree terms are only evaluated once
+    U = tuple(U)
+
+    @lru_cache(maxsize=None)
     def basis(i, p, u):
         if p == 0:
             if U[i] <= u < U[i + 1]:
@@ -19,18 +25,200 @@ def bspline_basis(i, p, U):
             
             return 0
 
-        left = ((u - U[i]) / (U[i + p] - U[i])) * bspline_basis(i, p - 1, U)(u) if U[i + p] - U[i] != 0 else 0
-        right = ((U[i + p + 1] - u) / (U[i + p + 1] - U[i + 1])) * bspline_basis(i + 1, p - 1, U)(u) if U[i + p + 1] - U[i + 1] != 0 else 0
+        left = ((u - U[i]) / (U[i + p] - U[i])) * basis(i, p - 1, u) if U[i + p] - U[i] != 0 else 0
+        right = ((U[i + p + 1] - u) / (U[i + p + 1] - U[i + 1])) * basis(i + 1, p - 1, u) if U[i + p + 1] - U[i + 1] != 0 else 0
 
         return left + right
     
     return lambda u: basis(i, p, u)
 
-def validate_knot_vector(m, U, u_0=0, u_m=1):
+def find_spans(p, U, us):
+    # Index of the knot span [U[span], U[span + 1]) holding each parameter
+    # Spans are clamped to [p, n] (n + 1 basis functions) and u = U[n + 1], the end of the domain,
+    # falls in the last non-empty span so it evaluates like the rest of the domain
+    U = np.asarray(U, dtype=np.float64)
+    n = len(U) - p - 2
+    last = np.searchsorted(U, U[n + 1], side="left") - 1
+
+    spans = np.searchsorted(U, np.asarray(us, dtype=np.float64), side="right") - 1
+    return np.clip(spans, p, max(last, p))
+
+def evaluate_basis(p, U, us):
+    """
+    Evaluates every non-zero basis function for a whole array of parameters at once
+    Returns (N, spans) where N[k, r] = N_{spans[k] - p + r, p}(us[k]), i.e. a (samples x (p + 1)) sparse form
+    of the full basis matrix, built with the Cox-de Boor triangle (The NURBS Book, A2.2) on every row together
+    Parameters are expected in the valid domain [U[p], U[n + 1]]
+    """
+
+    U = np.asarray(U, dtype=np.float64)
+    us = np.atleast_1d(np.asarray(us, dtype=np.float64))
+    spans = find_spans(p, U, us)
+
+    N = np.zeros((len(us), p + 1))
+    N[:, 0] = 1
+    left = np.zeros((len(us), p + 1))
+    right = np.zeros((len(us), p + 1))
+
+    for j in range(1, p + 1):
+        left[:, j] = us - U[spans + 1 - j]
+        right[:, j] = U[spans + j] - us
+        saved = np.zeros(len(us))
+
+        for r in range(j):
+            temp = N[:, r] / (right[:, r + 1] + left[:, j - r])
+            N[:, r] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+
+        N[:, j] = saved
+
+    return N, spans
+
+def basis_matrix(p, U, us):
+    # Dense (samples x n + 1) matrix of every basis function, scattered from evaluate_basis
+    N, spans = evaluate_basis(p, U, us)
+    dense = np.zeros((len(N), len(U) - p - 1))
+    columns = spans[:, None] - p + np.arange(p + 1)
+
+    dense[np.arange(len(N))[:, None], columns] = N
+    return dense
+
+def evaluate_basis_derivatives(p, U, us, order):
+    """
+    Batched form of The NURBS Book A2.3
+    Returns (ders, spans) where ders[k, d, r] is the d-th derivative of N_{spans[k] - p + r, p} at us[k] for d = 0..order
+    Derivatives above the degree are zero
+    """
+
+    U = np.asarray(U, dtype=np.float64)
+    us = np.atleast_1d(np.asarray(us, dtype=np.float64))
+    spans = find_spans(p, U, us)
+    count = len(us)
+
+    # Upper triangle holds the basis functions of every degree, lower triangle the knot differences
+    ndu = np.zeros((count, p + 1, p + 1))
+    ndu[:, 0, 0] = 1
+    left = np.zeros((count, p + 1))
+    right = np.zeros((count, p + 1))
+
+    for j in range(1, p + 1):
+        left[:, j] = us - U[spans + 1 - j]
+        right[:, j] = U[spans + j] - us
+        saved = np.zeros(count)
+
+        for r in range(j):
+            ndu[:, j, r] = right[:, r + 1] + left[:, j - r]
+            temp = ndu[:, r, j - 1] / ndu[:, j, r]
+            ndu[:, r, j] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+
+        ndu[:, j, j] = saved
+
+    ders = np.zeros((count, order + 1, p + 1))
+    ders[:, 0, :] = ndu[:, :, p]
+
+    for r in range(p + 1):
+        # a alternates between two rows holding the coefficients of the previous and current derivative
+        a = np.zeros((count, 2, p + 1))
+        a[:, 0, 0] = 1
+        s1, s2 = 0, 1
+
+        for k in range(1, min(order, p) + 1):
+            d = np.zeros(count)
+            rk = r - k
+            pk = p - k
+
+            if r >= k:
+                a[:, s2, 0] = a[:, s1, 0] / ndu[:, pk + 1, rk]
+                d = a[:, s2, 0] * ndu[:, rk, pk]
+
+            j1 = 1 if rk >= -1 else -rk
+            j2 = k - 1 if r - 1 <= pk else p - r
+
+            for j in range(j1, j2 + 1):
+                a[:, s2, j] = (a[:, s1, j] - a[:, s1, j - 1]) / ndu[:, pk + 1, rk + j]
+                d += a[:, s2, j] * ndu[:, rk + j, pk]
+
+            if r <= pk:
+                a[:, s2, k] = -a[:, s1, k - 1] / ndu[:, pk + 1, r]
+                d += a[:, s2, k] * ndu[:, r, pk]
+
+            ders[:, k, r] = d
+            s1, s2 = s2, s1
+
+    factor = p
+
+    for k in range(1, min(order, p) + 1):
+        ders[:, k, :] *= factor
+        factor *= p - k
+
+    return ders, spans
+
+def basis_derivative_matrices(p, U, us, order):
+    # Dense (order + 1, samples, n + 1) stack, entry d is the d-th derivative of basis_matrix
+    ders, spans = evaluate_basis_derivatives(p, U, us, order)
+    dense = np.zeros((order + 1, len(ders), len(U) - p - 1))
+    columns = spans[:, None] - p + np.arange(p + 1)
+
+    for d in range(order + 1):
+        dense[d][np.arange(len(ders))[:, None], columns] = ders[:, d, :]
+
+    return dense
+
+# Upper bound on the bytes held by the basis cache, the least recently used stacks are dropped beyond it
+BASIS_CACHE_BYTES = 64 * 1024 * 1024
+
+# (p, knots, parameter bytes) -> read only stack of the highest order requested so far, in least recently used order
+_basis_cache = OrderedDict()
+_basis_cache_bytes = 0
+
+def cached_basis_derivative_matrices(p, U, us, order=0):
+    # basis_derivative_matrices memoized on (p, U, us) so tessellation and derivative evaluation
+    # of the same samples share one stack, the returned array is read only
+    # Only the requested order is computed, a later request for a higher order replaces the entry
+    global _basis_cache_bytes
+
+    us = np.ascontiguousarray(np.atleast_1d(us), dtype=np.float64)
+    key = (int(p), tuple(float(u) for u in U), us.tobytes())
+    dense = _basis_cache.get(key)
+
+    if dense is not None and len(dense) > order:
+        _basis_cache.move_to_end(key)
+        return dense[:order + 1]
+
+    dense = basis_derivative_matrices(p, U, us, order)
+    dense.flags.writeable = False
+
+    if key in _basis_cache:
+        _basis_cache_bytes -= _basis_cache.pop(key).nbytes
+
+    _basis_cache[key] = dense
+    _basis_cache_bytes += dense.nbytes
+
+    # The newest stack is kept even when it alone is over the bound, it is dropped by the next insertion
+    while _basis_cache_bytes > BASIS_CACHE_BYTES and len(_basis_cache) > 1:
+        _basis_cache_bytes -= _basis_cache.popitem(last=False)[1].nbytes
+
+    return dense
+
+def clear_basis_cache():
+    # Drops every cached stack, used by the benchmarks to time tessellation without earlier results
+    global _basis_cache_bytes
+
+    _basis_cache.clear()
+    _basis_cache_bytes = 0
+
+def bezier_knots(n):
+    # A degree n Bezier is a B-spline with n + 1 repeated knots at each end, its basis is the Bernstein basis
+    return [0] * (n + 1) + [1] * (n + 1)
+
+def validate_knot_vector(m, U, u_0=0, u_m=1, p=None):
+    # m + 1 knots in [u_0, u_m] that never decrease, given the degree p no interior knot may repeat more than p times
     if len(U) != m + 1:
         return False
     
     last = None
+    multiplicity = 0
 
     for u in U:
         if u < u_0 or u > u_m:
@@ -39,8 +227,13 @@ def validate_knot_vector(m, U, u_0=0, u_m=1):
         if last is not None:
             if u < last:
                 return False
+
+        multiplicity = multiplicity + 1 if u == last else 1
+
+        if p is not None and multiplicity > p and U[0] < u < U[-1]:
+            return False
         
-        last = U
+        last = u
     
     return True
 
@@ -1,6 +1,7 @@
 ## This code was used for experimentation - see code/src/utils/parametric_surfaces.ts for the final implementation
 
-from vector import Vector2
+from curve_evaluation import uniform_bspline_curve_points
+from vector import Vector2, VectorArray
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -10,20 +11,9 @@ def create_cubic_bspline_curve(p_0: Vector2, p_1: Vector2, p_2: Vector2, p_3: Ve
 
 def plot_curve(control_points, points=50):
     for i in range(len(control_points) - 3):
-        cps = control_points[i:i+4]
-        B = create_cubic_bspline_curve(*cps)
-        assert B is not None
-        ts = np.linspace(0, 1, points)
-
-        xs = []
-        ys = []
-
-        for t in ts:
-            point = B(t)
-            xs.append(point.x)
-            ys.append(point.y)
-
-        plt.scatter(xs, ys, color="blue")
+        # Segment i of the uniform cubic, see curve_evaluation.py
+        curve = VectorArray(uniform_bspline_curve_points(control_points, 3 + i + np.linspace(0, 1, points)))
+        plt.scatter(curve.x, curve.y, color="blue")
 
         bxs = []
         bys = []
@@ -42,4 +32,5 @@ def plot_curve(control_points, points=50):
     plt.gca().set_aspect('equal', adjustable='box')
     plt.show()
 
-plot_curve([Vector2(0, 0), Vector2(0.3, 1.1), Vector2(0.7, 0.6), Vector2(1, 0)])#, Vector2(4, 2), Vector2(3, 4), Vector2(5, 3)])
\ No newline at end of file
+if __name__ == "__main__":
+    plot_curve([Vector2(0, 0), Vector2(0.3, 1.1), Vector2(0.7, 0.6), Vector2(1, 0)])#, Vector2(4, 2), Vector2(3, 4), Vector2(5, 3)])
\ No newline at end of file
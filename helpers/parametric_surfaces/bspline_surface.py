@@ -1,46 +1,50 @@
 ## This code was used for experimentation - see code/src/utils/parametric_surfaces.ts for the final implementation
 
 import numpy as np
-import math
 import matplotlib.pyplot as plt
-from bspline_basis import bspline_basis
+from bspline_basis import evaluate_basis
+from derivatives import bspline_surface_point_derivatives
+from tessellation import tessellate_bspline
 from matplotlib import cm
 
 """
 Closely followed: https://pages.mtu.edu/~shene/COURSES/cs3621/NOTES/surface/bspline-construct.html
 """
 
+def evaluate_surface_grid(U, V, p, q, points, us, vs):
+    # Evaluates the surface at every (u, v) pair of the grid us x vs in one pass
+    # Each sample only gathers the (p + 1) x (q + 1) control points under its knot spans
+    points = np.asarray(points, dtype=np.float64)
+    Nu, u_spans = evaluate_basis(p, U, us)
+    Nv, v_spans = evaluate_basis(q, V, vs)
+
+    rows = u_spans[:, None] - p + np.arange(p + 1)
+    columns = v_spans[:, None] - q + np.arange(q + 1)
+    local_points = points[rows[:, None, :, None], columns[None, :, None, :]]
+
+    return np.einsum("ia,jb,ijabd->ijd", Nu, Nv, local_points)
+
+def evaluate_surface_points(U, V, p, q, points, us, vs, derivatives=False):
+    # Evaluates the surface at the (us[k], vs[k]) pairs rather than a grid
+    # With derivatives the first partials are returned too as (S, S_u, S_v)
+    evaluated = bspline_surface_point_derivatives(points, U, V, p, q, us, vs, order=1 if derivatives else 0)
+
+    if not derivatives:
+        return evaluated["S"]
+
+    return evaluated["S"], evaluated["S_u"], evaluated["S_v"]
+
 def get_surface_func(m, n, U, V, p, q, points):
+    points = np.asarray(points, dtype=np.float64)[:m, :n]
+
     def S(u, v):
-        point = [0, 0, 0]
-
-        for i in range(m):
-            for j in range(n):
-                x, y, z = points[i][j]
-                scale = bspline_basis(i, p, U)(u) * bspline_basis(j, q, V)(v)
-                point[0] += x * scale
-                point[1] += y * scale
-                point[2] += z * scale
-        
-        return point
+        return evaluate_surface_grid(U, V, p, q, points, [u], [v])[0, 0].tolist()
 
     return S
 
 def generate_bspline_surface(m, n, U, V, p, q, control_points, samples):
-    steps = np.linspace(0, 1, samples)
-    points = []
-    S = get_surface_func(m, n, U, V, p, q, control_points)
-
-    for u in steps:
-        fixed_u_points = []
-
-        for v in steps:
-            point = S(u, v)
-            fixed_u_points.append(point)
-        
-        points.append(fixed_u_points)
-    
-    return np.array(points)
+    control_points = np.asarray(control_points, dtype=np.float64)[:m, :n]
+    return tessellate_bspline(control_points, U, V, p, q, samples)
 
 def plot_surface(surface_points):
     fig = plt.figure()
@@ -0,0 +1,95 @@
+## Array based replacement for the per-t lambdas of bezier_curve.py and bspline_curve.py
+
+import numpy as np
+from derivatives import as_point_array, bezier_curve_point_derivatives, bspline_curve_point_derivatives, uniform_knots
+
+"""
+Vectorised curve evaluation and arc length reparameterisation
+The evaluators take an array of t values and return an (N, d) array of points (d = 2 or 3), any degree is accepted
+Bezier curves use the Bernstein basis (a B-spline on bezier_knots), B-splines the sparse basis of bspline_basis.py
+so only the p + 1 control points under each t are touched
+
+ArcLengthTable integrates the speed |C'(t)| once over a fixed set of segments with Gauss-Legendre quadrature
+Inverse lookups (arc length -> t) find the segment with a binary search and solve the cubic Hermite interpolant
+of the arc length inside it with a few Newton steps, the speeds at the segment ends are its slopes
+"""
+
+# Gauss-Legendre nodes and weights on [0, 1] used per segment
+QUADRATURE_NODES, QUADRATURE_WEIGHTS = np.polynomial.legendre.leggauss(5)
+QUADRATURE_NODES = (QUADRATURE_NODES + 1) / 2
+QUADRATURE_WEIGHTS = QUADRATURE_WEIGHTS / 2
+
+def bezier_curve_points(control_points, ts):
+    return bezier_curve_point_derivatives(control_points, ts, order=0)["C"]
+
+def bspline_curve_points(control_points, U, p, ts):
+    # ts are in the domain [U[p], U[-p - 1]]
+    return bspline_curve_point_derivatives(control_points, U, p, ts, order=0)["C"]
+
+def uniform_bspline_curve_points(control_points, ts, p=3):
+    # The uniform B-spline of bspline_curve.py, segment i covers ts in [p + i, p + i + 1] and the domain is [p, len(control_points)]
+    control_points = as_point_array(control_points)
+    return bspline_curve_points(control_points, uniform_knots(len(control_points), p), p, ts)
+
+class ArcLengthTable:
+    def __init__(self, derivatives, t_start, t_end, segments=256):
+        # derivatives(ts, order) returns the C / C_t dictionary of derivatives.py for an array of t
+        assert segments > 0, f"Expected at least one segment, received {segments}"
+        self.derivatives = derivatives
+        self.ts = np.linspace(t_start, t_end, segments + 1)
+        self.speeds = self._speeds(self.ts)
+
+        # Arc length of every segment, accumulated into the length at each table parameter
+        widths = np.diff(self.ts)
+        nodes = self.ts[:-1, None] + widths[:, None] * QUADRATURE_NODES
+        segment_lengths = widths * (self._speeds(nodes.ravel()).reshape(nodes.shape) @ QUADRATURE_WEIGHTS)
+        self.lengths = np.concatenate([[0], np.cumsum(segment_lengths)])
+
+    @classmethod
+    def from_bezier(cls, control_points, segments=256):
+        control_points = as_point_array(control_points)
+        return cls(lambda ts, order: bezier_curve_point_derivatives(control_points, ts, order), 0, 1, segments)
+
+    @classmethod
+    def from_bspline(cls, control_points, U, p, segments=256):
+        control_points = as_point_array(control_points)
+        return cls(lambda ts, order: bspline_curve_point_derivatives(control_points, U, p, ts, order), U[p], U[-p - 1], segments)
+
+    @classmethod
+    def from_uniform_bspline(cls, control_points, p=3, segments=256):
+        control_points = as_point_array(control_points)
+        return cls.from_bspline(control_points, uniform_knots(len(control_points), p), p, segments)
+
+    @property
+    def length(self):
+        return self.lengths[-1]
+
+    def _speeds(self, ts):
+        return np.linalg.norm(self.derivatives(ts, 1)["C_t"], axis=1)
+
+    def parameters_at(self, distances, iterations=4):
+        # Curve parameter t at each arc length, distances outside [0, length] are clamped to the ends
+        distances = np.clip(np.asarray(distances, dtype=np.float64), 0, self.length)
+        k = np.clip(np.searchsorted(self.lengths, distances, side="right") - 1, 0, len(self.ts) - 2)
+
+        width = self.ts[k + 1] - self.ts[k]
+        s_0, s_1 = self.lengths[k], self.lengths[k + 1]
+        m_0, m_1 = self.speeds[k] * width, self.speeds[k + 1] * width
+
+        # Newton on the Hermite arc length s(x) = target for x in [0, 1], starting from linear interpolation
+        x = np.where(s_1 > s_0, (distances - s_0) / np.where(s_1 > s_0, s_1 - s_0, 1), 0)
+
+        for _ in range(iterations):
+            x2, x3 = x * x, x * x * x
+            s = (2 * x3 - 3 * x2 + 1) * s_0 + (x3 - 2 * x2 + x) * m_0 + (-2 * x3 + 3 * x2) * s_1 + (x3 - x2) * m_1
+            slope = (6 * x2 - 6 * x) * s_0 + (3 * x2 - 4 * x + 1) * m_0 + (-6 * x2 + 6 * x) * s_1 + (3 * x2 - 2 * x) * m_1
+            x = np.clip(x - (s - distances) / np.where(slope > 1e-300, slope, np.inf), 0, 1)
+
+        return self.ts[k] + x * width
+
+    def uniform_parameters(self, count):
+        # count parameters spaced evenly by arc length, end points included
+        return self.parameters_at(np.linspace(0, self.length, count))
+
+    def uniform_points(self, count):
+        return self.derivatives(self.uniform_parameters(count), 0)["C"]
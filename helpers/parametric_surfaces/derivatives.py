@@ -0,0 +1,144 @@
+## Analytic derivatives of the surfaces and curves, used for normals and tangents instead of finite differences
+
+import numpy as np
+from bspline_basis import bezier_knots, cached_basis_derivative_matrices, evaluate_basis_derivatives
+from tessellation import sample_parameters, tensor_product_grid, to_homogeneous
+
+"""
+Batched first and second derivatives of Bezier, B-spline and NURBS surfaces and of Bezier and B-spline curves
+Surfaces return a dictionary with S, S_u, S_v (order >= 1) and S_uu, S_uv, S_vv (order 2),
+curves return C, C_t (order >= 1) and C_tt (order 2)
+
+Grid functions take sample counts or parameter arrays like tessellation.py and reuse its cached basis matrices
+(cached_basis_derivative_matrices) so a tessellation and its derivatives share one evaluation of the basis
+Point functions evaluate scattered (u, v) pairs or t values through the sparse (samples x (p + 1)) basis form
+NURBS derivatives are taken in homogeneous coordinates and converted with the quotient rule (The NURBS Book, A4.4)
+"""
+
+MAXIMUM_ORDER = 2
+
+# (u order, v order) of each surface key
+SURFACE_DERIVATIVE_KEYS = {
+    "S": (0, 0),
+    "S_u": (1, 0),
+    "S_v": (0, 1),
+    "S_uu": (2, 0),
+    "S_uv": (1, 1),
+    "S_vv": (0, 2)
+}
+
+CURVE_DERIVATIVE_KEYS = ["C", "C_t", "C_tt"]
+
+def _check_order(order):
+    assert 0 <= order <= MAXIMUM_ORDER, f"Derivatives are available up to order {MAXIMUM_ORDER}, received {order}"
+
+def as_point_array(control_points):
+    # Also accepts the Vector2 / Vector3 lists used by the curve experiments, a VectorArray converts without copying
+    if hasattr(control_points, "__array__"):
+        return np.asarray(control_points, dtype=np.float64)
+
+    control_points = list(control_points)
+
+    if len(control_points) > 0 and hasattr(control_points[0], "x"):
+        return np.array([[point.x, point.y] + ([point.z] if hasattr(point, "z") else []) for point in control_points], dtype=np.float64)
+
+    return np.asarray(control_points, dtype=np.float64)
+
+def rational_surface_derivatives(homogeneous):
+    # Quotient rule for S = A / w given the derivatives of the homogeneous surface [A, w]
+    A = {key: value[..., :-1] for key, value in homogeneous.items()}
+    w = {key: value[..., -1:] for key, value in homogeneous.items()}
+
+    S = A["S"] / w["S"]
+    derivatives = {"S": S}
+
+    if "S_u" in homogeneous:
+        derivatives["S_u"] = (A["S_u"] - w["S_u"] * S) / w["S"]
+        derivatives["S_v"] = (A["S_v"] - w["S_v"] * S) / w["S"]
+
+    if "S_uu" in homogeneous:
+        derivatives["S_uu"] = (A["S_uu"] - 2 * w["S_u"] * derivatives["S_u"] - w["S_uu"] * S) / w["S"]
+        derivatives["S_vv"] = (A["S_vv"] - 2 * w["S_v"] * derivatives["S_v"] - w["S_vv"] * S) / w["S"]
+        derivatives["S_uv"] = (A["S_uv"] - w["S_u"] * derivatives["S_v"] - w["S_v"] * derivatives["S_u"] - w["S_uv"] * S) / w["S"]
+
+    return derivatives
+
+def _grid_derivatives(Bu, control_points, Bv, order):
+    return {key: tensor_product_grid(Bu[i], control_points, Bv[j]) for key, (i, j) in SURFACE_DERIVATIVE_KEYS.items() if i + j <= order}
+
+def bspline_surface_derivatives(control_points, U, V, p, q, u_samples, v_samples=None, order=2):
+    _check_order(order)
+    us = sample_parameters(u_samples, U[p], U[-p - 1])
+    vs = sample_parameters(u_samples if v_samples is None else v_samples, V[q], V[-q - 1])
+
+    Bu = cached_basis_derivative_matrices(p, U, us, order)
+    Bv = cached_basis_derivative_matrices(q, V, vs, order)
+
+    return _grid_derivatives(Bu, np.asarray(control_points, dtype=np.float64), Bv, order)
+
+def bezier_surface_derivatives(control_points, u_samples, v_samples=None, order=2):
+    control_points = np.asarray(control_points, dtype=np.float64)
+    m, n = control_points.shape[:2]
+
+    return bspline_surface_derivatives(control_points, bezier_knots(m - 1), bezier_knots(n - 1), m - 1, n - 1, u_samples, v_samples, order)
+
+def nurbs_surface_derivatives(control_points, U, V, p, q, u_samples, v_samples=None, order=2):
+    # control_points are [x, y, z, w]
+    homogeneous = bspline_surface_derivatives(to_homogeneous(control_points), U, V, p, q, u_samples, v_samples, order)
+    return rational_surface_derivatives(homogeneous)
+
+def bspline_surface_point_derivatives(control_points, U, V, p, q, us, vs, order=2):
+    # Derivatives at the (us[k], vs[k]) pairs, only the (p + 1) x (q + 1) control points under each pair are gathered
+    _check_order(order)
+    control_points = np.asarray(control_points, dtype=np.float64)
+    Nu, u_spans = evaluate_basis_derivatives(p, U, us, order)
+    Nv, v_spans = evaluate_basis_derivatives(q, V, vs, order)
+
+    rows = u_spans[:, None] - p + np.arange(p + 1)
+    columns = v_spans[:, None] - q + np.arange(q + 1)
+    local_points = control_points[rows[:, :, None], columns[:, None, :]]
+
+    return {key: np.einsum("ka,kb,kabd->kd", Nu[:, i], Nv[:, j], local_points) for key, (i, j) in SURFACE_DERIVATIVE_KEYS.items() if i + j <= order}
+
+def bezier_surface_point_derivatives(control_points, us, vs, order=2):
+    control_points = np.asarray(control_points, dtype=np.float64)
+    m, n = control_points.shape[:2]
+
+    return bspline_surface_point_derivatives(control_points, bezier_knots(m - 1), bezier_knots(n - 1), m - 1, n - 1, us, vs, order)
+
+def nurbs_surface_point_derivatives(control_points, U, V, p, q, us, vs, order=2):
+    homogeneous = bspline_surface_point_derivatives(to_homogeneous(control_points), U, V, p, q, us, vs, order)
+    return rational_surface_derivatives(homogeneous)
+
+def bspline_curve_derivatives(control_points, U, p, t_samples, order=2):
+    _check_order(order)
+    control_points = as_point_array(control_points)
+    ts = sample_parameters(t_samples, U[p], U[-p - 1])
+    B = cached_basis_derivative_matrices(p, U, ts, order)
+
+    return {key: B[k] @ control_points for k, key in enumerate(CURVE_DERIVATIVE_KEYS[:order + 1])}
+
+def bezier_curve_derivatives(control_points, t_samples, order=2):
+    control_points = as_point_array(control_points)
+    n = len(control_points) - 1
+
+    return bspline_curve_derivatives(control_points, bezier_knots(n), n, t_samples, order)
+
+def bspline_curve_point_derivatives(control_points, U, p, ts, order=2):
+    # Derivatives at scattered parameters, only the p + 1 control points under each t are gathered
+    _check_order(order)
+    control_points = as_point_array(control_points)
+    N, spans = evaluate_basis_derivatives(p, U, np.atleast_1d(np.asarray(ts, dtype=np.float64)), order)
+    local_points = control_points[spans[:, None] - p + np.arange(p + 1)]
+
+    return {key: np.einsum("ka,kad->kd", N[:, k], local_points) for k, key in enumerate(CURVE_DERIVATIVE_KEYS[:order + 1])}
+
+def bezier_curve_point_derivatives(control_points, ts, order=2):
+    control_points = as_point_array(control_points)
+    n = len(control_points) - 1
+
+    return bspline_curve_point_derivatives(control_points, bezier_knots(n), n, ts, order)
+
+def uniform_knots(count, p):
+    # Knots of the uniform B-spline drawn segment by segment in bspline_curve.py, the domain is [p, count]
+    return list(range(count + p + 1))
@@ -0,0 +1,97 @@
+## Knot refinement of the B-spline and NURBS experiments, the patches feed tessellate_bezier_patches in tessellation.py
+
+import numpy as np
+from bspline_basis import validate_knot_vector
+from tessellation import to_homogeneous
+
+"""
+Boehm knot insertion and Bezier decomposition
+Closely followed: https://pages.mtu.edu/~shene/COURSES/cs3621/NOTES/spline/B-spline/single-insertion.html
+and The NURBS Book, A5.1 and A5.6
+
+Inserting a knot adds a control point without changing the shape, inserting every interior knot until its
+multiplicity equals the degree splits a clamped B-spline into Bezier segments that share their end points
+Control point arrays may have any number of leading axes, axis picks the direction that is refined
+(0 for u, 1 for v of an (m, n, d) surface net), NURBS nets must be given in homogeneous form [wx, wy, wz, w]
+"""
+
+def _check_knots(p, U, count):
+    assert len(U) == count + p + 1, f"Expected {count + p + 1} knots for {count} control points of degree {p}, received {len(U)}"
+    assert validate_knot_vector(len(U) - 1, U, U[0], U[-1], p), f"Knots must be non-decreasing with interior multiplicity at most {p}"
+
+def insert_knot(p, U, control_points, u, times=1, axis=0):
+    # Returns (U, control_points) with u inserted times more
+    U = [float(knot) for knot in U]
+    P = np.moveaxis(np.asarray(control_points, dtype=np.float64), axis, 0)
+    _check_knots(p, U, len(P))
+    assert U[p] < u < U[len(P)], f"Can only insert knots inside the domain ({U[p]}, {U[len(P)]}), received {u}"
+
+    multiplicity = U.count(u)
+    assert multiplicity + times <= p, f"Inserting {u} {times} times would exceed multiplicity {p}"
+
+    for _ in range(times):
+        k = int(np.searchsorted(U, u, side="right")) - 1
+        s = U.count(u)
+
+        # Points before k - p and after k - s are kept, the ones in between are blended with their predecessor
+        Q = np.empty((len(P) + 1,) + P.shape[1:])
+        Q[:k - p + 1] = P[:k - p + 1]
+        Q[k - s + 1:] = P[k - s:]
+
+        for i in range(k - p + 1, k - s + 1):
+            alpha = (u - U[i]) / (U[i + p] - U[i])
+            Q[i] = (1 - alpha) * P[i - 1] + alpha * P[i]
+
+        U.insert(k + 1, float(u))
+        P = Q
+
+    return U, np.moveaxis(P, 0, axis)
+
+def refine_knots(p, U, control_points, knots, axis=0):
+    # Inserts every knot of knots (repeats allowed) in turn
+    for u in knots:
+        U, control_points = insert_knot(p, U, control_points, u, axis=axis)
+
+    return U, control_points
+
+def decompose_bezier(p, U, control_points, axis=0):
+    """
+    Splits a clamped B-spline into Bezier segments
+    Returns (segments, breakpoints) where segments has a new leading axis over the segments and p + 1 points
+    along axis, segment k covers [breakpoints[k], breakpoints[k + 1]] of the original parameter
+    """
+
+    U = [float(knot) for knot in U]
+    control_points = np.asarray(control_points, dtype=np.float64)
+    count = control_points.shape[axis]
+    _check_knots(p, U, count)
+    assert U[:p + 1] == [U[0]] * (p + 1) and U[-p - 1:] == [U[-1]] * (p + 1), "Only clamped knot vectors can be decomposed"
+
+    breakpoints = sorted(set(U))
+
+    for u in breakpoints[1:-1]:
+        missing = p - U.count(u)
+
+        if missing > 0:
+            U, control_points = insert_knot(p, U, control_points, u, times=missing, axis=axis)
+
+    P = np.moveaxis(control_points, axis, 0)
+    segments = np.stack([P[k * p:k * p + p + 1] for k in range(len(breakpoints) - 1)])
+
+    return np.moveaxis(segments, 1, axis + 1), np.array(breakpoints)
+
+def decompose_bezier_surface(control_points, U, V, p, q, rational=False):
+    """
+    Bezier patches of a B-spline ((m, n, 3) net) or NURBS ((m, n, 4) net of [x, y, z, w]) surface
+    Returns (patches, u_breakpoints, v_breakpoints), patches is (u patches, v patches, p + 1, q + 1, d)
+    Rational patches stay in homogeneous form [wx, wy, wz, w], see tessellate_bezier_patches
+    """
+
+    control_points = to_homogeneous(control_points) if rational else np.asarray(control_points, dtype=np.float64)
+
+    # Split along u first, the segment axis leads so the v split runs on axis 2 of the (u patches, p + 1, n, d) array
+    u_segments, u_breakpoints = decompose_bezier(p, U, control_points, axis=0)
+    patches, v_breakpoints = decompose_bezier(q, V, u_segments, axis=2)
+
+    # (v patches, u patches, p + 1, q + 1, d) -> (u patches, v patches, p + 1, q + 1, d)
+    return np.swapaxes(patches, 0, 1), u_breakpoints, v_breakpoints
@@ -3,8 +3,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import cm
-import math
-from bspline_basis import bspline_basis
+from bspline_surface import evaluate_surface_grid
+from tessellation import tessellate_nurbs, to_homogeneous
 
 """
 Closely followed: 
@@ -19,43 +19,16 @@ Surface plotting and general numpy changes to original are from: https://stackov
 """
 
 def generate_nurbs_surface_func(points, U, V, u_deg, v_deg):
-    m = len(points)
-    n = len(points[0])
+    weighted_points = to_homogeneous(points)
 
     def S(u, v):
-        numer = [0, 0, 0]
-        denom = 1e-8
-
-        for i in range(m):
-            for j in range(n):
-                x, y, z, w = points[i][j]
-                basis = bspline_basis(i, u_deg, U)(u) * bspline_basis(j, v_deg, V)(v)
-
-                numer[0] += w * x * basis
-                numer[1] += w * y * basis
-                numer[2] += w * z * basis
-                denom += w * basis
-        
-        return [numer[0] / denom, numer[1] / denom, numer[2] / denom]
+        homogeneous = evaluate_surface_grid(U, V, u_deg, v_deg, weighted_points, [u], [v])[0, 0]
+        return (homogeneous[:3] / homogeneous[3]).tolist()
 
     return S
 
 def generate_nurbs_surface(points, U, V, u_deg, v_deg, samples):
-    S = generate_nurbs_surface_func(points, U, V, u_deg, v_deg)
-    steps = np.linspace(0, 1, samples)
-
-    points = []
-
-    for u in steps:
-        fixed_u_points = []
-
-        for v in steps:
-            point = S(u, v)
-            fixed_u_points.append(point)
-        
-        points.append(fixed_u_points)
-    
-    return np.array(points)
+    return tessellate_nurbs(points, U, V, u_deg, v_deg, samples)
 
 def plot_surface(surface_points):
     fig = plt.figure()
@@ -64,19 +37,20 @@ def plot_surface(surface_points):
     ax.plot_surface(x, y, z, cmap=cm.gray, linewidth=1, antialiased=False) # type: ignore
     plt.show()
 
-control_points = np.array(
-    [
-        [[-2, -2, 1, 1], [-2, -1, -2, 1], [-2, 1, 2.5, 1], [-2, 2, -1, 1]],
-        [[0, -2, 0, 1], [0, -1, -1, 5], [0, 1, 1.5, 5], [0, 2, 0, 1]],
-        [[2, -2, -1, 1], [2, -1, 2, 1], [2, 1, -2.5, 1], [2, 2, 1, 1]]
-    ], float
-)
-
-u_deg = 2
-v_deg = 3
-U = [0, 0, 0, 1, 1, 1]
-V = [0, 0, 0, 0, 1, 1, 1, 1]
-samples = 100
-
-surface = generate_nurbs_surface(control_points, U, V, u_deg, v_deg, samples)
-plot_surface(surface)
\ No newline at end of file
+if __name__ == "__main__":
+    control_points = np.array(
+        [
+            [[-2, -2, 1, 1], [-2, -1, -2, 1], [-2, 1, 2.5, 1], [-2, 2, -1, 1]],
+            [[0, -2, 0, 1], [0, -1, -1, 5], [0, 1, 1.5, 5], [0, 2, 0, 1]],
+            [[2, -2, -1, 1], [2, -1, 2, 1], [2, 1, -2.5, 1], [2, 2, 1, 1]]
+        ], float
+    )
+
+    u_deg = 2
+    v_deg = 3
+    U = [0, 0, 0, 1, 1, 1]
+    V = [0, 0, 0, 0, 1, 1, 1, 1]
+    samples = 100
+
+    surface = generate_nurbs_surface(control_points, U, V, u_deg, v_deg, samples)
+    plot_surface(surface)
\ No newline at end of file
@@ -0,0 +1,138 @@
+## Offline export of the sampled surfaces, loaded in the app with loadSurfaceMesh in code/src/utils/parametric_surfaces.ts
+
+import os
+
+import numpy as np
+from derivatives import bezier_surface_derivatives, bspline_surface_derivatives, nurbs_surface_derivatives
+from tessellation import grid_faces, sample_parameters
+
+"""
+Turns a sampled surface into an indexed triangle mesh so it does not have to be tessellated at page load
+A mesh is a dictionary of contiguous arrays:
+- positions: float32 (vertices, 3), the grid from tessellation.py flattened row by row (u major)
+- normals: float32 (vertices, 3), cross(dS/du, dS/dv) from derivatives.py, normalised
+- uvs: float32 (vertices, 2), the sample parameters rescaled to [0, 1] over the domain
+- indices: uint32 (triangles, 3), two triangles per grid cell sharing the grid vertices
+
+Binary layout (little endian, every block 4 byte aligned so it can be viewed as typed arrays):
+1. Header (SURFACE_HEADER_DTYPE, 16 bytes)
+2. positions, 3. normals, 4. uvs, 5. indices
+"""
+
+SURFACE_MAGIC = b"PSM1"
+SURFACE_VERSION = 1
+
+SURFACE_HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("vertex_count", "<u4"),
+    ("index_count", "<u4")
+])
+
+def normalise_vectors(vectors):
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 1e-12)
+
+def _surface_mesh(S, S_u, S_v, us, vs):
+    positions = S.reshape(-1, 3)
+    normals = np.cross(S_u, S_v).reshape(-1, 3)
+    indices = grid_faces(len(us), len(vs))
+
+    # Degenerate points (e.g. a collapsed row of control points) have no analytic normal,
+    # fall back to the area weighted normal of the triangles around them
+    degenerate = np.linalg.norm(normals, axis=-1) <= 1e-12
+
+    if np.any(degenerate) and len(indices) > 0:
+        a, b, c = positions[indices[:, 0]], positions[indices[:, 1]], positions[indices[:, 2]]
+        face_normals = np.cross(b - a, c - a)
+        vertex_normals = np.zeros_like(positions)
+
+        for corner in range(3):
+            np.add.at(vertex_normals, indices[:, corner], face_normals)
+
+        normals[degenerate] = vertex_normals[degenerate]
+
+    u_grid, v_grid = np.meshgrid((us - us[0]) / max(us[-1] - us[0], 1e-12), (vs - vs[0]) / max(vs[-1] - vs[0], 1e-12), indexing="ij")
+
+    return {
+        "positions": np.ascontiguousarray(positions, dtype=np.float32),
+        "normals": np.ascontiguousarray(normalise_vectors(normals), dtype=np.float32),
+        "uvs": np.ascontiguousarray(np.stack([u_grid, v_grid], axis=-1).reshape(-1, 2), dtype=np.float32),
+        "indices": indices.astype(np.uint32)
+    }
+
+def _derivative_mesh(derivatives, us, vs):
+    return _surface_mesh(derivatives["S"], derivatives["S_u"], derivatives["S_v"], us, vs)
+
+def bezier_surface_mesh(control_points, u_samples, v_samples=None):
+    us = sample_parameters(u_samples)
+    vs = sample_parameters(u_samples if v_samples is None else v_samples)
+
+    return _derivative_mesh(bezier_surface_derivatives(control_points, us, vs, order=1), us, vs)
+
+def bspline_surface_mesh(control_points, U, V, p, q, u_samples, v_samples=None):
+    us = sample_parameters(u_samples, U[p], U[-p - 1])
+    vs = sample_parameters(u_samples if v_samples is None else v_samples, V[q], V[-q - 1])
+
+    return _derivative_mesh(bspline_surface_derivatives(control_points, U, V, p, q, us, vs, order=1), us, vs)
+
+def nurbs_surface_mesh(control_points, U, V, p, q, u_samples, v_samples=None):
+    # control_points are [x, y, z, w], the derivatives of S = A / w follow from the quotient rule
+    us = sample_parameters(u_samples, U[p], U[-p - 1])
+    vs = sample_parameters(u_samples if v_samples is None else v_samples, V[q], V[-q - 1])
+
+    return _derivative_mesh(nurbs_surface_derivatives(control_points, U, V, p, q, us, vs, order=1), us, vs)
+
+def write_surface_obj(file_name, mesh):
+    lines = [
+        "# Generated by surface_export.py",
+        "o surface"
+    ]
+
+    lines.extend(f"v {x} {y} {z}" for x, y, z in mesh["positions"].tolist())
+    lines.extend(f"vt {u} {v}" for u, v in mesh["uvs"].tolist())
+    lines.extend(f"vn {x} {y} {z}" for x, y, z in mesh["normals"].tolist())
+
+    # Positions, UVs and normals share one index so every corner is a/a/a (1-based)
+    lines.extend(f"f {a}/{a}/{a} {b}/{b}/{b} {c}/{c}/{c}" for a, b, c in (mesh["indices"].astype(np.int64) + 1).tolist())
+
+    with open(file_name, "w+") as fp:
+        for line in lines:
+            fp.write(f"{line}\n")
+
+def write_surface_binary(file_name, mesh):
+    header = np.zeros(1, dtype=SURFACE_HEADER_DTYPE)
+    header["magic"] = SURFACE_MAGIC
+    header["version"] = SURFACE_VERSION
+    header["vertex_count"] = len(mesh["positions"])
+    header["index_count"] = mesh["indices"].size
+
+    temporary_name = f"{file_name}.tmp"
+
+    with open(temporary_name, "wb") as fp:
+        fp.write(header.tobytes())
+        fp.write(mesh["positions"].astype("<f4").tobytes())
+        fp.write(mesh["normals"].astype("<f4").tobytes())
+        fp.write(mesh["uvs"].astype("<f4").tobytes())
+        fp.write(mesh["indices"].astype("<u4").tobytes())
+
+    os.replace(temporary_name, file_name)
+
+def read_surface_binary(file_name):
+    header = np.fromfile(file_name, dtype=SURFACE_HEADER_DTYPE, count=1)[0]
+
+    assert header["magic"] == SURFACE_MAGIC, f"{file_name} is not a surface mesh binary"
+    assert header["version"] == SURFACE_VERSION, f"Unsupported surface mesh binary version {header['version']}"
+
+    vertex_count, index_count = int(header["vertex_count"]), int(header["index_count"])
+    data = np.fromfile(file_name, dtype="<u4", offset=SURFACE_HEADER_DTYPE.itemsize)
+
+    offset = 0
+    blocks = {}
+
+    for key, width, dtype in [("positions", 3, "<f4"), ("normals", 3, "<f4"), ("uvs", 2, "<f4"), ("indices", 3, "<u4")]:
+        size = (vertex_count * width) if key != "indices" else index_count
+        blocks[key] = data[offset:offset + size].view(dtype).reshape(-1, width)
+        offset += size
+
+    return blocks
@@ -0,0 +1,376 @@
+## Inverse queries on the B-spline and NURBS experiments, used for picking and collision against the surfaces
+
+import numpy as np
+from bspline_basis import bezier_knots, evaluate_basis_derivatives
+from derivatives import SURFACE_DERIVATIVE_KEYS, rational_surface_derivatives
+from knot_insertion import decompose_bezier_surface, refine_knots
+from tessellation import tessellate_bezier_patches, to_homogeneous
+
+"""
+Batched closest point and ray intersection queries
+The surface is split once into Bezier patches (knot_insertion.py), each patch lies inside the convex hull of its
+control points so the box around them bounds the patch (for NURBS this needs positive weights)
+The boxes are arranged in a bounding volume hierarchy that is built once and reused by every query
+
+Queries walk the hierarchy for all points or rays together: each step tests every (query, node) pair at once
+and expands the survivors into their children, the (query, patch) pairs left at the leaves are then solved
+with vectorised Newton iterations started from the closest of a few precomputed samples of the patch
+"""
+
+# Samples per patch side used to start Newton and to bound the closest distance during traversal
+START_SAMPLES = 5
+
+class SurfaceBVH:
+    def __init__(self, patches, u_breakpoints, v_breakpoints, rational=False, leaf_size=4):
+        # patches from decompose_bezier_surface, use from_bspline / from_nurbs rather than calling this directly
+        self.rational = rational
+        u_patches, v_patches = patches.shape[:2]
+        self.patches = patches.reshape((-1,) + patches.shape[2:])
+        self.p, self.q = self.patches.shape[1] - 1, self.patches.shape[2] - 1
+
+        # Parameter range of each patch in the original surface
+        u_index, v_index = np.meshgrid(np.arange(u_patches), np.arange(v_patches), indexing="ij")
+        self.u_ranges = np.stack([u_breakpoints[u_index.ravel()], u_breakpoints[u_index.ravel() + 1]], axis=1)
+        self.v_ranges = np.stack([v_breakpoints[v_index.ravel()], v_breakpoints[v_index.ravel() + 1]], axis=1)
+
+        hull = self.patches[..., :3] / self.patches[..., 3:] if rational else self.patches
+        hull = hull.reshape(len(self.patches), -1, 3)
+        self.patch_min = hull.min(axis=1)
+        self.patch_max = hull.max(axis=1)
+
+        steps = np.linspace(0, 1, START_SAMPLES)
+        self.sample_parameters = np.stack(np.meshgrid(steps, steps, indexing="ij"), axis=-1).reshape(-1, 2)
+        samples = tessellate_bezier_patches(patches, steps, rational=rational)
+        self.samples = samples.reshape(len(self.patches), -1, 3)
+
+        self._build(leaf_size)
+
+    @classmethod
+    def from_bspline(cls, control_points, U, V, p, q, subdivisions=2, leaf_size=4):
+        return cls(*_decompose(control_points, U, V, p, q, subdivisions, rational=False), rational=False, leaf_size=leaf_size)
+
+    @classmethod
+    def from_nurbs(cls, control_points, U, V, p, q, subdivisions=2, leaf_size=4):
+        # control_points are [x, y, z, w] with w > 0
+        assert np.all(np.asarray(control_points)[..., 3] > 0), "The control point boxes only bound NURBS surfaces with positive weights"
+        return cls(*_decompose(control_points, U, V, p, q, subdivisions, rational=True), rational=True, leaf_size=leaf_size)
+
+    def _build(self, leaf_size):
+        # Flat arrays of nodes, a leaf points at a run of self.order, an internal node at its two children
+        self.node_min = []
+        self.node_max = []
+        self.node_children = []
+        self.node_range = []
+        self.order = np.arange(len(self.patches))
+        centres = (self.patch_min + self.patch_max) / 2
+
+        def build(start, end):
+            node = len(self.node_min)
+            members = self.order[start:end]
+            self.node_min.append(self.patch_min[members].min(axis=0))
+            self.node_max.append(self.patch_max[members].max(axis=0))
+            self.node_children.append((-1, -1))
+            self.node_range.append((start, end))
+
+            if end - start <= leaf_size:
+                return node
+
+            # Median split along the widest spread of the patch centres
+            axis = int(np.argmax(np.ptp(centres[members], axis=0)))
+            self.order[start:end] = members[np.argsort(centres[members, axis], kind="stable")]
+            middle = (start + end) // 2
+
+            left = build(start, middle)
+            right = build(middle, end)
+            self.node_children[node] = (left, right)
+
+            return node
+
+        build(0, len(self.patches))
+
+        self.node_min = np.array(self.node_min)
+        self.node_max = np.array(self.node_max)
+        self.node_children = np.array(self.node_children, dtype=np.int64)
+        self.node_range = np.array(self.node_range, dtype=np.int64)
+
+    def _leaf_pairs(self, queries, nodes):
+        # Expands (query, leaf node) pairs into (query, patch) pairs
+        counts = self.node_range[nodes, 1] - self.node_range[nodes, 0]
+        repeated_queries = np.repeat(queries, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        patches = self.order[np.repeat(self.node_range[nodes, 0], counts) + offsets]
+
+        return repeated_queries, patches
+
+    def _evaluate(self, patches, s, t, order):
+        # Derivatives in local patch parameters (s, t) in [0, 1] for one (patch, s, t) per row
+        Nu = evaluate_basis_derivatives(self.p, bezier_knots(self.p), s, order)[0]
+        Nv = evaluate_basis_derivatives(self.q, bezier_knots(self.q), t, order)[0]
+        local_points = self.patches[patches]
+
+        evaluated = {key: np.einsum("ka,kb,kabd->kd", Nu[:, i], Nv[:, j], local_points) for key, (i, j) in SURFACE_DERIVATIVE_KEYS.items() if i + j <= order}
+        return rational_surface_derivatives(evaluated) if self.rational else evaluated
+
+    def _start(self, distances):
+        # Closest precomputed sample of each patch as the Newton starting point
+        best = np.argmin(distances, axis=1)
+        return self.sample_parameters[best, 0].copy(), self.sample_parameters[best, 1].copy()
+
+    def _to_surface_parameters(self, patches, s, t):
+        u_range, v_range = self.u_ranges[patches], self.v_ranges[patches]
+        return u_range[:, 0] + s * (u_range[:, 1] - u_range[:, 0]), v_range[:, 0] + t * (v_range[:, 1] - v_range[:, 0])
+
+    def closest_points(self, points, starts=3, iterations=10, tolerance=1e-10):
+        """
+        Closest surface point to each of the (N, 3) points
+        Returns a dictionary of points, u, v and distances with one row per query
+        """
+
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        count = len(points)
+
+        # Any sample is on the surface so the nearest sample seen so far bounds the answer from above
+        upper = np.full(count, np.inf)
+        queries = np.arange(count)
+        nodes = np.zeros(count, dtype=np.int64)
+        pair_queries = []
+        pair_patches = []
+
+        while len(queries) > 0:
+            gap = np.maximum(np.maximum(self.node_min[nodes] - points[queries], points[queries] - self.node_max[nodes]), 0)
+            lower = np.linalg.norm(gap, axis=1)
+            keep = lower <= upper[queries]
+            queries, nodes = queries[keep], nodes[keep]
+
+            leaf = self.node_children[nodes, 0] < 0
+            leaf_queries, leaf_patches = self._leaf_pairs(queries[leaf], nodes[leaf])
+
+            if len(leaf_queries) > 0:
+                nearest = np.linalg.norm(self.samples[leaf_patches] - points[leaf_queries, None], axis=-1).min(axis=1)
+                np.minimum.at(upper, leaf_queries, nearest)
+                pair_queries.append(leaf_queries)
+                pair_patches.append(leaf_patches)
+
+            queries = np.concatenate([queries[~leaf], queries[~leaf]])
+            nodes = np.concatenate([self.node_children[nodes[~leaf], 0], self.node_children[nodes[~leaf], 1]])
+
+        pair_queries = np.concatenate(pair_queries)
+        pair_patches = np.concatenate(pair_patches)
+
+        # Drop patches whose box is further away than the final bound
+        gap = np.maximum(np.maximum(self.patch_min[pair_patches] - points[pair_queries], points[pair_queries] - self.patch_max[pair_patches]), 0)
+        keep = np.linalg.norm(gap, axis=1) <= upper[pair_queries]
+        pair_queries, pair_patches = pair_queries[keep], pair_patches[keep]
+
+        # Newton only finds the minimum of its own basin, start from the few nearest samples of every patch
+        sample_distances = np.linalg.norm(self.samples[pair_patches] - points[pair_queries, None], axis=-1)
+        starts = min(starts, sample_distances.shape[1])
+        best = np.argsort(sample_distances, axis=1)[:, :starts].ravel()
+        pair_queries, pair_patches = np.repeat(pair_queries, starts), np.repeat(pair_patches, starts)
+
+        targets = points[pair_queries]
+        s, t = self.sample_parameters[best, 0].copy(), self.sample_parameters[best, 1].copy()
+
+        # Only pairs that still moved in the last iteration are solved again
+        active = np.arange(len(targets))
+
+        for _ in range(iterations):
+            patches, a_s, a_t, a_targets = pair_patches[active], s[active], t[active], targets[active]
+            evaluated = self._evaluate(patches, a_s, a_t, 2)
+            difference = evaluated["S"] - a_targets
+            squared = np.einsum("kd,kd->k", difference, difference)
+            S_u, S_v = evaluated["S_u"], evaluated["S_v"]
+
+            # Newton on the squared distance, with the Gauss-Newton matrix where the Hessian is not positive definite
+            g_s = np.einsum("kd,kd->k", S_u, difference)
+            g_t = np.einsum("kd,kd->k", S_v, difference)
+            h_ss = np.einsum("kd,kd->k", S_u, S_u) + np.einsum("kd,kd->k", evaluated["S_uu"], difference)
+            h_tt = np.einsum("kd,kd->k", S_v, S_v) + np.einsum("kd,kd->k", evaluated["S_vv"], difference)
+            h_st = np.einsum("kd,kd->k", S_u, S_v) + np.einsum("kd,kd->k", evaluated["S_uv"], difference)
+
+            indefinite = (h_ss <= 0) | (h_ss * h_tt - h_st ** 2 <= 1e-14)
+            h_ss = np.where(indefinite, np.einsum("kd,kd->k", S_u, S_u), h_ss)
+            h_tt = np.where(indefinite, np.einsum("kd,kd->k", S_v, S_v), h_tt)
+            h_st = np.where(indefinite, 0, h_st)
+
+            determinant = np.maximum(h_ss * h_tt - h_st ** 2, 1e-300)
+            step_s = -(h_tt * g_s - h_st * g_t) / determinant
+            step_t = -(h_ss * g_t - h_st * g_s) / determinant
+
+            # A coordinate on the patch edge whose gradient points outwards is held there and the other one takes a 1D step
+            held_s = ((a_s <= 0) & (g_s > 0)) | ((a_s >= 1) & (g_s < 0))
+            held_t = ((a_t <= 0) & (g_t > 0)) | ((a_t >= 1) & (g_t < 0))
+            step_s = np.where(held_s, 0, np.where(held_t, -g_s / np.maximum(h_ss, 1e-300), step_s))
+            step_t = np.where(held_t, 0, np.where(held_s, -g_t / np.maximum(h_tt, 1e-300), step_t))
+
+            # Halve steps that do not reduce the distance, if Newton never does (typically at a patch edge)
+            # fall back to projected gradient steps, a pair where neither helps stays where it is
+            gradient_scale = 1 / np.maximum(h_ss + h_tt, 1e-300)
+            directions = [(step_s / 2 ** k, step_t / 2 ** k) for k in range(4)]
+            directions += [(-g_s * gradient_scale / 2 ** k, -g_t * gradient_scale / 2 ** k) for k in range(4)]
+
+            moved_s, moved_t = a_s.copy(), a_t.copy()
+            pending = np.arange(len(active))
+
+            for direction_s, direction_t in directions:
+                trial_s = np.clip(a_s[pending] + direction_s[pending], 0, 1)
+                trial_t = np.clip(a_t[pending] + direction_t[pending], 0, 1)
+                trial = self._evaluate(patches[pending], trial_s, trial_t, 0)["S"] - a_targets[pending]
+                improved = np.einsum("kd,kd->k", trial, trial) < squared[pending]
+
+                moved_s[pending[improved]], moved_t[pending[improved]] = trial_s[improved], trial_t[improved]
+                pending = pending[~improved]
+
+                if len(pending) == 0:
+                    break
+
+            s[active], t[active] = moved_s, moved_t
+            active = active[np.abs(moved_s - a_s) + np.abs(moved_t - a_t) >= tolerance]
+
+            if len(active) == 0:
+                break
+
+        surface_points = self._evaluate(pair_patches, s, t, 0)["S"]
+        distances = np.linalg.norm(surface_points - targets, axis=1)
+        u, v = self._to_surface_parameters(pair_patches, s, t)
+
+        # Keep the best pair of each query
+        order = np.lexsort((distances, pair_queries))
+        first = order[np.r_[True, pair_queries[order][1:] != pair_queries[order][:-1]]]
+
+        return {
+            "points": surface_points[first],
+            "u": u[first],
+            "v": v[first],
+            "distances": distances[first]
+        }
+
+    def intersect_rays(self, origins, directions, iterations=12, tolerance=1e-9):
+        """
+        First intersection of each ray origins[k] + t directions[k] (t >= 0) with the surface
+        Returns a dictionary of hit (bool), t, points, u and v with one row per ray, misses have t = inf
+        """
+
+        origins = np.atleast_2d(np.asarray(origins, dtype=np.float64))
+        directions = np.atleast_2d(np.asarray(directions, dtype=np.float64))
+        count = len(origins)
+        inverse = 1 / np.where(directions == 0, 1e-300, directions)
+
+        rays = np.arange(count)
+        nodes = np.zeros(count, dtype=np.int64)
+        pair_rays = []
+        pair_patches = []
+
+        while len(rays) > 0:
+            # Slab test against every (ray, node) box
+            near = (self.node_min[nodes] - origins[rays]) * inverse[rays]
+            far = (self.node_max[nodes] - origins[rays]) * inverse[rays]
+            entry = np.minimum(near, far).max(axis=1)
+            leave = np.maximum(near, far).min(axis=1)
+            keep = leave >= np.maximum(entry, 0)
+            rays, nodes = rays[keep], nodes[keep]
+
+            leaf = self.node_children[nodes, 0] < 0
+            leaf_rays, leaf_patches = self._leaf_pairs(rays[leaf], nodes[leaf])
+            pair_rays.append(leaf_rays)
+            pair_patches.append(leaf_patches)
+
+            rays = np.concatenate([rays[~leaf], rays[~leaf]])
+            nodes = np.concatenate([self.node_children[nodes[~leaf], 0], self.node_children[nodes[~leaf], 1]])
+
+        pair_rays = np.concatenate(pair_rays)
+        pair_patches = np.concatenate(pair_patches)
+
+        # The ray is the intersection of two planes through it, a hit is a root of both plane equations
+        D = directions[pair_rays] / np.linalg.norm(directions[pair_rays], axis=1, keepdims=True)
+        helper = np.where(np.abs(D[:, :1]) < 0.9, np.array([[1.0, 0, 0]]), np.array([[0, 1.0, 0]]))
+        n_1 = np.cross(D, helper)
+        n_1 /= np.linalg.norm(n_1, axis=1, keepdims=True)
+        n_2 = np.cross(D, n_1)
+        O = origins[pair_rays]
+        d_1 = np.einsum("kd,kd->k", n_1, O)
+        d_2 = np.einsum("kd,kd->k", n_2, O)
+
+        # Start from the sample closest to the line
+        offsets = self.samples[pair_patches] - O[:, None]
+        along = np.einsum("ksd,kd->ks", offsets, D)
+        s, t = self._start(np.linalg.norm(offsets - along[..., None] * D[:, None], axis=-1))
+
+        for _ in range(iterations):
+            evaluated = self._evaluate(pair_patches, s, t, 1)
+            f_1 = np.einsum("kd,kd->k", n_1, evaluated["S"]) - d_1
+            f_2 = np.einsum("kd,kd->k", n_2, evaluated["S"]) - d_2
+            a = np.einsum("kd,kd->k", n_1, evaluated["S_u"])
+            b = np.einsum("kd,kd->k", n_1, evaluated["S_v"])
+            c = np.einsum("kd,kd->k", n_2, evaluated["S_u"])
+            d = np.einsum("kd,kd->k", n_2, evaluated["S_v"])
+
+            determinant = a * d - b * c
+            determinant = np.where(np.abs(determinant) < 1e-300, 1e-300, determinant)
+            step_s = -(d * f_1 - b * f_2) / determinant
+            step_t = -(a * f_2 - c * f_1) / determinant
+
+            # Allow a little overshoot so hits on a patch edge still converge
+            s = np.clip(s + step_s, -0.05, 1.05)
+            t = np.clip(t + step_t, -0.05, 1.05)
+
+            if np.all(np.abs(step_s) + np.abs(step_t) < tolerance):
+                break
+
+        s, t = np.clip(s, 0, 1), np.clip(t, 0, 1)
+        surface_points = self._evaluate(pair_patches, s, t, 0)["S"]
+        offsets = surface_points - O
+        distance_along = np.einsum("kd,kd->k", offsets, D)
+        miss = np.linalg.norm(offsets - distance_along[:, None] * D, axis=1)
+
+        scale = np.linalg.norm(self.node_max[0] - self.node_min[0])
+        valid = (miss <= 1e-6 * max(scale, 1)) & (distance_along >= 0)
+
+        hit_t = distance_along / np.linalg.norm(directions[pair_rays], axis=1)
+        u, v = self._to_surface_parameters(pair_patches, s, t)
+
+        # Keep the nearest valid hit of each ray
+        candidates = np.flatnonzero(valid)
+        order = candidates[np.lexsort((hit_t[candidates], pair_rays[candidates]))]
+        first = order[np.r_[True, pair_rays[order][1:] != pair_rays[order][:-1]]] if len(order) > 0 else order
+        hit_rays = pair_rays[first]
+
+        results = {
+            "hit": np.zeros(count, dtype=bool),
+            "t": np.full(count, np.inf),
+            "points": np.full((count, 3), np.nan),
+            "u": np.full(count, np.nan),
+            "v": np.full(count, np.nan)
+        }
+
+        results["hit"][hit_rays] = True
+        results["t"][hit_rays] = hit_t[first]
+        results["points"][hit_rays] = surface_points[first]
+        results["u"][hit_rays] = u[first]
+        results["v"][hit_rays] = v[first]
+
+        return results
+
+def _decompose(control_points, U, V, p, q, subdivisions, rational):
+    # Splitting every knot span further gives smaller patches and tighter boxes
+    control_points = np.asarray(control_points, dtype=np.float64)
+    U = [float(knot) for knot in U]
+    V = [float(knot) for knot in V]
+
+    if subdivisions > 1:
+        if rational:
+            control_points = to_homogeneous(control_points)
+
+        breaks_u = sorted(set(U))
+        breaks_v = sorted(set(V))
+        extra_u = [a + (b - a) * k / subdivisions for a, b in zip(breaks_u[:-1], breaks_u[1:]) for k in range(1, subdivisions)]
+        extra_v = [a + (b - a) * k / subdivisions for a, b in zip(breaks_v[:-1], breaks_v[1:]) for k in range(1, subdivisions)]
+
+        U, control_points = refine_knots(p, U, control_points, extra_u, axis=0)
+        V, control_points = refine_knots(q, V, control_points, extra_v, axis=1)
+
+        if rational:
+            # Back to [x, y, z, w] for decompose_bezier_surface
+            control_points = np.concatenate([control_points[..., :3] / control_points[..., 3:], control_points[..., 3:]], axis=-1)
+
+    return decompose_bezier_surface(control_points, U, V, p, q, rational=rational)
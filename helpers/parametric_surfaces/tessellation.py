@@ -0,0 +1,87 @@
+## Shared tessellation used by the surface experiments, see code/src/utils/parametric_surfaces.ts for the viewer implementation
+
+import numpy as np
+from bspline_basis import bezier_knots, cached_basis_derivative_matrices
+
+"""
+Tensor product surfaces written as matrix products
+With Bu (u samples x m) and Bv (v samples x n) holding every basis function at every sample (cached per knot vector and samples),
+the whole grid is S = Bu @ P @ Bv.T per coordinate, so the basis is evaluated once per axis rather than once per sample pair
+NURBS surfaces are tessellated in homogeneous coordinates [wx, wy, wz, w] and divided by w at the end
+Every tessellate_* function returns a C-contiguous (u samples, v samples, 3) float64 grid,
+grid.reshape(-1, 3) is then a flat vertex array (see grid_faces for the matching triangles)
+"""
+
+def sample_parameters(samples, start=0, end=1):
+    # Accepts either a sample count or the parameters themselves
+    if np.isscalar(samples):
+        return np.linspace(start, end, int(samples))
+
+    return np.asarray(samples, dtype=np.float64)
+
+def to_homogeneous(points):
+    # [x, y, z, w] -> [wx, wy, wz, w] so the rational surface is a B-spline surface in 4D
+    points = np.asarray(points, dtype=np.float64)
+    return np.concatenate([points[..., :3] * points[..., 3:], points[..., 3:]], axis=-1)
+
+def tensor_product_grid(Bu, control_points, Bv):
+    control_points = np.asarray(control_points, dtype=np.float64)
+    grid = np.empty((len(Bu), len(Bv), control_points.shape[-1]))
+
+    for k in range(control_points.shape[-1]):
+        grid[..., k] = Bu @ control_points[..., k] @ Bv.T
+
+    return grid
+
+def tessellate_bezier(control_points, u_samples, v_samples=None):
+    control_points = np.asarray(control_points, dtype=np.float64)
+    m, n = control_points.shape[:2]
+    us = sample_parameters(u_samples)
+    vs = sample_parameters(u_samples if v_samples is None else v_samples)
+
+    # The Bezier basis is the B-spline basis of bezier_knots, so it shares the cached matrices
+    Bu = cached_basis_derivative_matrices(m - 1, bezier_knots(m - 1), us)[0]
+    Bv = cached_basis_derivative_matrices(n - 1, bezier_knots(n - 1), vs)[0]
+
+    return tensor_product_grid(Bu, control_points, Bv)
+
+def tessellate_bezier_patches(patches, u_samples, v_samples=None, rational=False):
+    # Evaluates every patch of decompose_bezier_surface (knot_insertion.py) with one pair of Bernstein matrices
+    # Returns (u patches, v patches, u samples, v samples, 3), rational patches are divided by their w component
+    patches = np.asarray(patches, dtype=np.float64)
+    p, q = patches.shape[2] - 1, patches.shape[3] - 1
+    us = sample_parameters(u_samples)
+    vs = sample_parameters(u_samples if v_samples is None else v_samples)
+
+    Bu = cached_basis_derivative_matrices(p, bezier_knots(p), us)[0]
+    Bv = cached_basis_derivative_matrices(q, bezier_knots(q), vs)[0]
+    grids = np.einsum("ia,UVabd,jb->UVijd", Bu, patches, Bv, optimize=True)
+
+    if rational:
+        return np.ascontiguousarray(grids[..., :-1] / grids[..., -1:])
+
+    return grids
+
+def tessellate_bspline(control_points, U, V, p, q, u_samples, v_samples=None):
+    us = sample_parameters(u_samples, U[p], U[-p - 1])
+    vs = sample_parameters(u_samples if v_samples is None else v_samples, V[q], V[-q - 1])
+
+    Bu = cached_basis_derivative_matrices(p, U, us)[0]
+    Bv = cached_basis_derivative_matrices(q, V, vs)[0]
+
+    return tensor_product_grid(Bu, control_points, Bv)
+
+def tessellate_nurbs(control_points, U, V, p, q, u_samples, v_samples=None):
+    # control_points are [x, y, z, w]
+    homogeneous = tessellate_bspline(to_homogeneous(control_points), U, V, p, q, u_samples, v_samples)
+    return np.ascontiguousarray(homogeneous[..., :3] / homogeneous[..., 3:])
+
+def grid_faces(u_count, v_count):
+    # Two consistently wound triangles per grid cell as 0-based indices into grid.reshape(-1, 3)
+    corners = np.arange(u_count * v_count).reshape(u_count, v_count)
+    a = corners[:-1, :-1].ravel()
+    b = corners[1:, :-1].ravel()
+    c = corners[1:, 1:].ravel()
+    d = corners[:-1, 1:].ravel()
+
+    return np.concatenate([np.stack([a, b, c], axis=1), np.stack([a, c, d], axis=1)]).astype(np.int32)
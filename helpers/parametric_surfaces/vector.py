@@ -2,37 +2,174 @@
 
 from dataclasses import dataclass
 
-@dataclass
+import numpy as np
+
+"""
+Vector2 / Vector3 are single vectors (slotted, so no per-instance dictionary), VectorArray packs N of them
+into one (N, 2) or (N, 3) float64 array and applies every operation to all rows at once
+A VectorArray exposes .x / .y / .z as column views, so code written for lists of vectors keeps working,
+and it broadcasts against a single Vector2 / Vector3 or another VectorArray of the same length
+"""
+
+@dataclass(slots=True)
 class Vector2:
     x: float
     y: float
 
     def __add__(self, p):
+        if isinstance(p, VectorArray):
+            return NotImplemented
+
         return Vector2(self.x + p.x, self.y + p.y)
 
     def __sub__(self, p):
+        if isinstance(p, VectorArray):
+            return NotImplemented
+
         return Vector2(self.x - p.x, self.y - p.y)
 
     def scale(self, p):
         return Vector2(self.x * p, self.y * p)
 
+    def dot(self, p):
+        return self.x * p.x + self.y * p.y
+
+    def cross(self, p):
+        # z component of the 3D cross product
+        return self.x * p.y - self.y * p.x
+
+    def norm(self):
+        return (self.x ** 2 + self.y ** 2) ** 0.5
+
     def __str__(self):
         return f"{(self.x, self.y)}"
 
-@dataclass
+@dataclass(slots=True)
 class Vector3:
     x: float
     y: float
     z: float
 
     def __add__(self, p):
+        if isinstance(p, VectorArray):
+            return NotImplemented
+
         return Vector3(self.x + p.x, self.y + p.y, self.z + p.z)
 
     def __sub__(self, p):
+        if isinstance(p, VectorArray):
+            return NotImplemented
+
         return Vector3(self.x - p.x, self.y - p.y, self.z - p.z)
 
     def scale(self, p):
         return Vector3(self.x * p, self.y * p, self.z * p)
 
+    def dot(self, p):
+        return self.x * p.x + self.y * p.y + self.z * p.z
+
+    def cross(self, p):
+        return Vector3(self.y * p.z - self.z * p.y, self.z * p.x - self.x * p.z, self.x * p.y - self.y * p.x)
+
+    def norm(self):
+        return (self.x ** 2 + self.y ** 2 + self.z ** 2) ** 0.5
+
+    def __str__(self):
+        return f"{(self.x, self.y, self.z)}"
+
+SCALAR_TYPES = {2: Vector2, 3: Vector3}
+
+def _coordinates(p):
+    # A Vector2 / Vector3 becomes one row that broadcasts over the array
+    if isinstance(p, VectorArray):
+        return p.data
+
+    if isinstance(p, Vector2):
+        return np.array([p.x, p.y])
+
+    if isinstance(p, Vector3):
+        return np.array([p.x, p.y, p.z])
+
+    return np.asarray(p, dtype=np.float64)
+
+class VectorArray:
+    __slots__ = ["data"]
+
+    def __init__(self, data):
+        self.data = np.atleast_2d(np.asarray(data, dtype=np.float64))
+        assert self.data.ndim == 2 and self.data.shape[1] in SCALAR_TYPES, f"Expected an (N, 2) or (N, 3) array, received shape {self.data.shape}"
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        return cls([[vector.x, vector.y] + ([vector.z] if isinstance(vector, Vector3) else []) for vector in vectors])
+
+    def to_vectors(self):
+        vector_type = SCALAR_TYPES[self.dimension]
+        return [vector_type(*row) for row in self.data.tolist()]
+
+    @property
+    def dimension(self):
+        return self.data.shape[1]
+
+    @property
+    def x(self):
+        return self.data[:, 0]
+
+    @property
+    def y(self):
+        return self.data[:, 1]
+
+    @property
+    def z(self):
+        assert self.dimension == 3, "Only 3D vectors have a z component"
+        return self.data[:, 2]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        # An integer gives back a single vector, anything else (slices, masks, index arrays) a VectorArray
+        if isinstance(index, (int, np.integer)):
+            return SCALAR_TYPES[self.dimension](*self.data[index].tolist())
+
+        return VectorArray(self.data[index])
+
+    def __iter__(self):
+        return iter(self.to_vectors())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.data if dtype is None else self.data.astype(dtype)
+
+    def __add__(self, p):
+        return VectorArray(self.data + _coordinates(p))
+
+    __radd__ = __add__
+
+    def __sub__(self, p):
+        return VectorArray(self.data - _coordinates(p))
+
+    def __rsub__(self, p):
+        return VectorArray(_coordinates(p) - self.data)
+
+    def scale(self, p):
+        # A scalar or one factor per row
+        p = np.asarray(p, dtype=np.float64)
+        return VectorArray(self.data * (p[:, None] if p.ndim == 1 else p))
+
+    def dot(self, p):
+        return np.einsum("kd,kd->k", *np.broadcast_arrays(self.data, _coordinates(p)))
+
+    def cross(self, p):
+        # z components for 2D vectors, a VectorArray for 3D ones (np.cross of 2D vectors is deprecated)
+        a, b = np.broadcast_arrays(self.data, _coordinates(p))
+
+        if self.dimension == 2:
+            return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+        return VectorArray(np.cross(a, b))
+
+    def norm(self):
+        return np.linalg.norm(self.data, axis=1)
+
     def __str__(self):
-        return f"{(self.x, self.y, self.z)}"
\ No newline at end of file
+        return str(self.data)
@@ -0,0 +1,363 @@
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from vertex_graph import VertexGraph
+
+"""
+Array-backed alternative to VertexGraph with the same public methods
+Vertices live in integer slots of a contiguous position array and faces are rows of an int32 array
+Collapsed slots go on a free-list and are reused by later midpoints so the arrays stay compact
+Vertices are still addressed by name from the outside, the name <-> slot lookups are O(1)
+The scoring, polygon and display logic is shared with VertexGraph through the accessor methods
+"""
+
+class SlotSets:
+    # List of per-slot integer sets
+    # After a bulk load the sets are held in CSR form (offsets into one sorted value array)
+    # and each one is only turned into a Python set the first time it is touched
+    def __init__(self, offsets: Optional[np.ndarray] = None, values: Optional[np.ndarray] = None):
+        self.offsets = offsets
+        self.values = values
+        self.sets: List[Optional[Set[int]]] = [None] * (len(offsets) - 1) if offsets is not None else []
+
+    @staticmethod
+    def from_pairs(slots: np.ndarray, values: np.ndarray, count: int) -> "SlotSets":
+        order = np.argsort(slots, kind="stable")
+        offsets = np.searchsorted(slots[order], np.arange(count + 1))
+        return SlotSets(offsets, values[order])
+
+    def __len__(self):
+        return len(self.sets)
+
+    def __getitem__(self, slot: int) -> Set[int]:
+        current = self.sets[slot]
+
+        if current is None:
+            assert self.offsets is not None and self.values is not None
+            current = set(self.values[self.offsets[slot]:self.offsets[slot + 1]].tolist())
+            self.sets[slot] = current
+
+        return current
+
+    def __setitem__(self, slot: int, value: Set[int]):
+        self.sets[slot] = value
+
+    def append(self, value: Set[int]):
+        self.sets.append(value)
+
+class ArrayVertexGraph(VertexGraph):
+    def __init__(self, vertex_capacity: int = 1024, face_capacity: int = 2048):
+        self.positions = np.zeros((vertex_capacity, 3), dtype=np.float64)
+        self.vertex_alive = np.zeros(vertex_capacity, dtype=bool)
+        self.quadric_store = np.zeros((vertex_capacity, 4, 4), dtype=np.float64)
+        self.quadric_valid = np.zeros(vertex_capacity, dtype=bool)
+        # Per-slot Python containers only grow as slots are first used
+        self.names: List[Optional[str]] = []
+        self.name_ids: Dict[str, int] = {}
+        self.adjacency = SlotSets()
+        self.incidence = SlotSets()
+        self.next_vertex = 0
+        self.free_vertices: List[int] = []
+
+        self.face_array = np.zeros((face_capacity, 3), dtype=np.int32)
+        self.face_alive = np.zeros(face_capacity, dtype=bool)
+        self.next_face = 0
+        self.free_faces: List[int] = []
+        self.live_faces = 0
+
+        self.m_count = 0
+        self.midpoint_prefix = ""
+        self.inversion_enabled = False
+
+    def _grow_vertices(self, minimum: int = 0):
+        capacity = len(self.vertex_alive)
+        extra = max(capacity, minimum - capacity, 1)
+
+        self.positions = np.concatenate((self.positions, np.zeros((extra, 3))))
+        self.vertex_alive = np.concatenate((self.vertex_alive, np.zeros(extra, dtype=bool)))
+        self.quadric_store = np.concatenate((self.quadric_store, np.zeros((extra, 4, 4))))
+        self.quadric_valid = np.concatenate((self.quadric_valid, np.zeros(extra, dtype=bool)))
+
+    def _grow_faces(self, minimum: int = 0):
+        capacity = len(self.face_alive)
+        extra = max(capacity, minimum - capacity, 1)
+
+        self.face_array = np.concatenate((self.face_array, np.zeros((extra, 3), dtype=np.int32)))
+        self.face_alive = np.concatenate((self.face_alive, np.zeros(extra, dtype=bool)))
+
+    def get_id(self, index):
+        return self.name_ids[index]
+
+    def has_vertex(self, index):
+        return index in self.name_ids
+
+    def get_coords(self, index):
+        return tuple(self.positions[self.name_ids[index]].tolist())
+
+    def vertex_names(self):
+        return [self.names[slot] for slot in np.flatnonzero(self.vertex_alive)]
+
+    def vertex_count(self):
+        return len(self.name_ids)
+
+    def get_face(self, face_id):
+        return tuple(self.names[slot] for slot in self.face_array[face_id])
+
+    def face_ids(self):
+        return np.flatnonzero(self.face_alive).tolist()
+
+    def face_ids_of(self, index):
+        return self.incidence[self.name_ids[index]]
+
+    def gather_coords(self, indices):
+        return self.positions[[self.name_ids[index] for index in indices]]
+
+    def gather_quadrics(self, indices):
+        slots = np.array([self.name_ids[index] for index in indices], dtype=np.int64)
+
+        for slot in slots[~self.quadric_valid[slots]]:
+            self.get_quadric(self.names[slot])
+
+        return self.quadric_store[slots]
+
+    def add_node(self, index, coords):
+        assert index not in self.name_ids
+        assert len(coords) == 3
+
+        if len(self.free_vertices) > 0:
+            slot = self.free_vertices.pop()
+        else:
+            if self.next_vertex == len(self.vertex_alive):
+                self._grow_vertices()
+
+            slot = self.next_vertex
+            self.next_vertex += 1
+
+            self.names.append(None)
+            self.adjacency.append(set())
+            self.incidence.append(set())
+
+        self.positions[slot] = coords
+        self.vertex_alive[slot] = True
+        self.quadric_valid[slot] = False
+        self.names[slot] = index
+        self.name_ids[index] = slot
+
+        return slot
+
+    def add_edge(self, index_one, index_two):
+        assert index_one in self.name_ids
+        assert index_two in self.name_ids
+        assert index_one != index_two
+
+        one, two = self.name_ids[index_one], self.name_ids[index_two]
+        self.adjacency[one].add(two)
+        self.adjacency[two].add(one)
+
+    def add_mesh(self, names, coords, faces):
+        # Vectorised bulk build, only supported on an empty graph
+        assert self.next_vertex == 0 and self.next_face == 0
+
+        count = len(names)
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        assert len(coords) == count
+
+        if len(self.vertex_alive) < count:
+            self._grow_vertices(count)
+
+        self.positions[:count] = coords
+        self.vertex_alive[:count] = True
+        self.quadric_valid[:count] = False
+        self.names = list(names)
+        self.name_ids = {index: slot for slot, index in enumerate(self.names)}
+        self.next_vertex = count
+        assert len(self.name_ids) == count, "Vertex names must be unique"
+
+        # Same dedupe as add_face, the first face over a set of vertices keeps its winding
+        sorted_faces = np.sort(faces, axis=1)
+        assert np.all(sorted_faces[:, 0] != sorted_faces[:, 1]) and np.all(sorted_faces[:, 1] != sorted_faces[:, 2]), "Faces must use three distinct vertices"
+
+        # lexsort is stable so the first row of each run of equal keys is the earliest face
+        order = np.lexsort((sorted_faces[:, 2], sorted_faces[:, 1], sorted_faces[:, 0]))
+        run_starts = np.ones(len(order), dtype=bool)
+        run_starts[1:] = np.any(np.diff(sorted_faces[order], axis=0) != 0, axis=1)
+        first_faces = np.sort(order[run_starts])
+        faces = faces[first_faces]
+        face_count = len(faces)
+
+        if len(self.face_alive) < face_count:
+            self._grow_faces(face_count)
+
+        self.face_array[:face_count] = faces
+        self.face_alive[:face_count] = True
+        self.next_face = face_count
+        self.live_faces = face_count
+
+        corner_faces = np.repeat(np.arange(face_count), 3)
+        self.incidence = SlotSets.from_pairs(faces.ravel(), corner_faces, count)
+
+        edges = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+        edges = np.concatenate((edges, edges[:, ::-1]))
+        edge_keys = np.sort(edges[:, 0] * count + edges[:, 1])
+        edge_keys = edge_keys[np.concatenate(([True], edge_keys[1:] != edge_keys[:-1]))]
+        edges = np.column_stack((edge_keys // count, edge_keys % count))
+        self.adjacency = SlotSets.from_pairs(edges[:, 0], edges[:, 1], count)
+
+    def add_face(self, a, b, c):
+        slots = (self.name_ids[a], self.name_ids[b], self.name_ids[c])
+
+        # e.g. front and back faces of the same triangle, found through the incidence sets
+        existing = self.incidence[slots[0]] & self.incidence[slots[1]] & self.incidence[slots[2]]
+
+        if len(existing) > 0:
+            return next(iter(existing))
+
+        self.add_edge(a, b)
+        self.add_edge(a, c)
+        self.add_edge(b, c)
+
+        if len(self.free_faces) > 0:
+            face_id = self.free_faces.pop()
+        else:
+            if self.next_face == len(self.face_alive):
+                self._grow_faces()
+
+            face_id = self.next_face
+            self.next_face += 1
+
+        self.face_array[face_id] = slots
+        self.face_alive[face_id] = True
+        self.live_faces += 1
+
+        for slot in slots:
+            self.incidence[slot].add(face_id)
+
+        return face_id
+
+    def remove_face(self, face_id):
+        assert self.face_alive[face_id]
+        for slot in self.face_array[face_id].tolist():
+            self.incidence[slot].discard(face_id)
+
+        self.face_alive[face_id] = False
+        self.free_faces.append(face_id)
+        self.live_faces -= 1
+
+    def polygon_count(self):
+        return self.live_faces
+
+    def get_neighbours(self, index):
+        return {self.names[slot] for slot in self.adjacency[self.name_ids[index]]}
+
+    def remove_node(self, index):
+        assert index in self.name_ids
+        slot = self.name_ids.pop(index)
+
+        for face_id in list(self.incidence[slot]):
+            self.remove_face(face_id)
+
+        for neighbour in self.adjacency[slot]:
+            self.adjacency[neighbour].discard(slot)
+
+        self.adjacency[slot] = set()
+        self.vertex_alive[slot] = False
+        self.quadric_valid[slot] = False
+        self.names[slot] = None
+        self.free_vertices.append(slot)
+
+    def collapse_edge(self, left, right, midpoint_name=None):
+        # midpoint_name lets a replay recreate the name written in a reduction record, new names are m1, m2, ... after midpoint_prefix
+        assert left in self.name_ids
+        assert right in self.name_ids
+
+        left_slot, right_slot = self.name_ids[left], self.name_ids[right]
+        assert right_slot in self.adjacency[left_slot], "Nodes must be connected by an edge"
+
+        midpoint_coords = (self.positions[left_slot] + self.positions[right_slot]) / 2
+        if midpoint_name is None:
+            self.m_count += 1
+            midpoint_name = f"{self.midpoint_prefix}m{self.m_count}"
+
+        # The merged vertex inherits both sets of planes
+        merged_quadric = None
+
+        if self.quadric_valid[left_slot] and self.quadric_valid[right_slot]:
+            merged_quadric = self.quadric_store[left_slot] + self.quadric_store[right_slot]
+
+        neighbours = (self.adjacency[left_slot] | self.adjacency[right_slot]) - {left_slot, right_slot}
+        neighbour_names = [self.names[slot] for slot in neighbours]
+
+        # Faces using both endpoints become degenerate, the rest are moved onto the midpoint
+        moved_faces = []
+
+        for face_id in list(self.incidence[left_slot] | self.incidence[right_slot]):
+            face = self.get_face(face_id)
+            self.remove_face(face_id)
+
+            if left in face and right in face:
+                continue
+
+            moved_faces.append(tuple(midpoint_name if vertex in (left, right) else vertex for vertex in face))
+
+        # Free the endpoints first so the midpoint reuses one of their slots
+        self.remove_node(left)
+        self.remove_node(right)
+        midpoint_slot = self.add_node(midpoint_name, midpoint_coords)
+
+        if merged_quadric is not None:
+            self.quadric_store[midpoint_slot] = merged_quadric
+            self.quadric_valid[midpoint_slot] = True
+
+        for neighbour in neighbour_names:
+            self.add_edge(midpoint_name, neighbour)
+
+        # Two moved faces can land on the same vertices, sorting picks the one that survives by content rather than
+        # by face id, ids are renumbered when a graph is rebuilt from a checkpoint
+        for face in sorted(moved_faces):
+            self.add_face(*face)
+
+        return midpoint_name
+
+    def compute_vertex_quadric_matrix(self, index):
+        epsilon = 1e-7
+        slot = self.name_ids[index]
+        face_ids = list(self.incidence[slot])
+
+        if len(face_ids) == 0:
+            return np.zeros((4, 4))
+
+        # Same planes as VertexGraph but gathered straight from the arrays
+        corners = self.positions[self.face_array[face_ids]]
+        cross = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        cross_norm = np.linalg.norm(cross, axis=1, keepdims=True)
+
+        # Avoid a div by 0
+        normal_vecs = cross / (cross_norm + epsilon)
+        d = -normal_vecs @ self.positions[slot]
+
+        planes = np.column_stack((normal_vecs, d))
+        return planes.T @ planes
+
+    def get_quadric(self, index):
+        slot = self.name_ids[index]
+
+        if not self.quadric_valid[slot]:
+            self.quadric_store[slot] = self.compute_vertex_quadric_matrix(index)
+            self.quadric_valid[slot] = True
+
+        return self.quadric_store[slot]
+
+    def cached_quadrics(self):
+        return {self.names[slot]: self.quadric_store[slot].copy() for slot in np.flatnonzero(self.quadric_valid & self.vertex_alive)}
+
+    def set_quadric(self, index, quadric):
+        slot = self.name_ids[index]
+        self.quadric_store[slot] = quadric
+        self.quadric_valid[slot] = True
+
+    def find_index_by_coords(self, coords):
+        matches = np.flatnonzero(self.vertex_alive & np.all(self.positions == np.asarray(coords), axis=1))
+        assert len(matches) > 0
+        return self.names[matches[0]]
@@ -0,0 +1,286 @@
+from typing import Any, Dict, List, Optional
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from collapse_engines import COLLAPSE_ENGINES
+from obj_model import GRAPH_BACKENDS, process_obj_file, write_obj_file
+from reduction_trace import TRACE_WRITERS, create_tracer
+
+"""
+Headless batch entry point for decimating many .obj files at once, the counterpart of progressive_generator.py
+Every asset runs process_obj_file -> reduce -> outputs in its own worker process
+
+Targets are either an absolute polygon count or a ratio of the original polygon count,
+a JSON file can override them per asset, e.g. {"chair_max.obj": {"polygons": 250}, "table.obj": {"ratio": 0.1}}
+
+A manifest in the output directory stores a sha256 of each input file together with the settings used,
+assets whose hash matches and whose outputs all exist are skipped
+--trace jsonl / chrome also writes a per phase timing trace of every reduce next to its outputs (see reduction_trace.py)
+
+Example: python batch_decimate.py models/ "props/*.obj" --ratio 0.25 --workers 8 --output reduced
+"""
+
+MANIFEST_NAME = "manifest.json"
+
+TRACE_EXTENSIONS = {
+    "jsonl": ".trace.jsonl",
+    "chrome": ".trace.json"
+}
+
+OUTPUT_EXTENSIONS = {
+    "json": ".json",
+    "obj": ".rr.obj",
+    "binary": ".pmb"
+}
+
+def find_obj_files(inputs: List[str]) -> List[str]:
+    # Each input is a directory (searched recursively), a glob or a single file
+    found = []
+
+    for item in inputs:
+        if os.path.isdir(item):
+            found.extend(glob.glob(os.path.join(item, "**", "*.obj"), recursive=True))
+        else:
+            found.extend(glob.glob(item, recursive=True))
+
+    # Skip the files written by write_obj_file so they are not decimated a second time
+    return sorted(set(file_name for file_name in found if file_name.endswith(".obj") and not file_name.endswith(".rr.obj")))
+
+def hash_asset(file_name: str, settings: Dict[str, Any]) -> str:
+    digest = hashlib.sha256()
+
+    with open(file_name, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(block)
+
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def load_manifest(output_directory: str) -> Dict[str, Any]:
+    location = os.path.join(output_directory, MANIFEST_NAME)
+
+    if not os.path.exists(location):
+        return {}
+
+    with open(location, "r") as fp:
+        return json.load(fp)
+
+def save_manifest(output_directory: str, manifest: Dict[str, Any]):
+    location = os.path.join(output_directory, MANIFEST_NAME)
+    temporary_name = f"{location}.tmp"
+
+    with open(temporary_name, "w") as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+
+    os.replace(temporary_name, location)
+
+def resolve_target(file_name: str, overrides: Dict[str, Dict[str, Any]], default: Dict[str, Any]) -> Dict[str, Any]:
+    # Overrides may be keyed by the path as given or by the bare file name
+    target = overrides.get(file_name, overrides.get(os.path.basename(file_name), default))
+
+    assert len(target) == 1 and ("polygons" in target or "ratio" in target), f"Target for {file_name} needs exactly one of polygons or ratio, received {target}"
+
+    if "ratio" in target:
+        assert 0 < target["ratio"] <= 1, f"Ratio for {file_name} must be in (0, 1], received {target['ratio']}"
+
+    return target
+
+def decimate_asset(job: Dict[str, Any]) -> Dict[str, Any]:
+    # Job built by run_batch, the settings are those hashed into the manifest entry of the asset
+    timings = {}
+
+    start = time.perf_counter()
+    model = process_obj_file(job["input"], backend=job["settings"]["backend"])
+    timings["load"] = time.perf_counter() - start
+
+    initial_polygons = model.graph.polygon_count()
+    target = job["settings"]["target"]
+
+    if "ratio" in target:
+        target_polygons = int(initial_polygons * target["ratio"])
+    else:
+        target_polygons = target["polygons"]
+
+    start = time.perf_counter()
+
+    tracer = create_tracer(job["trace"], job["trace_format"]) if job["trace"] is not None else None
+    model.reduce(iterations=None, stopping_condition=lambda iterations, polygons: polygons <= target_polygons, engine=job["settings"]["engine"], tracer=tracer)
+
+    timings["reduce"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+
+    for output_format, output_name in job["outputs"].items():
+        if output_format == "json":
+            model.to_json(save=output_name, readable=False)
+        elif output_format == "obj":
+            write_obj_file(model, write_reduction_records=True, file_name=output_name)
+        elif output_format == "binary":
+            model.to_binary(save=output_name)
+
+    timings["write"] = time.perf_counter() - start
+
+    return {
+        "input": job["input"],
+        "initial_polygons": initial_polygons,
+        "final_polygons": model.graph.polygon_count(),
+        "collapses": len(model.reduction_records),
+        "timings": timings
+    }
+
+def print_summary(results: List[Dict[str, Any]], skipped: List[str], failed: Dict[str, str], elapsed: float):
+    print()
+    print(f"{'file':<40} {'polygons':>17} {'load':>8} {'reduce':>8} {'write':>8} {'total':>8}")
+
+    for result in sorted(results, key=lambda result: result["input"]):
+        timings = result["timings"]
+        polygons = f"{result['initial_polygons']} -> {result['final_polygons']}"
+        print(f"{result['input'][-40:]:<40} {polygons:>17} {timings['load']:>7.2f}s {timings['reduce']:>7.2f}s {timings['write']:>7.2f}s {sum(timings.values()):>7.2f}s")
+
+    for file_name in skipped:
+        print(f"{file_name[-40:]:<40} {'up to date':>17}")
+
+    for file_name, error in failed.items():
+        print(f"{file_name[-40:]:<40} {'failed':>17} {error}")
+
+    print()
+    print(f"Decimated {len(results)}, skipped {len(skipped)}, failed {len(failed)} in {elapsed:.2f}s")
+
+def run_batch(inputs: List[str], output_directory: str, default_target: Dict[str, Any], overrides: Optional[Dict[str, Dict[str, Any]]] = None, workers: Optional[int] = None, formats: Optional[List[str]] = None, engine: str = "queue", backend: str = "dict", force: bool = False, trace_format: Optional[str] = None) -> Dict[str, Any]:
+    assert engine in COLLAPSE_ENGINES.keys(), f"Unknown collapse engine {engine}, expected one of {list(COLLAPSE_ENGINES.keys())}"
+    assert backend in GRAPH_BACKENDS.keys(), f"Unknown graph backend {backend}, expected one of {list(GRAPH_BACKENDS.keys())}"
+
+    formats = formats if formats is not None else ["json", "obj"]
+
+    for output_format in formats:
+        assert output_format in OUTPUT_EXTENSIONS.keys(), f"Unknown output format {output_format}, expected one of {list(OUTPUT_EXTENSIONS.keys())}"
+
+    assert trace_format is None or trace_format in TRACE_WRITERS.keys(), f"Unknown trace format {trace_format}, expected one of {list(TRACE_WRITERS.keys())}"
+
+    overrides = overrides or {}
+    os.makedirs(output_directory, exist_ok=True)
+
+    manifest = load_manifest(output_directory)
+    file_names = find_obj_files(inputs)
+
+    stems = [os.path.splitext(os.path.basename(file_name))[0] for file_name in file_names]
+    assert len(set(stems)) == len(stems), "Input files must have unique names as they share one output directory"
+
+    jobs = []
+    skipped = []
+
+    for file_name, stem in zip(file_names, stems):
+        settings = {
+            "target": resolve_target(file_name, overrides, default_target),
+            "engine": engine,
+            "backend": backend,
+            "formats": sorted(formats)
+        }
+
+        content_hash = hash_asset(file_name, settings)
+        outputs = {output_format: os.path.join(output_directory, f"{stem}{OUTPUT_EXTENSIONS[output_format]}") for output_format in formats}
+        entry = manifest.get(stem)
+
+        if not force and entry is not None and entry["hash"] == content_hash and all(os.path.exists(output) for output in outputs.values()):
+            skipped.append(file_name)
+            continue
+
+        jobs.append({
+            "input": file_name,
+            "stem": stem,
+            "hash": content_hash,
+            "settings": settings,
+            "outputs": outputs,
+            "trace": os.path.join(output_directory, f"{stem}{TRACE_EXTENSIONS[trace_format]}") if trace_format is not None else None,
+            "trace_format": trace_format
+        })
+
+    results = []
+    failed = {}
+    start = time.perf_counter()
+
+    if len(jobs) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(decimate_asset, job): job for job in jobs}
+
+            for future in as_completed(futures):
+                job = futures[future]
+
+                try:
+                    result = future.result()
+                except Exception as error:
+                    failed[job["input"]] = repr(error)
+                    print(f"Failed {job['input']}: {error!r}")
+                    continue
+
+                results.append(result)
+                print(f"Finished {job['input']} in {sum(result['timings'].values()):.2f}s")
+
+                # Saved after every asset so an interrupted batch keeps the work already done
+                manifest[job["stem"]] = {
+                    "input": job["input"],
+                    "hash": job["hash"],
+                    "outputs": job["outputs"],
+                    "polygons": result["final_polygons"]
+                }
+
+                save_manifest(output_directory, manifest)
+
+    elapsed = time.perf_counter() - start
+    print_summary(results, skipped, failed, elapsed)
+
+    return {
+        "results": results,
+        "skipped": skipped,
+        "failed": failed
+    }
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Decimate a batch of .obj files in parallel")
+    parser.add_argument("inputs", nargs="+", help="directories, globs or .obj files to decimate")
+    parser.add_argument("--output", default="reduced", help="directory the outputs and manifest are written to")
+
+    target_group = parser.add_mutually_exclusive_group(required=True)
+    target_group.add_argument("--target-polygons", type=int, help="stop once an asset has at most this many polygons")
+    target_group.add_argument("--ratio", type=float, help="stop once an asset has at most this fraction of its polygons")
+
+    parser.add_argument("--targets", help="JSON file of per asset targets that override the default")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the number of CPUs")
+    parser.add_argument("--formats", default="json,obj", help=f"comma separated outputs from {list(OUTPUT_EXTENSIONS.keys())}")
+    parser.add_argument("--engine", default="queue", choices=list(COLLAPSE_ENGINES.keys()))
+    parser.add_argument("--backend", default="dict", choices=list(GRAPH_BACKENDS.keys()))
+    parser.add_argument("--force", action="store_true", help="decimate every asset even if its outputs are up to date")
+    parser.add_argument("--trace", default=None, choices=list(TRACE_WRITERS.keys()), help="also write a timing trace of every reduce to the output directory")
+
+    args = parser.parse_args(arguments)
+
+    default_target = {"polygons": args.target_polygons} if args.target_polygons is not None else {"ratio": args.ratio}
+    overrides = {}
+
+    if args.targets is not None:
+        with open(args.targets, "r") as fp:
+            overrides = json.load(fp)
+
+    summary = run_batch(
+        args.inputs,
+        args.output,
+        default_target,
+        overrides=overrides,
+        workers=args.workers,
+        formats=[output_format.strip() for output_format in args.formats.split(",") if output_format.strip() != ""],
+        engine=args.engine,
+        backend=args.backend,
+        force=args.force,
+        trace_format=args.trace
+    )
+
+    return 1 if len(summary["failed"]) > 0 else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,191 @@
+from typing import Any, Dict, List, Optional
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from collapse_engines import COLLAPSE_ENGINES
+from obj_model import GRAPH_BACKENDS, load_reduction_checkpoint, process_obj_file
+from replay_engine import ReplayEngine
+from tiled_decimation import tiled_reduce
+from vertex_graph import graph_to_arrays
+
+"""
+Runnable checks of the reduction pipeline, there is no test framework so each check is a function that asserts
+and main runs them over every graph backend, exiting with 1 when one fails
+
+- resume: with every collapse engine, a reduction resumed from a checkpoint writes the same records as one that ran straight through
+- resume_processes: the same with the straight run, the interrupted run and the resume in three processes with different
+  PYTHONHASHSEED values, the way a checkpoint is normally used
+- engines: the exhaustive engine and its vectorised counterpart, the batched engine, collapse the same edges in the same order
+- replay: seeking a ReplayEngine to the top level gives the original mesh back, also after jumping between levels
+- tiled: reproduce() after tiled_reduce gives the original mesh back, i.e. the tile and seam records form one valid sequence
+
+Example: python check_reductions.py chair_max.obj --ratio 0.5
+"""
+
+def _canonical_face(face) -> tuple:
+    # Same winding starting from the smallest name, so faces compare equal whatever corner they were stored from
+    start = face.index(min(face))
+    return tuple(face[start:]) + tuple(face[:start])
+
+def mesh_signature(graph) -> Dict[str, Any]:
+    mesh = graph_to_arrays(graph)
+    names = mesh["names"]
+
+    return {
+        "coords": {name: tuple(coords) for name, coords in zip(names, mesh["coords"].tolist())},
+        "faces": sorted(_canonical_face([names[i] for i in face]) for face in mesh["faces"].tolist()),
+        "edges": sorted(tuple(sorted((names[a], names[b]))) for a, b in mesh["edges"].tolist())
+    }
+
+def _canonical_records(reduction_records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Coords and polygons are lists once the records went through JSON
+    return [{
+        **record,
+        "xCoords": tuple(record["xCoords"]),
+        "yCoords": tuple(record["yCoords"]),
+        "polygons": [tuple(polygon) for polygon in record["polygons"]]
+    } for record in reduction_records]
+
+def check_resume(file_name: str, backend: str, target_polygons: int, directory: str):
+    stop = lambda iterations, polygons: polygons <= target_polygons
+
+    for engine in COLLAPSE_ENGINES.keys():
+        straight = process_obj_file(file_name, backend=backend)
+        straight.reduce(None, stop, engine=engine)
+        collapses = len(straight.reduction_records)
+        assert collapses > 1, f"Reducing {file_name} to {target_polygons} polygons needs at least two collapses"
+
+        checkpoint = os.path.join(directory, f"{backend}_{engine}.npz")
+        interrupted = process_obj_file(file_name, backend=backend)
+        interrupted.reduce(None, stop, engine=engine, checkpoint=checkpoint, checkpoint_every=max((collapses - 1) // 2, 1))
+
+        resumed = load_reduction_checkpoint(checkpoint)
+        written = len(resumed.reduction_records)
+        resumed.reduce(None, stop)
+
+        assert 0 < written < collapses, f"The checkpoint holds {written} of {collapses} records, nothing was resumed"
+        assert _canonical_records(resumed.reduction_records) == _canonical_records(straight.reduction_records), f"Resuming the {engine} engine after {written} records diverged"
+        assert mesh_signature(resumed.graph) == mesh_signature(straight.graph), f"Resuming the {engine} engine left a different mesh"
+
+def reduce_to_file(file_name: str, backend: str, engine: str, target_polygons: int, output: str, checkpoint: Optional[str] = None, checkpoint_every: Optional[int] = None):
+    # Worker of check_resume_processes, writes the records as JSON
+    model = process_obj_file(file_name, backend=backend)
+    model.reduce(None, lambda iterations, polygons: polygons <= target_polygons, engine=engine, checkpoint=checkpoint, checkpoint_every=checkpoint_every)
+
+    with open(output, "w") as fp:
+        json.dump(model.reduction_records, fp)
+
+def resume_to_file(checkpoint: str, target_polygons: int, output: str):
+    model = load_reduction_checkpoint(checkpoint)
+    model.reduce(None, lambda iterations, polygons: polygons <= target_polygons)
+
+    with open(output, "w") as fp:
+        json.dump(model.reduction_records, fp)
+
+def _run_in_process(hash_seed: str, call: str):
+    # Runs call on this module in a fresh interpreter, set ordering there follows hash_seed
+    directory = os.path.dirname(os.path.abspath(__file__))
+    environment = {**os.environ, "PYTHONHASHSEED": hash_seed, "PYTHONPATH": os.pathsep.join([directory, os.environ.get("PYTHONPATH", "")])}
+    finished = subprocess.run([sys.executable, "-c", f"import check_reductions; check_reductions.{call}"], cwd=directory, env=environment, capture_output=True, text=True)
+
+    assert finished.returncode == 0, f"check_reductions.{call} failed with PYTHONHASHSEED={hash_seed}: {finished.stderr.strip()}"
+
+def _read_records(file_name: str) -> List[Dict[str, Any]]:
+    with open(file_name, "r") as fp:
+        return _canonical_records(json.load(fp))
+
+def check_resume_processes(file_name: str, backend: str, target_polygons: int, directory: str):
+    for engine in COLLAPSE_ENGINES.keys():
+        prefix = os.path.join(directory, f"{backend}_{engine}_processes")
+        _run_in_process("1", f"reduce_to_file({file_name!r}, {backend!r}, {engine!r}, {target_polygons}, {prefix + '_straight.json'!r})")
+        straight = _read_records(f"{prefix}_straight.json")
+
+        checkpoint_every = max((len(straight) - 1) // 2, 1)
+        _run_in_process("2", f"reduce_to_file({file_name!r}, {backend!r}, {engine!r}, {target_polygons}, {prefix + '_interrupted.json'!r}, {prefix + '.npz'!r}, {checkpoint_every})")
+        _run_in_process("3", f"resume_to_file({prefix + '.npz'!r}, {target_polygons}, {prefix + '_resumed.json'!r})")
+
+        assert _read_records(f"{prefix}_resumed.json") == straight, f"Resuming the {engine} engine in another process diverged from the uninterrupted run"
+
+def check_engines(file_name: str, backend: str, target_polygons: int, directory: str):
+    reduction_records = {}
+
+    for engine in ["exhaustive", "batched"]:
+        model = process_obj_file(file_name, backend=backend)
+        model.reduce(None, lambda iterations, polygons: polygons <= target_polygons, engine=engine)
+        reduction_records[engine] = _canonical_records(model.reduction_records)
+
+    assert reduction_records["exhaustive"] == reduction_records["batched"], "The exhaustive and batched engines collapsed different edges"
+
+def check_replay(file_name: str, backend: str, target_polygons: int, directory: str):
+    original = mesh_signature(process_obj_file(file_name, backend=backend).graph)
+
+    model = process_obj_file(file_name, backend=backend)
+    model.reduce(None, lambda iterations, polygons: polygons <= target_polygons)
+    reduced = mesh_signature(model.graph)
+
+    engine = ReplayEngine.from_model(model, checkpoint_interval=8)
+    assert mesh_signature(engine.seek(engine.levels)) == original, "Replaying every record did not give the original mesh"
+    assert mesh_signature(engine.seek(0)) == reduced, "Seeking back to level 0 did not give the reduced mesh"
+
+    # Jumps that restore a snapshot rather than stepping from the current level
+    for level in [engine.levels // 3, engine.levels - 1, 1, engine.levels]:
+        engine.seek(level)
+
+    assert mesh_signature(engine.graph) == original, "Replaying after seeking between levels did not give the original mesh"
+    assert model.graph is engine.graph, "The model no longer follows the replayed graph"
+
+def check_tiled(file_name: str, backend: str, target_polygons: int, directory: str):
+    original = mesh_signature(process_obj_file(file_name, backend=backend).graph)
+
+    model = process_obj_file(file_name, backend=backend)
+    statistics = tiled_reduce(model, target_polygons, tiles=4, workers=1)
+
+    assert model.graph.polygon_count() <= target_polygons, f"tiled_reduce stopped at {model.graph.polygon_count()} polygons, the target is {target_polygons}"
+    assert [record["i"] for record in model.reduction_records] == list(range(1, len(model.reduction_records) + 1)), "The tile and seam records are not numbered in order"
+    assert statistics["tile_collapses"] + statistics["seam_collapses"] == len(model.reduction_records)
+
+    model.reproduce()
+    assert mesh_signature(model.graph) == original, "Reproducing the tiled records did not give the original mesh"
+
+CHECKS = {
+    "resume": check_resume,
+    "resume_processes": check_resume_processes,
+    "engines": check_engines,
+    "replay": check_replay,
+    "tiled": check_tiled
+}
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check that resumed, replayed and tiled reductions are consistent")
+    parser.add_argument("input", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "chair_max.obj"), help=".obj file to reduce")
+    parser.add_argument("--ratio", type=float, default=0.5, help="fraction of the polygons every reduction stops at")
+    parser.add_argument("--checks", default=",".join(CHECKS.keys()), help=f"comma separated checks from {list(CHECKS.keys())}")
+    options = parser.parse_args(arguments)
+
+    checks = [name.strip() for name in options.checks.split(",") if name.strip() != ""]
+
+    for name in checks:
+        assert name in CHECKS.keys(), f"Unknown check {name}, expected one of {list(CHECKS.keys())}"
+
+    target_polygons = int(process_obj_file(options.input).graph.polygon_count() * options.ratio)
+    failed = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in checks:
+            for backend in GRAPH_BACKENDS.keys():
+                try:
+                    CHECKS[name](options.input, backend, target_polygons, directory)
+                    print(f"ok     {name} ({backend})")
+                except AssertionError as error:
+                    failed.append((name, backend))
+                    print(f"FAILED {name} ({backend}): {error}")
+
+    return 1 if len(failed) > 0 else 0
+
+if __name__ == "__main__":
+    exit(main())
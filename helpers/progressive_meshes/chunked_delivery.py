@@ -0,0 +1,135 @@
+from typing import Any, Dict, Optional
+
+import json
+import os
+import urllib.request
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from obj_model import OBJModel, GRAPH_BACKENDS, apply_vertex_split
+
+"""
+Splits a reduced model into a base mesh and size bounded chunks of vertex split records so
+a static HTTP server can deliver the progressive mesh incrementally
+
+Layout of the output directory:
+- index.json: the base file name and one entry per chunk (file, first record, count, bytes, polygons once applied)
+- base.json: maximums, vertices and polygons of the fully reduced mesh (same keys as to_json)
+- chunk_0000.json, ...: {"index": k, "records": [...]} with records in refinement order
+
+Each chunk is plain JSON that can be decoded on its own, chunk k applies to the base mesh once chunks 0 to k - 1 have been applied
+"""
+
+def _encode(data) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+def _build_base_graph(graph, base: Dict[str, Any]):
+    vertex_names = [vertex["name"] for vertex in base["vertices"]]
+    vertex_ids = {name: i for i, name in enumerate(vertex_names)}
+    faces = [[vertex_ids[vertex] for vertex in polygon] for polygon in base["polygons"]]
+
+    graph.add_mesh(vertex_names, [vertex["coords"] for vertex in base["vertices"]], faces)
+    return graph
+
+def write_refinement_chunks(obj_model: OBJModel, directory: str, max_chunk_bytes: int = 64 * 1024) -> Dict[str, Any]:
+    os.makedirs(directory, exist_ok=True)
+
+    base = {
+        "maximums": {
+            "vertices": obj_model.maximum_vertices,
+            "polygons": obj_model.maximum_polygons
+        },
+        "vertices": [{"name": index, "coords": obj_model.graph.get_coords(index)} for index in obj_model.graph.vertex_names()],
+        "polygons": [polygon_data["polygon"] for polygon_data in obj_model.graph.compute_all_polygons().values()]
+    }
+
+    with open(os.path.join(directory, "base.json"), "wb") as fp:
+        fp.write(_encode(base))
+
+    # Refinement replays the collapses backwards
+    records = obj_model.reduction_records[::-1]
+    encoded_records = [_encode(record) for record in records]
+
+    # Track the polygon count the client will reach after each chunk by applying the splits to a copy of the base
+    graph = _build_base_graph(type(obj_model.graph)(), base)
+
+    chunks = []
+    start = 0
+
+    while start < len(records):
+        # Always take at least one record even if it is larger than the limit
+        end = start + 1
+        size = len(encoded_records[start])
+
+        while end < len(records) and size + len(encoded_records[end]) + 1 <= max_chunk_bytes:
+            size += len(encoded_records[end]) + 1
+            end += 1
+
+        for record in records[start:end]:
+            apply_vertex_split(graph, record)
+
+        chunk_file = f"chunk_{len(chunks):04d}.json"
+        payload = b'{"index":%d,"records":[' % len(chunks) + b",".join(encoded_records[start:end]) + b"]}"
+
+        with open(os.path.join(directory, chunk_file), "wb") as fp:
+            fp.write(payload)
+
+        chunks.append({
+            "file": chunk_file,
+            "first": start,
+            "count": end - start,
+            "bytes": len(payload),
+            "polygons": graph.polygon_count()
+        })
+
+        start = end
+
+    index = {
+        "base": "base.json",
+        "record_count": len(records),
+        "base_polygons": len(base["polygons"]),
+        "chunks": chunks
+    }
+
+    with open(os.path.join(directory, "index.json"), "w") as fp:
+        json.dump(index, fp, indent=2)
+
+    return index
+
+def read_chunk_file(location: str, file_name: str):
+    # location is either a local directory or the base URL of a static server
+    if location.startswith("http://") or location.startswith("https://"):
+        with urllib.request.urlopen(f"{location.rstrip('/')}/{file_name}") as response:
+            return json.loads(response.read())
+
+    with open(os.path.join(location, file_name), "rb") as fp:
+        return json.loads(fp.read())
+
+def load_chunked_model(location: str, target_polygons: Optional[int] = None, backend: str = "dict") -> OBJModel:
+    # Builds the base mesh then applies chunks in order
+    # With target_polygons only the chunks needed to reach that level of detail are fetched
+    assert backend in GRAPH_BACKENDS.keys(), f"Unknown graph backend {backend}, expected one of {list(GRAPH_BACKENDS.keys())}"
+
+    index = read_chunk_file(location, "index.json")
+    base = read_chunk_file(location, index["base"])
+    graph = _build_base_graph(GRAPH_BACKENDS[backend](), base)
+
+    for chunk in index["chunks"]:
+        if target_polygons is not None and graph.polygon_count() >= target_polygons:
+            break
+
+        for record in read_chunk_file(location, chunk["file"])["records"]:
+            apply_vertex_split(graph, record)
+
+    model = OBJModel(os.path.join(location, "model.obj"), graph, [], [], {})
+    model.maximum_vertices = base["maximums"]["vertices"]
+    model.maximum_polygons = base["maximums"]["polygons"]
+
+    return model
+
+def serve_chunks(directory: str, port: int = 8000):
+    # Local stand-in for the static server that would host the chunks in production
+    handler = partial(SimpleHTTPRequestHandler, directory=directory)
+    server = ThreadingHTTPServer(("", port), handler)
+    print(f"Serving {directory} on http://localhost:{port}")
+    server.serve_forever()
@@ -0,0 +1,164 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import heapq
+
+from vertex_graph import VertexGraph
+from reduction_trace import NULL_TRACER
+
+"""
+Engines decide which edge OBJModel.reduce collapses next
+Each engine exposes next_edge() and notify_collapse(left, right, merged) so reduce can drive any of them
+export_state() returns whatever the engine needs beyond the graph to continue exactly where it stopped,
+passing it back as state when creating the engine resumes it (see reduction_checkpoint.py)
+Engines time their quadric, enumeration and scoring phases on the tracer they are given (see reduction_trace.py)
+Edges touching a vertex in locked are never offered, the vertex keeps its name and position (see tiled_decimation.py)
+"""
+
+class ExhaustiveCollapseEngine:
+    # Original behaviour: rescore every edge of the graph on every iteration
+    def __init__(self, graph: VertexGraph, state: Optional[Dict[str, Any]] = None, tracer=NULL_TRACER, locked: Optional[Set[str]] = None):
+        self.graph = graph
+        self.tracer = tracer
+        self.locked = locked if locked is not None else set()
+
+        # The first rescan would build every quadric anyway, seeding them here keeps scoring to scoring
+        with tracer.phase("quadric_build"):
+            self.graph.seed_quadrics()
+
+    def next_edge(self):
+        return self._select(batched=False)
+
+    def _select(self, batched: bool):
+        with self.tracer.phase("edge_enumeration"):
+            edge_pairs = self.graph.compute_edge_pairs()
+
+            if len(self.locked) > 0:
+                edge_pairs = set(pair for pair in edge_pairs if pair[0] not in self.locked and pair[1] not in self.locked)
+
+        self.tracer.count("edges_scored", len(edge_pairs))
+
+        with self.tracer.phase("scoring"):
+            return self.graph.determine_preferred_collapsible_edge(batched=batched, edge_pairs=edge_pairs)
+
+    def notify_collapse(self, left, right, merged):
+        return
+
+    def export_state(self) -> Dict[str, Any]:
+        # Stateless, every call rescans the graph
+        return {}
+
+class BatchedCollapseEngine(ExhaustiveCollapseEngine):
+    # Same full rescan but every edge is scored in one vectorised pass
+    def next_edge(self):
+        return self._select(batched=True)
+
+class QueueCollapseEngine:
+    # Keeps a min-heap of candidate collapses keyed by quadric error
+    # Entries are invalidated lazily: each vertex carries a version stamp and
+    # an entry is only trusted if both endpoint stamps still match when popped
+    def __init__(self, graph: VertexGraph, state: Optional[Dict[str, Any]] = None, tracer=NULL_TRACER, locked: Optional[Set[str]] = None):
+        self.graph = graph
+        self.tracer = tracer
+        self.locked = locked if locked is not None else set()
+
+        with tracer.phase("quadric_build"):
+            self.graph.seed_quadrics()
+
+        if state is not None:
+            # The live entries are restored as they were rather than rescored so ties pop in the same order
+            self.version = int(state["version"])
+            self.stamps = dict(zip([str(name) for name in state["stamp_names"]], [int(stamp) for stamp in state["stamp_values"]]))
+            self.heap = list(zip(
+                [float(error) for error in state["errors"]],
+                [str(name) for name in state["a"]],
+                [str(name) for name in state["b"]],
+                [int(stamp) for stamp in state["a_stamps"]],
+                [int(stamp) for stamp in state["b_stamps"]]
+            ))
+            heapq.heapify(self.heap)
+            return
+
+        self.version = 0
+        self.stamps: Dict[str, int] = {vertex: 0 for vertex in graph.vertex_names()}
+        self.heap: List[Tuple[float, str, str, int, int]] = []
+
+        # Seed every edge in one batched pass
+        with tracer.phase("edge_enumeration"):
+            edge_pairs = [pair for pair in graph.compute_edge_pairs() if pair[0] not in self.locked and pair[1] not in self.locked]
+
+        tracer.count("edges_scored", len(edge_pairs))
+
+        with tracer.phase("scoring"):
+            errors = graph.compute_edge_errors(edge_pairs)
+
+        for (a, b), error in zip(edge_pairs, errors.tolist()):
+            self.heap.append((error, a, b, 0, 0))
+
+        heapq.heapify(self.heap)
+
+    def _create_entry(self, a, b):
+        error = self.graph.compute_edge_error(a, b)
+        return (error, a, b, self.stamps[a], self.stamps[b])
+
+    def next_edge(self):
+        with self.tracer.phase("queue_pop"):
+            stale = 0
+
+            while len(self.heap) > 0:
+                _, a, b, a_stamp, b_stamp = heapq.heappop(self.heap)
+
+                # Stale if either endpoint has been collapsed or changed since the entry was pushed
+                if self.stamps.get(a) != a_stamp or self.stamps.get(b) != b_stamp:
+                    stale += 1
+                    continue
+
+                self.tracer.count("stale_entries", stale)
+                return a, b
+
+            self.tracer.count("stale_entries", stale)
+            return False
+
+    def notify_collapse(self, left, right, merged):
+        del self.stamps[left]
+        del self.stamps[right]
+
+        # The graph merges the endpoint quadrics on collapse and leaves the neighbours'
+        # quadrics untouched so only the edges incident to the merged vertex change
+        self.version += 1
+        self.stamps[merged] = self.version
+
+        with self.tracer.phase("scoring"):
+            neighbours = [neighbour for neighbour in self.graph.get_neighbours(merged) if neighbour not in self.locked]
+
+            for neighbour in neighbours:
+                a = str(merged) if str(merged) < str(neighbour) else str(neighbour)
+                b = str(merged) if str(merged) > str(neighbour) else str(neighbour)
+
+                heapq.heappush(self.heap, self._create_entry(a, b))
+
+        self.tracer.count("edges_scored", len(neighbours))
+
+    def export_state(self) -> Dict[str, Any]:
+        # Column lists so a checkpoint can store them as arrays, stale entries are dropped as they would be skipped anyway
+        live = [entry for entry in self.heap if self.stamps.get(entry[1]) == entry[3] and self.stamps.get(entry[2]) == entry[4]]
+
+        return {
+            "version": self.version,
+            "stamp_names": list(self.stamps.keys()),
+            "stamp_values": list(self.stamps.values()),
+            "errors": [entry[0] for entry in live],
+            "a": [entry[1] for entry in live],
+            "b": [entry[2] for entry in live],
+            "a_stamps": [entry[3] for entry in live],
+            "b_stamps": [entry[4] for entry in live]
+        }
+
+COLLAPSE_ENGINES = {
+    "exhaustive": ExhaustiveCollapseEngine,
+    "batched": BatchedCollapseEngine,
+    "queue": QueueCollapseEngine
+}
+
+def create_collapse_engine(name: str, graph: VertexGraph, state: Optional[Dict[str, Any]] = None, tracer=NULL_TRACER, locked: Optional[Set[str]] = None):
+    assert name in COLLAPSE_ENGINES.keys(), f"Unknown collapse engine {name}, expected one of {list(COLLAPSE_ENGINES.keys())}"
+    return COLLAPSE_ENGINES[name](graph, state, tracer, locked)
@@ -0,0 +1,97 @@
+from typing import Any, Dict, List, Tuple
+
+import os
+
+import numpy as np
+
+"""
+Writers for the level of detail snapshots taken by OBJModel.reduce(lod_targets=...)
+Every level indexes into one shared vertex buffer, vertices are listed once in the order they were first seen
+
+OBJ: all vertices, then one object per level (o lod0, o lod1, ...) from the most to the least detailed
+Binary (read by createLevelOfDetailFromBinary in code/src/utils/level_of_detail.ts), little endian:
+1. Header (LOD_HEADER_DTYPE, 16 bytes)
+2. Level table: LOD_LEVEL_DTYPE (level_count), most detailed first
+3. Vertex block: float32 (vertex_count, 3)
+4. Face block: uint32 (total faces, 3) of vertex indices, each level is a contiguous slice
+"""
+
+LOD_MAGIC = b"LOD1"
+LOD_VERSION = 1
+
+LOD_HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("vertex_count", "<u4"),
+    ("level_count", "<u4")
+])
+
+LOD_LEVEL_DTYPE = np.dtype([
+    ("target", "<u4"),
+    ("face_offset", "<u4"),
+    ("face_count", "<u4")
+])
+
+def _index_snapshots(vertices: Dict[str, Tuple[float, float, float]], snapshots: List[Dict[str, Any]]):
+    vertex_ids = {name: i for i, name in enumerate(vertices.keys())}
+    levels = [np.array([[vertex_ids[vertex] for vertex in face] for face in snapshot["faces"]], dtype=np.uint32).reshape(-1, 3) for snapshot in snapshots]
+    return vertex_ids, levels
+
+def write_lod_obj(file_name: str, vertices: Dict[str, Tuple[float, float, float]], snapshots: List[Dict[str, Any]], preserved_headers: List[str]):
+    _, levels = _index_snapshots(vertices, snapshots)
+
+    lines = [
+        f"# LOD_V1_LEVELS {len(snapshots)}",
+        "# Preserved Headers",
+        *preserved_headers,
+        "",
+        "# Shared Vertices"
+    ]
+
+    lines.extend(f"v {x} {y} {z}" for x, y, z in vertices.values())
+
+    for level, (snapshot, faces) in enumerate(zip(snapshots, levels)):
+        lines.append("")
+        lines.append(f"# target {snapshot['target']} polygons {snapshot['polygons']}")
+        lines.append(f"o lod{level}")
+        # .obj indices are 1-based
+        lines.extend(f"f {a + 1} {b + 1} {c + 1}" for a, b, c in faces.tolist())
+
+    with open(file_name, "w+") as fp:
+        for line in lines:
+            fp.write(f"{line}\n")
+
+def write_lod_binary(file_name: str, vertices: Dict[str, Tuple[float, float, float]], snapshots: List[Dict[str, Any]]):
+    _, levels = _index_snapshots(vertices, snapshots)
+
+    level_table = np.zeros(len(snapshots), dtype=LOD_LEVEL_DTYPE)
+    offset = 0
+
+    for row, snapshot, faces in zip(level_table, snapshots, levels):
+        row["target"] = snapshot["target"]
+        row["face_offset"] = offset
+        row["face_count"] = len(faces)
+        offset += len(faces)
+
+    header = np.zeros(1, dtype=LOD_HEADER_DTYPE)
+    header["magic"] = LOD_MAGIC
+    header["version"] = LOD_VERSION
+    header["vertex_count"] = len(vertices)
+    header["level_count"] = len(snapshots)
+
+    temporary_name = f"{file_name}.tmp"
+
+    with open(temporary_name, "wb") as fp:
+        fp.write(header.tobytes())
+        fp.write(level_table.tobytes())
+        fp.write(np.array(list(vertices.values()), dtype="<f4").reshape(-1, 3).tobytes())
+
+        for faces in levels:
+            fp.write(faces.astype("<u4").tobytes())
+
+    os.replace(temporary_name, file_name)
+
+LOD_WRITERS = {
+    "obj": write_lod_obj,
+    "binary": write_lod_binary
+}
@@ -1,12 +1,19 @@
-from typing import List, Tuple, Dict, Any, Optional, Callable
+from typing import List, Tuple, Dict, Any, Optional, Callable, Set
 
 import time
 import json
 
-from vertex_graph import VertexGraph
+from vertex_graph import VertexGraph, graph_from_arrays
+from array_vertex_graph import ArrayVertexGraph
+from collapse_engines import create_collapse_engine
+from progressive_binary import ProgressiveBinary, write_progressive_binary
+from lod_export import LOD_WRITERS
+from reduction_checkpoint import read_reduction_checkpoint, write_reduction_checkpoint
+from reduction_trace import NULL_TRACER
 
 class OBJModel:
     def __init__(self, file_name: str, graph: VertexGraph, preserved_headers: List[str], reduction_records, original_index_map):
+        self.file_name = file_name
         self.isolated_name = '.'.join(file_name.split(".")[:-1])
         self.graph = graph
         self.preserved_headers = preserved_headers
@@ -14,87 +21,209 @@ class OBJModel:
         self.already_reduced = len(reduction_records) > 0
         self.original_index_map = original_index_map
         self.already_reproduced = False
+        self.lod_vertices: Dict[str, Tuple[float, float, float]] = {}
+        self.lod_snapshots: List[Dict[str, Any]] = []
+        # Set by load_reduction_checkpoint, consumed by the next reduce
+        self.resume_state: Optional[Dict[str, Any]] = None
 
-        self.maximum_vertices = len(self.graph.indices)
-        self.maximum_polygons = len(self.graph.compute_all_polygons())
+        self.maximum_vertices = self.graph.vertex_count()
+        self.maximum_polygons = self.graph.polygon_count()
 
     def write(self, include_reduction_record: bool) -> str:
         return write_obj_file(self, include_reduction_record)
 
-    def reduce(self, iterations: Optional[int], stopping_condition: Optional[Callable[[int, int], bool]], verbose: bool = False):
+    def reduce(self, iterations: Optional[int], stopping_condition: Optional[Callable[[int, int], bool]], verbose: bool = False, engine: str = "queue", lod_targets: Optional[List[int]] = None,
+               checkpoint: Optional[str] = None, checkpoint_every: Optional[int] = None, checkpoint_seconds: Optional[float] = None, tracer=None,
+               locked: Optional[Set[str]] = None, records: Optional[List[Dict[str, Any]]] = None):
         """
         1. Identify edge to collapse
         2. Find all polygons from each point on the edge and save them
         3. Collapse the edge
         4. Repeat
+
+        engine selects how the edge is identified (see collapse_engines.py)
+        "queue" only rescores the edges around each merged vertex, "exhaustive" rescans the whole graph
+        and "batched" rescans it with a single vectorised scoring pass
+
+        lod_targets is a list of polygon counts, the mesh is snapshotted into lod_snapshots the first time
+        it has at most each count so every level of detail comes out of one pass (see write_lods)
+        Without iterations or a stopping condition the reduction stops once the smallest target is reached
+
+        checkpoint is a file the progress is written to every checkpoint_every iterations and / or checkpoint_seconds seconds
+        (see reduction_checkpoint.py), a model from load_reduction_checkpoint continues from where it was written when
+        reduce is called again with the same iterations and stopping condition
+
+        tracer receives the time spent in each phase of every iteration (see reduction_trace.py) and is closed on return
+
+        locked vertices are never collapsed, edges touching them are left out of the search
+
+        records continues an earlier reduction of the same graph: the new records are appended to a copy of them and
+        numbered after them, and iterations counts them as well (tiled_decimation.py continues from the tile records)
         """
 
-        assert iterations is not None or stopping_condition is not None
+        tracer = tracer if tracer is not None else NULL_TRACER
 
-        reduction_records = []
+        assert checkpoint is None or checkpoint_every is not None or checkpoint_seconds is not None, "Checkpoints need checkpoint_every or checkpoint_seconds"
 
-        i = 0
-        while True:
-            i += 1
-            
-            if verbose:
-                print(f"===Iteration {i + 1}===")
-                print(f"Polygons: {len(self.graph.compute_all_polygons())}")
-
-            # Use quadric error
-            res = self.graph.determine_preferred_collapsible_edge()
-
-            if not res:
-                break
-
-            x, y = res
-
-            # Collapse and record
-            x_coords, y_coords = self.graph.index_data[x].coords, self.graph.index_data[y].coords
-            x_polygons = set([tuple(z["polygon"]) for z in self.graph.compute_polygons(x).values()])
-            y_polygons = set([tuple(z["polygon"]) for z in self.graph.compute_polygons(y).values()])
-            polygons = x_polygons | y_polygons
-            new_point = self.graph.collapse_edge(x, y)
-
-            reduction_records.append({
-                "i": i,
-                "mName": new_point,
-                "xName": x,
-                "xCoords": x_coords,
-                "yName": y,
-                "yCoords": y_coords,
-                "polygons": list(polygons)
-            })
+        if self.resume_state is not None:
+            # The engine and level of detail targets come from the checkpoint, it continues from the records it stored
+            assert records is None, "A model loaded from a checkpoint continues from its own records"
+
+            state = self.resume_state
+            self.resume_state = None
+            engine = state["engine"]
+            lod_targets = state["lod_targets"]
+            pending_targets = state["pending_targets"]
+            locked = set(state["locked"]) if state["locked"] is not None else None
+            records = self.reduction_records
+            collapse_engine = create_collapse_engine(engine, self.graph, state["engine_state"], tracer, locked)
+        else:
+            collapse_engine = create_collapse_engine(engine, self.graph, tracer=tracer, locked=locked)
+            pending_targets = sorted(lod_targets if lod_targets is not None else [], reverse=True)
+
+        reduction_records = list(records) if records is not None else []
+        i = len(reduction_records)
+
+        assert iterations is not None or stopping_condition is not None or lod_targets is not None
+
+        last_checkpoint = (i, time.time())
+
+        try:
+            while True:
+                with tracer.phase("lod_snapshot"):
+                    self._take_lod_snapshots(pending_targets, force=False)
 
-            if iterations is not None:
-                if i == iterations:
-                    print("Iteration condition reached")
+                if lod_targets is not None and len(pending_targets) == 0 and iterations is None and stopping_condition is None:
+                    print("Level of detail targets reached")
                     break
 
-            if stopping_condition is not None:
-                total_polygons = len(self.graph.compute_all_polygons())
-                if stopping_condition(i, total_polygons):
-                    print("Stopping condition reached")
+                # Checked before collapsing so a mesh that already meets them, or a resumed reduction that had finished, is left as it is
+                if iterations is not None:
+                    if i >= iterations:
+                        print("Iteration condition reached")
+                        break
+
+                if stopping_condition is not None:
+                    total_polygons = self.graph.polygon_count()
+                    if stopping_condition(i, total_polygons):
+                        print("Stopping condition reached")
+                        break
+
+                i += 1
+            
+                if verbose:
+                    print(f"===Iteration {i + 1}===")
+                    print(f"Polygons: {self.graph.polygon_count()}")
+
+                # Use quadric error
+                res = collapse_engine.next_edge()
+
+                if not res:
+                    # Nothing left to collapse so the remaining levels get the coarsest mesh possible
+                    self._take_lod_snapshots(pending_targets, force=True)
                     break
 
-        self.reduction_records = reduction_records
+                x, y = res
+
+                # Collapse and record
+                with tracer.phase("record_construction"):
+                    x_coords, y_coords = self.graph.get_coords(x), self.graph.get_coords(y)
+                    x_polygons = set([tuple(z["polygon"]) for z in self.graph.compute_polygons(x).values()])
+                    y_polygons = set([tuple(z["polygon"]) for z in self.graph.compute_polygons(y).values()])
+                    polygons = x_polygons | y_polygons
+
+                with tracer.phase("collapse"):
+                    new_point = self.graph.collapse_edge(x, y)
+
+                collapse_engine.notify_collapse(x, y, new_point)
+
+                reduction_records.append({
+                    "i": i,
+                    "mName": new_point,
+                    "xName": x,
+                    "xCoords": x_coords,
+                    "yName": y,
+                    "yCoords": y_coords,
+                    # Sorted so records and the files written from them do not depend on set order
+                    "polygons": sorted(polygons)
+                })
+
+                tracer.iteration(i, self.graph)
+
+                if checkpoint is not None:
+                    due = checkpoint_every is not None and i - last_checkpoint[0] >= checkpoint_every
+                    due |= checkpoint_seconds is not None and time.time() - last_checkpoint[1] >= checkpoint_seconds
+
+                    if due:
+                        with tracer.phase("checkpoint"):
+                            self._write_checkpoint(checkpoint, reduction_records, i, engine, collapse_engine, pending_targets, lod_targets, locked)
+
+                        last_checkpoint = (i, time.time())
+
+        finally:
+            # Also on an error or interrupt, the records then still match the collapses applied to the graph
+            self.reduction_records = reduction_records
+            tracer.close()
+
+    def _write_checkpoint(self, file_name: str, reduction_records, i: int, engine: str, collapse_engine, pending_targets: List[int], lod_targets: Optional[List[int]], locked: Optional[Set[str]]):
+        write_reduction_checkpoint(file_name, self.graph, reduction_records, collapse_engine.export_state(), {
+            "file_name": self.file_name,
+            "backend": next(name for name, backend in GRAPH_BACKENDS.items() if type(self.graph) is backend),
+            "iteration": i,
+            "engine": engine,
+            "pending_targets": pending_targets,
+            "lod_targets": lod_targets,
+            "locked": sorted(locked) if locked is not None else None,
+            "midpoint_prefix": self.graph.midpoint_prefix,
+            "maximum_vertices": self.maximum_vertices,
+            "maximum_polygons": self.maximum_polygons,
+            "preserved_headers": self.preserved_headers,
+            "original_index_map": list(self.original_index_map.items()),
+            "lod_vertices": list(self.lod_vertices.items()),
+            "lod_snapshots": self.lod_snapshots
+        })
+
+    def _take_lod_snapshots(self, pending_targets: List[int], force: bool):
+        # pending_targets is sorted from the most to the least detailed and consumed as targets are crossed
+        if len(pending_targets) == 0:
+            return
+
+        polygons = self.graph.polygon_count()
+
+        if not force and polygons > pending_targets[0]:
+            return
+
+        faces = [self.graph.get_face(face_id) for face_id in self.graph.face_ids()]
+
+        # Vertices are stored once no matter how many levels use them
+        for face in faces:
+            for vertex in face:
+                if vertex not in self.lod_vertices:
+                    self.lod_vertices[vertex] = self.graph.get_coords(vertex)
+
+        while len(pending_targets) > 0 and (force or polygons <= pending_targets[0]):
+            self.lod_snapshots.append({
+                "target": pending_targets.pop(0),
+                "polygons": polygons,
+                "faces": faces
+            })
+
+    def write_lods(self, save: str, format: str = "obj"):
+        # Writes every snapshot taken by reduce(lod_targets=...) into one file with a shared vertex buffer
+        assert len(self.lod_snapshots) > 0, "No level of detail snapshots, call reduce with lod_targets first"
+        assert format in LOD_WRITERS.keys(), f"Unknown level of detail format {format}, expected one of {list(LOD_WRITERS.keys())}"
+
+        # Only the OBJ output has somewhere to keep the preserved headers
+        options = {"preserved_headers": self.preserved_headers} if format == "obj" else {}
+        LOD_WRITERS[format](save, self.lod_vertices, self.lod_snapshots, **options)
     
     def reproduce(self):
+        # Undoes every collapse written by reduce, see replay_engine.py to stop at an intermediate level of detail
         assert len(self.reduction_records) > 0
 
         # Go in reverse order
         for record in self.reduction_records[::-1]:
-            vertex_name = record["n"]
-
-            a_name = record["l"]
-            a_coords = record["lc"]
-            a_neighbours = record["ln"]
-
-            b_name = record["r"]
-            b_coords = record["rc"]
-            b_neighbours = record["rn"]
-
-            self.graph.split_vertex(vertex_name, a_name, a_coords, a_neighbours, b_name, b_coords, b_neighbours)
+            apply_vertex_split(self.graph, record)
         
         self.already_reproduced = True
         self.reduction_records = []
@@ -112,10 +241,10 @@ class OBJModel:
 
         vertices = []
 
-        for real_index, index in enumerate(self.graph.indices):
+        for real_index, index in enumerate(self.graph.vertex_names()):
             vertices.append({
                 "name": index,
-                "coords": self.graph.index_data[index].coords
+                "coords": self.graph.get_coords(index)
             })
 
             real_index_map[index] = real_index
@@ -139,14 +268,53 @@ class OBJModel:
             with open(save, "w+") as fp:
                 json.dump(geometry_data, fp, indent=indent)
 
-def process_obj_file(file_name: str) -> OBJModel:
-    graph = VertexGraph()
+    def to_binary(self, save, position_bits: int = 0):
+        # Compact alternative to to_json, see progressive_binary.py for the layout
+        # position_bits 16 quantises the positions to the bounding box for a smaller file
+        vertex_names = self.graph.vertex_names()
+        faces = [self.graph.get_face(face_id) for face_id in self.graph.face_ids()]
+
+        write_progressive_binary(
+            save,
+            vertex_names,
+            self.graph.gather_coords(vertex_names),
+            faces,
+            self.reduction_records,
+            {
+                "vertices": self.maximum_vertices,
+                "polygons": self.maximum_polygons
+            },
+            position_bits
+        )
+
+def apply_vertex_split(graph: VertexGraph, record: Dict[str, Any]):
+    # Undo a single collapse written by OBJModel.reduce
+    # The neighbours of each restored vertex are every vertex it shares a recorded polygon with
+    x_name, y_name = record["xName"], record["yName"]
+    polygons = [tuple(polygon) for polygon in record["polygons"]]
+
+    # The collapsed edge is restored even if the pair shared no polygon
+    x_neighbours = ({vertex for polygon in polygons if x_name in polygon for vertex in polygon} | {y_name}) - {x_name}
+    y_neighbours = ({vertex for polygon in polygons if y_name in polygon for vertex in polygon} | {x_name}) - {y_name}
+
+    graph.split_vertex(record["mName"], x_name, tuple(record["xCoords"]), x_neighbours, y_name, tuple(record["yCoords"]), y_neighbours, polygons=polygons)
+
+# "dict" is the original VertexGraph, "array" stores the mesh in NumPy arrays for large models
+GRAPH_BACKENDS = {
+    "dict": VertexGraph,
+    "array": ArrayVertexGraph
+}
+
+def process_obj_file(file_name: str, backend: str = "dict") -> OBJModel:
+    assert backend in GRAPH_BACKENDS.keys(), f"Unknown graph backend {backend}, expected one of {list(GRAPH_BACKENDS.keys())}"
+
+    graph = GRAPH_BACKENDS[backend]()
     preserved_headers = []
     reduction_records = []
     original_index_map = {}
 
     def process_vertex(arguments):
-        node_index = len(graph.indices) + 1
+        node_index = graph.vertex_count() + 1
 
         if len(original_index_map.keys()) > 0:
             node_index = original_index_map[node_index]
@@ -180,9 +348,7 @@ def process_obj_file(file_name: str) -> OBJModel:
             b = str(b)
             c = str(c)
 
-        graph.add_edge(a, b)
-        graph.add_edge(a, c)
-        graph.add_edge(b, c)
+        graph.add_face(a, b, c)
 
     def process_line(arguments):
         assert False, "Not handling line"
@@ -238,7 +404,52 @@ def process_obj_file(file_name: str) -> OBJModel:
     
     return OBJModel(file_name, graph, preserved_headers, reduction_records, original_index_map)
 
-def write_obj_file(obj_model: OBJModel, write_reduction_records: bool) -> str:
+def load_binary_model(file_name: str, backend: str = "array") -> OBJModel:
+    assert backend in GRAPH_BACKENDS.keys(), f"Unknown graph backend {backend}, expected one of {list(GRAPH_BACKENDS.keys())}"
+
+    container = ProgressiveBinary(file_name)
+    vertex_names = container.vertex_names()
+
+    graph = GRAPH_BACKENDS[backend]()
+    graph.add_mesh(vertex_names, container.positions(container.vertices), container.faces)
+
+    model = OBJModel(file_name, graph, [], container.reduction_records(), {})
+    model.maximum_vertices = container.maximums["vertices"]
+    model.maximum_polygons = container.maximums["polygons"]
+
+    return model
+
+def load_reduction_checkpoint(file_name: str) -> OBJModel:
+    # Rebuilds the model as it was when the checkpoint was written, call reduce on it to continue
+    checkpoint = read_reduction_checkpoint(file_name)
+    meta = checkpoint["meta"]
+    # reduce numbers the records it continues from after the stored ones
+    assert meta["iteration"] == len(checkpoint["records"]), f"Checkpoint written at iteration {meta['iteration']} holds {len(checkpoint['records'])} records"
+
+    graph = graph_from_arrays(GRAPH_BACKENDS[meta["backend"]], checkpoint)
+
+    for name, quadric in checkpoint["quadrics"].items():
+        graph.set_quadric(name, quadric)
+
+    graph.m_count = meta["m_count"]
+    graph.midpoint_prefix = meta["midpoint_prefix"]
+
+    model = OBJModel(meta["file_name"], graph, meta["preserved_headers"], checkpoint["records"], {int(key): value for key, value in meta["original_index_map"]})
+    model.maximum_vertices = meta["maximum_vertices"]
+    model.maximum_polygons = meta["maximum_polygons"]
+    model.lod_vertices = {name: tuple(coords) for name, coords in meta["lod_vertices"]}
+    model.lod_snapshots = meta["lod_snapshots"]
+    model.resume_state = {
+        "engine": meta["engine"],
+        "engine_state": checkpoint["engine_state"],
+        "pending_targets": meta["pending_targets"],
+        "lod_targets": meta["lod_targets"],
+        "locked": meta["locked"]
+    }
+
+    return model
+
+def write_obj_file(obj_model: OBJModel, write_reduction_records: bool, file_name: Optional[str] = None) -> str:
     # Write to a valid .obj file and include the reduction data in a comment for parsing
     
     current_time = time.time()
@@ -260,8 +471,8 @@ def write_obj_file(obj_model: OBJModel, write_reduction_records: bool) -> str:
     real_index_map = {}
     save_index_order = []
 
-    for real_index, index in enumerate(obj_model.graph.indices, 1):
-        x, y, z = obj_model.graph.index_data[index].coords
+    for real_index, index in enumerate(obj_model.graph.vertex_names(), 1):
+        x, y, z = obj_model.graph.get_coords(index)
         lines.append(f"v {x} {y} {z}")
         real_index_map[index] = real_index
         save_index_order.append(index)
@@ -296,7 +507,10 @@ def write_obj_file(obj_model: OBJModel, write_reduction_records: bool) -> str:
 
         lines.append(f"# REDUCTION_DATA {json.dumps(obj_model.reduction_records, separators=(',', ':'))}")
 
-    new_file_name = f"{obj_model.isolated_name}_reduced_{current_time}{'.rr' if write_reduction_records else ''}.obj"
+    new_file_name = file_name
+
+    if new_file_name is None:
+        new_file_name = f"{obj_model.isolated_name}_reduced_{current_time}{'.rr' if write_reduction_records else ''}.obj"
 
     with open(new_file_name, "w+") as fp:
         for line in lines:
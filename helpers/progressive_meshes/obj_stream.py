@@ -0,0 +1,268 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import json
+import os
+import re
+
+import numpy as np
+
+from obj_model import OBJModel, GRAPH_BACKENDS
+
+"""
+Streaming alternative to process_obj_file for large meshes
+The file is read in fixed size chunks, v and f records are parsed in bulk into growable arrays
+and the graph is built in a single add_mesh call once the whole file has been read
+Unlike process_obj_file any whitespace separates arguments and negative (relative) face indices are supported
+A malformed v or f record raises a ValueError naming its line instead of misaligning the arrays that follow
+"""
+
+# Drops the texture and normal parts of a face corner, e.g. 12/4/7 -> 12
+FACE_CORNER_SUFFIX = re.compile(rb"/\S*")
+
+class GrowableArray:
+    # Preallocated buffer of fixed width rows that doubles when full
+    def __init__(self, capacity: int, width: int, dtype):
+        self.data = np.empty((max(capacity, 1), width), dtype=dtype)
+        self.length = 0
+
+    def extend(self, rows: np.ndarray):
+        required = self.length + len(rows)
+
+        if required > len(self.data):
+            capacity = len(self.data)
+
+            while capacity < required:
+                capacity *= 2
+
+            grown = np.empty((capacity, self.data.shape[1]), dtype=self.data.dtype)
+            grown[:self.length] = self.data[:self.length]
+            self.data = grown
+
+        self.data[self.length:required] = rows
+        self.length = required
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.length]
+
+def parse_vertex_line(line: bytes) -> List[float]:
+    # Some lines carry a w component or vertex colours, only the position is kept
+    values = line.split()[:3]
+
+    if len(values) != 3:
+        raise ValueError(f"expected 3 coordinates, found {len(values)}")
+
+    return [float(value) for value in values]
+
+def parse_face_line(line: bytes, vertices_defined: int) -> List[int]:
+    # vertices_defined is the number of vertices before the record, every corner has to name one of them
+    values = FACE_CORNER_SUFFIX.sub(b"", line).split()
+
+    if len(values) != 3:
+        raise ValueError(f"only triangles are supported, found {len(values)} corners")
+
+    indices = [int(value) for value in values]
+
+    for index in indices:
+        if not (1 <= index <= vertices_defined or -vertices_defined <= index <= -1):
+            raise ValueError(f"vertex index {index} is out of range, {vertices_defined} vertices are defined")
+
+    return indices
+
+def raise_at_bad_line(lines: List[bytes], first_line: int, prefix: bytes, parse_line, vertex_count: Optional[int] = None):
+    # Slow path once a block failed to parse, reparses line by line to report the first bad record
+    # Given vertex_count, parse_line also receives the number of vertices defined before each record
+    vertices_defined = vertex_count
+
+    for number, line in enumerate(lines, first_line):
+        if vertex_count is not None and line.startswith(b"v "):
+            vertices_defined += 1
+
+        if not line.startswith(prefix):
+            continue
+
+        try:
+            if vertex_count is None:
+                parse_line(line[len(prefix):])
+            else:
+                parse_line(line[len(prefix):], vertices_defined)
+        except ValueError as error:
+            raise ValueError(f"Line {number}: {error}: {line.decode(errors='replace').strip()}") from None
+
+    raise ValueError(f"Could not parse the {prefix.decode().strip()} records of lines {first_line} to {first_line + len(lines) - 1}")
+
+def split_records(lines: List[bytes], width: int) -> Optional[List[bytes]]:
+    # Values of lines when each has exactly width of them, None otherwise
+    # A separator token after every line lands out of place as soon as one line has too many or too few values,
+    # so the count is checked per line with a single split of the whole block
+    tokens = (b" ; ".join(lines) + b" ;").split()
+
+    if len(tokens) != (width + 1) * len(lines) or tokens[width::width + 1].count(b";") != len(lines):
+        return None
+
+    del tokens[width::width + 1]
+    return tokens
+
+def parse_vertex_block(lines: List[bytes]) -> Optional[np.ndarray]:
+    # None when the block does not parse, parse_geometry then reports the offending line
+    tokens = split_records(lines, 3)
+
+    try:
+        if tokens is not None:
+            return np.array(tokens, dtype=np.float64).reshape(-1, 3)
+
+        return np.array([parse_vertex_line(line) for line in lines], dtype=np.float64).reshape(-1, 3)
+    except ValueError:
+        return None
+
+def parse_face_block(lines: List[bytes], vertices_before: List[int]) -> Optional[np.ndarray]:
+    # vertices_before holds the number of vertices defined before each face
+    tokens = split_records([FACE_CORNER_SUFFIX.sub(b"", line) for line in lines], 3)
+
+    if tokens is None:
+        return None
+
+    try:
+        faces = np.array(tokens, dtype=np.int64).reshape(-1, 3)
+    except ValueError:
+        return None
+
+    # Negative indices are relative to the vertices defined so far, positive ones are 1-based
+    defined = np.repeat(np.array(vertices_before, dtype=np.int64)[:, None], 3, axis=1)
+    relative = faces < 0
+    faces[relative] += defined[relative] + 1
+    faces -= 1
+
+    # 0 and indices past the vertices defined so far are not vertices
+    if np.any((faces < 0) | (faces >= defined)):
+        return None
+
+    return faces
+
+def parse_geometry(lines: List[bytes], vertex_count: int, first_line: int = 1) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    # Positions and 0-based faces of the v and f records in lines, vertex_count is the number of vertices read before them
+    # and first_line the line number of lines[0] in the file, used in the error raised for a malformed record
+    vertex_lines = [line[2:] for line in lines if line.startswith(b"v ")]
+    face_lines = [line[2:] for line in lines if line.startswith(b"f ")]
+
+    positions = None
+    faces = None
+
+    if len(vertex_lines) > 0:
+        positions = parse_vertex_block(vertex_lines)
+
+        if positions is None:
+            raise_at_bad_line(lines, first_line, b"v ", parse_vertex_line)
+
+    if len(face_lines) > 0:
+        # Every index is checked against the vertices defined before its face, and relative ones are resolved with them
+        vertices_before = []
+        seen = vertex_count
+
+        for line in lines:
+            if line.startswith(b"v "):
+                seen += 1
+            elif line.startswith(b"f "):
+                vertices_before.append(seen)
+
+        faces = parse_face_block(face_lines, vertices_before)
+
+        if faces is None:
+            raise_at_bad_line(lines, first_line, b"f ", parse_face_line, vertex_count)
+
+    return positions, faces
+
+def iterate_line_blocks(file_name: str, chunk_size: int = 1 << 22) -> Iterator[List[bytes]]:
+    # Yields the lines of the file a chunk at a time, tabs become spaces
+    with open(file_name, "rb") as fp:
+        remainder = b""
+
+        while True:
+            chunk = fp.read(chunk_size)
+
+            if len(chunk) == 0:
+                break
+
+            lines = (remainder + chunk.replace(b"\t", b" ")).split(b"\n")
+            # The last line may continue in the next chunk
+            remainder = lines.pop()
+            yield lines
+
+        yield [remainder]
+
+def stream_obj_file(file_name: str, backend: str = "array", chunk_size: int = 1 << 22) -> OBJModel:
+    assert backend in GRAPH_BACKENDS.keys(), f"Unknown graph backend {backend}, expected one of {list(GRAPH_BACKENDS.keys())}"
+
+    # Rough guess of the record counts so most files never need to grow the buffers
+    file_size = os.path.getsize(file_name)
+    positions = GrowableArray(file_size // 64, 3, np.float64)
+    faces = GrowableArray(file_size // 32, 3, np.int64)
+
+    preserved_headers = []
+    reduction_records = []
+    original_index_map: Dict[int, str] = {}
+    vertex_keys = None
+    line_number = 1
+
+    def process_comment(line: bytes):
+        nonlocal reduction_records, vertex_keys
+
+        arguments = line[1:].decode().split(None, 1)
+
+        if len(arguments) < 2:
+            return
+
+        # Reduction data is stored in comments to not interfere with existing .obj
+        if arguments[0].startswith("REDUCTION_DATA"):
+            reduction_records = json.loads(arguments[1])
+        elif arguments[0] == "REDUCTION_VERTEX_KEYS":
+            vertex_keys = json.loads(arguments[1])
+
+    def process_lines(lines: List[bytes]):
+        # Split the records by type with comprehensions rather than one branchy loop per line
+        other_lines = [line.strip() for line in lines if not line.startswith((b"v ", b"f ", b"vt ", b"vn "))]
+
+        for line in other_lines:
+            if len(line) == 0:
+                continue
+
+            if line.startswith(b"#"):
+                process_comment(line)
+                continue
+
+            op_code = line.split(None, 1)[0]
+
+            assert op_code not in (b"v", b"f"), "Records must start at the beginning of a line"
+            assert op_code != b"vp", "Not handling free form"
+            assert op_code != b"l", "Not handling line"
+
+            if op_code not in (b"vt", b"vn", b"usemtl"):
+                preserved_headers.append(" ".join(line.decode().split()))
+
+        nonlocal line_number
+
+        block_positions, block_faces = parse_geometry(lines, positions.length, line_number)
+        line_number += len(lines)
+
+        if block_positions is not None:
+            positions.extend(block_positions)
+
+        if block_faces is not None:
+            faces.extend(block_faces)
+
+    for lines in iterate_line_blocks(file_name, chunk_size):
+        process_lines(lines)
+
+    vertex_count = positions.length
+
+    if vertex_keys is not None:
+        original_index_map = {i: key for i, key in enumerate(vertex_keys, 1)}
+        names = [str(key) for key in vertex_keys[:vertex_count]]
+    else:
+        names = [str(i) for i in range(1, vertex_count + 1)]
+
+    assert len(names) == vertex_count
+
+    graph = GRAPH_BACKENDS[backend]()
+    graph.add_mesh(names, positions.view(), faces.view())
+
+    return OBJModel(file_name, graph, preserved_headers, reduction_records, original_index_map)
@@ -0,0 +1,223 @@
+from typing import Any, Dict, List, Sequence
+
+import os
+
+import numpy as np
+
+"""
+Compact binary container for a progressive mesh, replacing the JSON written by OBJModel.to_json
+All values are little endian and every block starts on a 4 byte boundary so a browser can view
+it directly as typed arrays (see loadProgressiveMeshBinary in code/src/utils/progressive_mesh.ts)
+
+Name ids are uint16 when there are at most 65536 names and uint32 otherwise (header index_bytes)
+Positions are float32, or with position_bits 16 uint16 steps of scale from the header origin (about 1 / 65535
+of the bounding box, every record coordinate uses the same grid so split vertices still line up)
+
+Layout:
+1. Header (HEADER_DTYPE, 72 bytes)
+2. Vertex block: position (vertex_count, 3), vertex i is named names[i]
+3. Face block: name id (face_count, 3), in the winding stored on the graph
+4. Record columns, record_count rows each in collapse order:
+   i uint32, m / x / y name id, polygon count uint16, x coords and y coords position (record_count, 3)
+5. Record polygon block: name id (record_polygon_count, 3), record k owns the polygon_count[k] rows after those of k - 1
+6. Name table: uint32 (name_count + 1) offsets followed by the UTF-8 bytes of every name
+"""
+
+MAGIC = b"PMB2"
+VERSION = 2
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("vertex_count", "<u4"),
+    ("face_count", "<u4"),
+    ("record_count", "<u4"),
+    ("record_polygon_count", "<u4"),
+    ("name_count", "<u4"),
+    ("name_bytes", "<u4"),
+    ("max_vertices", "<u4"),
+    ("max_polygons", "<u4"),
+    ("index_bytes", "<u4"),
+    ("position_bits", "<u4"),
+    ("origin", "<f4", (3,)),
+    ("scale", "<f4", (3,))
+])
+
+INDEX_DTYPES = {
+    2: np.dtype("<u2"),
+    4: np.dtype("<u4")
+}
+
+POSITION_DTYPES = {
+    0: np.dtype("<f4"),
+    16: np.dtype("<u2")
+}
+
+def _padding(size: int) -> int:
+    return -size % 4
+
+class ProgressiveBinary:
+    # Memory-mapped view of a container, the blocks are only read from disk when accessed
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.header = np.fromfile(file_name, dtype=HEADER_DTYPE, count=1)[0]
+
+        assert self.header["magic"] == MAGIC, f"{file_name} is not a progressive mesh binary"
+        assert self.header["version"] == VERSION, f"Unsupported progressive mesh binary version {self.header['version']}"
+
+        index = INDEX_DTYPES[int(self.header["index_bytes"])]
+        position = POSITION_DTYPES[int(self.header["position_bits"])]
+        record_count = int(self.header["record_count"])
+
+        offset = HEADER_DTYPE.itemsize
+        self.vertices, offset = self._map(position, (int(self.header["vertex_count"]), 3), offset)
+        self.faces, offset = self._map(index, (int(self.header["face_count"]), 3), offset)
+        self.record_i, offset = self._map("<u4", (record_count,), offset)
+        self.record_names, offset = self._map(index, (3, record_count), offset)
+        self.polygon_counts, offset = self._map("<u2", (record_count,), offset)
+        self.record_coords, offset = self._map(position, (2, record_count, 3), offset)
+        self.record_polygons, offset = self._map(index, (int(self.header["record_polygon_count"]), 3), offset)
+        self.name_offsets, offset = self._map("<u4", (int(self.header["name_count"]) + 1,), offset)
+        name_bytes, _ = self._map("u1", (int(self.header["name_bytes"]),), offset)
+
+        data = name_bytes.tobytes()
+        self.names = [data[start:end].decode() for start, end in zip(self.name_offsets[:-1].tolist(), self.name_offsets[1:].tolist())]
+
+    def _map(self, dtype, shape, offset):
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+
+        # np.memmap cannot map an empty block
+        if size == 0:
+            return np.zeros(shape, dtype=dtype), offset
+
+        return np.memmap(self.file_name, dtype=dtype, mode="r", offset=offset, shape=shape), offset + size + _padding(size)
+
+    def positions(self, block) -> np.ndarray:
+        # float64 coordinates of a vertex or record coordinate block
+        if int(self.header["position_bits"]) == 0:
+            return np.asarray(block, dtype=np.float64)
+
+        return self.header["origin"].astype(np.float64) + np.asarray(block, dtype=np.float64) * self.header["scale"].astype(np.float64)
+
+    @property
+    def maximums(self):
+        return {
+            "vertices": int(self.header["max_vertices"]),
+            "polygons": int(self.header["max_polygons"])
+        }
+
+    def vertex_names(self) -> List[str]:
+        return self.names[:int(self.header["vertex_count"])]
+
+    def reduction_records(self) -> List[Dict[str, Any]]:
+        # Rebuild the dictionaries produced by OBJModel.reduce
+        records = []
+        starts = np.concatenate(([0], np.cumsum(self.polygon_counts, dtype=np.int64))).tolist()
+        x_coords, y_coords = self.positions(self.record_coords[0]).tolist(), self.positions(self.record_coords[1]).tolist()
+        polygons = [tuple(self.names[name_id] for name_id in polygon) for polygon in self.record_polygons.tolist()]
+
+        for k, (i, m, x, y) in enumerate(zip(self.record_i.tolist(), *self.record_names.tolist())):
+            records.append({
+                "i": i,
+                "mName": self.names[m],
+                "xName": self.names[x],
+                "xCoords": tuple(x_coords[k]),
+                "yName": self.names[y],
+                "yCoords": tuple(y_coords[k]),
+                "polygons": polygons[starts[k]:starts[k + 1]]
+            })
+
+        return records
+
+def quantise_positions(blocks: List[np.ndarray], position_bits: int):
+    # Shared grid for every block, returns the encoded blocks, origin and scale
+    if position_bits == 0:
+        return [block.astype("<f4") for block in blocks], np.zeros(3), np.ones(3)
+
+    points = np.concatenate([block.reshape(-1, 3) for block in blocks])
+    origin = points.min(axis=0) if len(points) > 0 else np.zeros(3)
+    extent = points.max(axis=0) - origin if len(points) > 0 else np.zeros(3)
+    steps = (1 << position_bits) - 1
+    scale = np.where(extent > 0, extent / steps, 1.0)
+
+    return [np.clip(np.rint((block - origin) / scale), 0, steps).astype("<u2") for block in blocks], origin, scale
+
+def write_progressive_binary(file_name: str, vertex_names: Sequence[str], vertices, faces: Sequence[Sequence[str]], reduction_records: List[Dict[str, Any]], maximums: Dict[str, int], position_bits: int = 0):
+    assert position_bits in POSITION_DTYPES.keys(), f"Unsupported position bits {position_bits}, expected one of {list(POSITION_DTYPES.keys())}"
+
+    name_ids: Dict[str, int] = {}
+    names: List[str] = []
+
+    def name_id(name):
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+
+        return name_ids[name]
+
+    # The first vertex_count names line up with the vertex block
+    for name in vertex_names:
+        name_id(name)
+
+    face_ids = [[name_id(vertex) for vertex in face] for face in faces]
+    record_names = [[name_id(record["mName"]) for record in reduction_records], [name_id(record["xName"]) for record in reduction_records], [name_id(record["yName"]) for record in reduction_records]]
+    polygon_ids = [[name_id(vertex) for vertex in polygon] for record in reduction_records for polygon in record["polygons"]]
+    polygon_counts = [len(record["polygons"]) for record in reduction_records]
+
+    assert max(polygon_counts, default=0) <= 0xFFFF, "A record has more polygons than a uint16 polygon count can hold"
+
+    # The id width is only known once every name has been seen
+    index_bytes = 2 if len(names) <= 0x10000 else 4
+    index = INDEX_DTYPES[index_bytes]
+
+    (vertex_block, x_block, y_block), origin, scale = quantise_positions([
+        np.asarray(vertices, dtype=np.float64).reshape(-1, 3),
+        np.array([record["xCoords"] for record in reduction_records], dtype=np.float64).reshape(-1, 3),
+        np.array([record["yCoords"] for record in reduction_records], dtype=np.float64).reshape(-1, 3)
+    ], position_bits)
+
+    encoded_names = [name.encode() for name in names]
+    name_offsets = np.zeros(len(names) + 1, dtype="<u4")
+    name_offsets[1:] = np.cumsum([len(name) for name in encoded_names])
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["vertex_count"] = len(vertex_names)
+    header["face_count"] = len(face_ids)
+    header["record_count"] = len(reduction_records)
+    header["record_polygon_count"] = len(polygon_ids)
+    header["name_count"] = len(names)
+    header["name_bytes"] = name_offsets[-1]
+    header["max_vertices"] = maximums["vertices"]
+    header["max_polygons"] = maximums["polygons"]
+    header["index_bytes"] = index_bytes
+    header["position_bits"] = position_bits
+    header["origin"] = origin
+    header["scale"] = scale
+
+    blocks = [
+        vertex_block,
+        np.array(face_ids, dtype=index).reshape(-1, 3),
+        np.array([record["i"] for record in reduction_records], dtype="<u4"),
+        np.array(record_names, dtype=index).reshape(3, -1),
+        np.array(polygon_counts, dtype="<u2"),
+        np.stack([x_block, y_block]),
+        np.array(polygon_ids, dtype=index).reshape(-1, 3),
+        name_offsets
+    ]
+
+    # Write to a temporary file first so readers never see a partial container
+    temporary_name = f"{file_name}.tmp"
+
+    with open(temporary_name, "wb") as fp:
+        fp.write(header.tobytes())
+
+        for block in blocks:
+            data = block.tobytes()
+            fp.write(data + bytes(_padding(len(data))))
+
+        fp.write(b"".join(encoded_names))
+
+    os.replace(temporary_name, file_name)
@@ -9,7 +9,7 @@ def reproduce_model(file_name):
     model = process_obj_file(file_name)
     model.reproduce()
 
-    print(f"Has {len(model.graph.compute_all_polygons())} polygons")
+    print(f"Has {model.graph.polygon_count()} polygons")
 
     new_file_name = model.write(include_reduction_record=False)
     print(f"Written file to {new_file_name}")
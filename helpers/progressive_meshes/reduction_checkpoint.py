@@ -0,0 +1,71 @@
+from typing import Any, Dict, List
+
+import json
+import os
+
+import numpy as np
+
+from vertex_graph import graph_to_arrays
+
+"""
+Checkpoints of a running OBJModel.reduce, written every few iterations or seconds so an interrupted reduction can resume
+The file is a compressed .npz, written next to its destination and renamed over it so a crash never leaves a partial file
+
+Arrays:
+- names, coords (float64), faces (rows of name indices, in face order), edges: the graph (graph_to_arrays in vertex_graph.py)
+- quadric_names, quadrics: every quadric cached or merged so far, stored bit for bit as later errors depend on them
+- engine_*: the columns returned by the collapse engine's export_state
+- records, meta: the reduction records so far and the loop / model state as UTF-8 JSON
+
+load_reduction_checkpoint in obj_model.py rebuilds the model, reduce then continues from the stored iteration
+"""
+
+CHECKPOINT_VERSION = 1
+
+def _encode_json(data) -> np.ndarray:
+    return np.frombuffer(json.dumps(data, separators=(",", ":")).encode(), dtype=np.uint8)
+
+def _decode_json(array: np.ndarray):
+    return json.loads(array.tobytes().decode())
+
+def write_reduction_checkpoint(file_name: str, graph, reduction_records: List[Dict[str, Any]], engine_state: Dict[str, Any], meta: Dict[str, Any]):
+    mesh = graph_to_arrays(graph)
+    quadrics = graph.cached_quadrics()
+
+    arrays = {
+        **mesh,
+        "names": np.array(mesh["names"], dtype=str),
+        "quadric_names": np.array(list(quadrics.keys()), dtype=str),
+        "quadrics": np.array(list(quadrics.values()), dtype=np.float64).reshape(-1, 4, 4),
+        "records": _encode_json(reduction_records),
+        "meta": _encode_json({**meta, "version": CHECKPOINT_VERSION, "m_count": graph.m_count})
+    }
+
+    for key, value in engine_state.items():
+        arrays[f"engine_{key}"] = np.asarray(value)
+
+    # Rename over the previous checkpoint only once the new one is complete on disk
+    temporary = f"{file_name}.tmp"
+
+    with open(temporary, "wb") as fp:
+        np.savez_compressed(fp, **arrays)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    os.replace(temporary, file_name)
+
+def read_reduction_checkpoint(file_name: str) -> Dict[str, Any]:
+    with np.load(file_name, allow_pickle=False) as data:
+        meta = _decode_json(data["meta"])
+        assert meta["version"] == CHECKPOINT_VERSION, f"Unsupported checkpoint version {meta['version']}, expected {CHECKPOINT_VERSION}"
+
+        return {
+            "names": data["names"].tolist(),
+            "coords": data["coords"],
+            "faces": data["faces"],
+            "edges": data["edges"],
+            "quadrics": dict(zip(data["quadric_names"].tolist(), data["quadrics"])),
+            "records": _decode_json(data["records"]),
+            "engine_state": {key[len("engine_"):]: data[key] for key in data.files if key.startswith("engine_")},
+            "meta": meta
+        }
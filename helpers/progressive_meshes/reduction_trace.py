@@ -0,0 +1,218 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from collections import defaultdict
+import json
+import time
+
+"""
+Instrumentation for OBJModel.reduce and the collapse engines, pass a tracer as reduce(..., tracer=...)
+
+Phases:
+- quadric_build: seeding the per vertex quadrics when the engine is created
+- edge_enumeration: listing the candidate edges (initial queue fill, every full rescan)
+- queue_pop: popping the queue until an entry with current stamps comes up
+- scoring: quadric errors of candidate edges, including rescoring the edges around a merged vertex
+- record_construction: gathering the coordinates and polygons of the reduction record
+- collapse: graph.collapse_edge
+- lod_snapshot, checkpoint: the optional outputs of reduce
+Counters: edges_scored, stale_entries
+
+Observers are callables taking one event dictionary, times are seconds since the tracer was created:
+- {"event": "phase", "name", "iteration", "start", "duration"}, only sent when the tracer has phase_events
+- {"event": "iteration", "iteration", "polygons", "vertices", "elapsed", "phases": {name: seconds this iteration}}
+- {"event": "summary", "iterations", "elapsed", "phases": {name: {"calls", "total"}}, "counters"}
+
+reduce defaults to NULL_TRACER whose hooks do nothing, costing a method call per phase and no clock reads
+A tracer covers one reduce call, reduce closes it (and every observer with a close method) when it returns
+
+Example:
+    tracer = create_tracer("chair.trace.json", "chrome")
+    model.reduce(None, lambda i, polygons: polygons <= 300, tracer=tracer)
+    print(tracer.summary())
+"""
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+NULL_PHASE = _NullPhase()
+
+class NullTracer:
+    enabled = False
+
+    def phase(self, name: str):
+        return NULL_PHASE
+
+    def count(self, name: str, amount: int = 1):
+        return
+
+    def iteration(self, i: int, graph):
+        return
+
+    def close(self):
+        return
+
+NULL_TRACER = NullTracer()
+
+class _Phase:
+    __slots__ = ["tracer", "name", "start"]
+
+    def __init__(self, tracer: "ReductionTracer", name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.tracer._record_phase(self.name, self.start, time.perf_counter())
+        return False
+
+class ReductionTracer:
+    enabled = True
+
+    def __init__(self, observers: Optional[List[Callable[[Dict[str, Any]], None]]] = None, phase_events: bool = False):
+        self.observers = list(observers or [])
+        self.phase_events = phase_events
+        self.origin = time.perf_counter()
+        self.current_iteration = 0
+        self.iterations = 0
+
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.iteration_phases: Dict[str, float] = defaultdict(float)
+
+    def _emit(self, event: Dict[str, Any]):
+        for observer in self.observers:
+            observer(event)
+
+    def _record_phase(self, name: str, start: float, end: float):
+        duration = end - start
+        self.totals[name] += duration
+        self.calls[name] += 1
+        self.iteration_phases[name] += duration
+
+        if self.phase_events:
+            self._emit({
+                "event": "phase",
+                "name": name,
+                "iteration": self.current_iteration,
+                "start": start - self.origin,
+                "duration": duration
+            })
+
+    def phase(self, name: str):
+        return _Phase(self, name)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def iteration(self, i: int, graph):
+        # Called by reduce once an iteration is complete, the phases timed so far belong to it
+        self._emit({
+            "event": "iteration",
+            "iteration": i,
+            "polygons": graph.polygon_count(),
+            "vertices": graph.vertex_count(),
+            "elapsed": time.perf_counter() - self.origin,
+            "phases": dict(self.iteration_phases)
+        })
+
+        self.iterations += 1
+        self.current_iteration = i + 1
+        self.iteration_phases.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "event": "summary",
+            "iterations": self.iterations,
+            "elapsed": time.perf_counter() - self.origin,
+            "phases": {name: {"calls": self.calls[name], "total": total} for name, total in sorted(self.totals.items(), key=lambda item: -item[1])},
+            "counters": dict(self.counters)
+        }
+
+    def close(self):
+        self._emit(self.summary())
+
+        for observer in self.observers:
+            if hasattr(observer, "close"):
+                observer.close()
+
+class JsonLinesWriter:
+    # One JSON object per event and line, written as they arrive so a long run can be followed with tail -f
+    def __init__(self, file_name: str):
+        self.fp = open(file_name, "w")
+
+    def __call__(self, event: Dict[str, Any]):
+        self.fp.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.fp.close()
+
+class ChromeTraceWriter:
+    # Trace Event Format for chrome://tracing or Perfetto, phases become complete ("X") events on one track
+    # and the polygon / vertex counts a counter track, written once the tracer is closed
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.events: List[Dict[str, Any]] = []
+
+    def __call__(self, event: Dict[str, Any]):
+        if event["event"] == "phase":
+            self.events.append({
+                "name": event["name"],
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["duration"] * 1e6,
+                "pid": 0,
+                "tid": 0,
+                "args": {"iteration": event["iteration"]}
+            })
+        elif event["event"] == "iteration":
+            self.events.append({
+                "name": "mesh",
+                "ph": "C",
+                "ts": event["elapsed"] * 1e6,
+                "pid": 0,
+                "args": {"polygons": event["polygons"], "vertices": event["vertices"]}
+            })
+        elif event["event"] == "summary":
+            self.events.append({
+                "name": "summary",
+                "ph": "i",
+                "s": "g",
+                "ts": event["elapsed"] * 1e6,
+                "pid": 0,
+                "tid": 0,
+                "args": {"phases": event["phases"], "counters": event["counters"]}
+            })
+
+    def close(self):
+        with open(self.file_name, "w") as fp:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, fp)
+
+# Writer class and whether it needs the individual phase events
+TRACE_WRITERS = {
+    "jsonl": (JsonLinesWriter, False),
+    "chrome": (ChromeTraceWriter, True)
+}
+
+def create_tracer(file_name: Optional[str] = None, trace_format: str = "jsonl", callbacks: Optional[List[Callable[[Dict[str, Any]], None]]] = None, phase_events: bool = False):
+    # NULL_TRACER when there is nothing to report to, phase_events also sends every phase to the callbacks
+    assert trace_format in TRACE_WRITERS.keys(), f"Unknown trace format {trace_format}, expected one of {list(TRACE_WRITERS.keys())}"
+
+    observers = list(callbacks or [])
+
+    if file_name is not None:
+        writer, needs_phases = TRACE_WRITERS[trace_format]
+        observers.append(writer(file_name))
+        phase_events |= needs_phases
+
+    if len(observers) == 0:
+        return NULL_TRACER
+
+    return ReductionTracer(observers, phase_events)
@@ -0,0 +1,108 @@
+from typing import Any, Dict, List, Optional
+
+import bisect
+
+from obj_model import OBJModel, apply_vertex_split
+from vertex_graph import graph_from_arrays, graph_to_arrays
+
+"""
+Seekable replay of the reduction records written by OBJModel.reduce
+Level 0 is the fully reduced mesh and level n (n records) the original one, moving up a level applies the vertex split
+of the next record (apply_vertex_split) and moving down collapses its edge again under the recorded midpoint name,
+each step only touches the faces around the two vertices involved
+
+Building the engine replays the whole history once, recording the vertex and polygon count of every level
+(the index used by seek_polygons / seek_vertices) and a snapshot of the mesh every checkpoint_interval levels
+A seek then starts from whichever is closer to the target, the current level or the nearest snapshot
+
+Example:
+    engine = ReplayEngine.from_model(process_obj_file("chair_max.rr.obj"))
+    engine.seek_polygons(300)
+    write_obj_file(engine.model, write_reduction_records=False)
+"""
+
+class ReplayEngine:
+    def __init__(self, graph, reduction_records: List[Dict[str, Any]], checkpoint_interval: int = 64, model: Optional[OBJModel] = None):
+        # graph holds the fully reduced mesh and is driven in place until a checkpoint is restored
+        assert checkpoint_interval > 0, f"Expected a positive checkpoint interval, received {checkpoint_interval}"
+
+        self.graph = graph
+        self.model = model
+        # Refinement order, records[k] takes level k to level k + 1
+        self.records = reduction_records[::-1]
+        self.checkpoint_interval = checkpoint_interval
+        self.level = 0
+
+        self.checkpoints: Dict[int, Dict[str, Any]] = {}
+        self.polygon_counts = [graph.polygon_count()]
+        self.vertex_counts = [graph.vertex_count()]
+        self._take_checkpoint()
+
+        while self.level < len(self.records):
+            self._split()
+            self.polygon_counts.append(self.graph.polygon_count())
+            self.vertex_counts.append(self.graph.vertex_count())
+
+            if self.level % checkpoint_interval == 0 or self.level == len(self.records):
+                self._take_checkpoint()
+
+    @classmethod
+    def from_model(cls, model: OBJModel, checkpoint_interval: int = 64) -> "ReplayEngine":
+        # A model straight out of reduce or loaded from a written file, its graph follows the engine
+        assert len(model.reduction_records) > 0, "The model has no reduction records to replay"
+        return cls(model.graph, model.reduction_records, checkpoint_interval, model)
+
+    @property
+    def levels(self) -> int:
+        return len(self.records)
+
+    def _split(self):
+        apply_vertex_split(self.graph, self.records[self.level])
+        self.level += 1
+
+    def _collapse(self):
+        self.level -= 1
+        record = self.records[self.level]
+        self.graph.collapse_edge(record["xName"], record["yName"], midpoint_name=record["mName"])
+
+    def _take_checkpoint(self):
+        self.checkpoints[self.level] = graph_to_arrays(self.graph)
+
+    def _restore_checkpoint(self, level: int):
+        graph = graph_from_arrays(type(self.graph), self.checkpoints[level])
+        self.graph = graph
+        self.level = level
+
+        if self.model is not None:
+            self.model.graph = graph
+
+    def seek(self, level: int):
+        # Moves to level (clamped to [0, levels]) from the closest of the current level and the stored checkpoints
+        level = min(max(level, 0), self.levels)
+        checkpoint_levels = sorted(self.checkpoints.keys())
+        position = bisect.bisect_left(checkpoint_levels, level)
+        nearest = min(checkpoint_levels[max(position - 1, 0):position + 1], key=lambda candidate: abs(candidate - level))
+
+        if abs(nearest - level) < abs(self.level - level):
+            self._restore_checkpoint(nearest)
+
+        while self.level < level:
+            self._split()
+
+        while self.level > level:
+            self._collapse()
+
+        return self.graph
+
+    def level_for_polygons(self, polygons: int) -> int:
+        # Lowest level with at least polygons faces, the counts only grow with the level
+        return min(bisect.bisect_left(self.polygon_counts, polygons), self.levels)
+
+    def level_for_vertices(self, vertices: int) -> int:
+        return min(bisect.bisect_left(self.vertex_counts, vertices), self.levels)
+
+    def seek_polygons(self, polygons: int):
+        return self.seek(self.level_for_polygons(polygons))
+
+    def seek_vertices(self, vertices: int):
+        return self.seek(self.level_for_vertices(vertices))
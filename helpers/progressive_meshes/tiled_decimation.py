@@ -0,0 +1,230 @@
+from typing import Any, Dict, List, Optional
+
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from collapse_engines import COLLAPSE_ENGINES
+from obj_model import OBJModel, GRAPH_BACKENDS, process_obj_file, write_obj_file
+from vertex_graph import graph_from_arrays, graph_to_arrays
+
+"""
+Parallel OBJModel.reduce over spatial tiles of one mesh
+
+1. The faces are split into tiles by recursive median bisection of their centroids along the longest axis,
+   so every tile holds about the same number of faces
+2. Vertices used by faces of more than one tile are locked, each tile is reduced in its own worker process
+   with those vertices fixed, midpoints are named t<tile>_m1, t<tile>_m2, ...
+   Only the faces away from the seams are reduced by the target ratio, the seam faces are left to step 4
+   so the seams end up as coarse as the rest rather than at full resolution
+3. The reduced tiles are stitched back into one graph along the locked vertices
+4. A final reduce over the stitched graph, with nothing locked, collapses the seams down to the target,
+   this is the only serial part and it shrinks relative to the tiles as the mesh grows
+
+A vertex of a tile that is not locked only touches faces of that tile, so its quadric and the errors of its edges
+are the same as on the whole mesh and a collapse in one tile never changes the faces of another
+The tile records in tile order followed by the seam records are therefore one valid collapse sequence of the
+whole mesh and the result is read, written and replayed like any other reduction
+
+Locked vertices get the sum of their per tile quadrics, which is their quadric on the whole mesh
+
+Example: python tiled_decimation.py scan.obj --polygons 50000 --tiles 32 --workers 32 --backend array
+"""
+
+def partition_faces(centroids: np.ndarray, tiles: int) -> np.ndarray:
+    # Tile index of every face
+    labels = np.zeros(len(centroids), dtype=np.int64)
+    pending = [(np.arange(len(centroids)), 0, tiles)]
+
+    while len(pending) > 0:
+        indices, first, count = pending.pop()
+
+        if count == 1 or len(indices) == 0:
+            labels[indices] = first
+            continue
+
+        # Split the tile count in two and cut the faces in the same proportion along the longest axis
+        left_count = count // 2
+        axis = int(np.argmax(np.ptp(centroids[indices], axis=0)))
+        order = indices[np.argsort(centroids[indices, axis], kind="stable")]
+        cut = len(order) * left_count // count
+
+        pending.append((order[:cut], first, left_count))
+        pending.append((order[cut:], first + left_count, count - left_count))
+
+    return labels
+
+def decimate_tile(job: Dict[str, Any]) -> Dict[str, Any]:
+    # Reduces one tile of tiled_reduce with its border vertices locked, in a worker process
+    start = time.perf_counter()
+
+    graph = GRAPH_BACKENDS[job["backend"]]()
+    graph.add_mesh(job["names"], job["coords"], job["faces"])
+    graph.midpoint_prefix = f"t{job['tile']}_"
+
+    model = OBJModel(f"tile{job['tile']}.obj", graph, [], [], {})
+    target_polygons = job["target"]
+
+    # The collapse engine seeds every quadric, stitch_tiles sums those of the locked vertices
+    model.reduce(None, lambda iterations, polygons: polygons <= target_polygons, engine=job["engine"], locked=set(job["locked"]))
+
+    return {
+        **graph_to_arrays(graph),
+        "tile": job["tile"],
+        "records": model.reduction_records,
+        "quadrics": graph.cached_quadrics(),
+        "seconds": time.perf_counter() - start
+    }
+
+def stitch_tiles(results: List[Dict[str, Any]], backend: str):
+    # Merges the reduced tiles along their shared locked vertices, returns the graph and the merged records
+    coords = {}
+    quadrics = {}
+
+    for result in results:
+        for name, vertex_coords in zip(result["names"], result["coords"].tolist()):
+            coords[name] = vertex_coords
+
+        for name, quadric in result["quadrics"].items():
+            quadrics[name] = quadrics[name] + quadric if name in quadrics else quadric
+
+    names = list(coords.keys())
+    ids = {name: i for i, name in enumerate(names)}
+    # Local name index of every tile -> index in the stitched mesh
+    tile_ids = [np.array([ids[name] for name in result["names"]], dtype=np.int64) for result in results]
+
+    graph = graph_from_arrays(GRAPH_BACKENDS[backend], {
+        "names": names,
+        "coords": np.array([coords[name] for name in names], dtype=np.float64),
+        "faces": np.concatenate([local_ids[result["faces"]] for local_ids, result in zip(tile_ids, results)]),
+        "edges": np.concatenate([local_ids[result["edges"]] for local_ids, result in zip(tile_ids, results)])
+    })
+
+    for name, quadric in quadrics.items():
+        graph.set_quadric(name, quadric)
+
+    reduction_records = []
+
+    for result in results:
+        for record in result["records"]:
+            reduction_records.append({**record, "i": len(reduction_records) + 1})
+
+    return graph, reduction_records
+
+def tiled_reduce(model: OBJModel, target_polygons: int, tiles: Optional[int] = None, workers: Optional[int] = None, engine: str = "queue", backend: Optional[str] = None) -> Dict[str, Any]:
+    # Reduces model in place to at most target_polygons, returns the timings and collapse counts of each stage
+    assert len(model.reduction_records) == 0, "The model has already been reduced"
+    assert engine in COLLAPSE_ENGINES.keys(), f"Unknown collapse engine {engine}, expected one of {list(COLLAPSE_ENGINES.keys())}"
+
+    if backend is None:
+        backend = next(name for name, graph_type in GRAPH_BACKENDS.items() if type(model.graph) is graph_type)
+
+    assert backend in GRAPH_BACKENDS.keys(), f"Unknown graph backend {backend}, expected one of {list(GRAPH_BACKENDS.keys())}"
+
+    workers = workers if workers is not None else os.cpu_count()
+    tiles = tiles if tiles is not None else workers
+    assert tiles > 0, f"Expected a positive tile count, received {tiles}"
+
+    timings = {}
+
+    start = time.perf_counter()
+    mesh = graph_to_arrays(model.graph)
+    names = np.array(mesh["names"], dtype=object)
+    faces = mesh["faces"]
+    labels = partition_faces(mesh["coords"][faces].mean(axis=1), tiles)
+
+    # A vertex is locked when faces of two different tiles use it
+    lowest = np.full(len(names), tiles, dtype=np.int64)
+    highest = np.full(len(names), -1, dtype=np.int64)
+    np.minimum.at(lowest, faces, labels[:, None])
+    np.maximum.at(highest, faces, labels[:, None])
+    locked = (highest >= 0) & (lowest != highest)
+
+    jobs = []
+
+    for tile in range(tiles):
+        tile_faces = faces[labels == tile]
+
+        if len(tile_faces) == 0:
+            continue
+
+        used, local_faces = np.unique(tile_faces, return_inverse=True)
+        seam_faces = int(np.count_nonzero(np.any(locked[tile_faces], axis=1)))
+
+        jobs.append({
+            "tile": tile,
+            "backend": backend,
+            "engine": engine,
+            "names": names[used].tolist(),
+            "coords": mesh["coords"][used],
+            "faces": local_faces.reshape(-1, 3),
+            "locked": names[used[locked[used]]].tolist(),
+            "target": seam_faces + math.ceil((len(tile_faces) - seam_faces) * target_polygons / len(faces))
+        })
+
+    timings["partition"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+
+    if workers == 1:
+        results = [decimate_tile(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(decimate_tile, jobs))
+
+    timings["tiles"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.graph, model.reduction_records = stitch_tiles(results, backend)
+    tile_collapses = len(model.reduction_records)
+    timings["stitch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+
+    # Continues from the tile records with nothing locked
+    model.reduce(None, lambda iterations, polygons: polygons <= target_polygons, engine=engine, records=model.reduction_records)
+
+    timings["seams"] = time.perf_counter() - start
+
+    return {
+        "tiles": len(jobs),
+        "locked_vertices": int(np.count_nonzero(locked)),
+        "tile_collapses": tile_collapses,
+        "seam_collapses": len(model.reduction_records) - tile_collapses,
+        "slowest_tile": max(result["seconds"] for result in results),
+        "timings": timings
+    }
+
+def main(arguments: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Decimate one .obj file over spatial tiles in parallel")
+    parser.add_argument("input", help=".obj file to decimate")
+
+    target_group = parser.add_mutually_exclusive_group(required=True)
+    target_group.add_argument("--polygons", type=int, help="stop once the mesh has at most this many polygons")
+    target_group.add_argument("--ratio", type=float, help="stop once the mesh has at most this fraction of its polygons")
+
+    parser.add_argument("--tiles", type=int, default=None, help="number of tiles, defaults to the number of workers")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the number of CPUs")
+    parser.add_argument("--engine", default="queue", choices=list(COLLAPSE_ENGINES.keys()))
+    parser.add_argument("--backend", default="array", choices=list(GRAPH_BACKENDS.keys()))
+    parser.add_argument("--output", default=None, help="reduced .obj file, defaults to a time stamped name next to the input")
+    options = parser.parse_args(arguments)
+
+    start = time.perf_counter()
+    model = process_obj_file(options.input, backend=options.backend)
+    initial_polygons = model.graph.polygon_count()
+    target_polygons = options.polygons if options.polygons is not None else int(initial_polygons * options.ratio)
+
+    statistics = tiled_reduce(model, target_polygons, options.tiles, options.workers, options.engine, options.backend)
+    output = write_obj_file(model, write_reduction_records=True, file_name=options.output)
+
+    print(f"{initial_polygons} -> {model.graph.polygon_count()} polygons over {statistics['tiles']} tiles ({statistics['locked_vertices']} locked vertices)")
+    print(f"{statistics['tile_collapses']} tile collapses, {statistics['seam_collapses']} seam collapses, slowest tile {statistics['slowest_tile']:.2f}s")
+    print(" ".join(f"{stage} {seconds:.2f}s" for stage, seconds in statistics["timings"].items()) + f", total {time.perf_counter() - start:.2f}s, written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+from typing import List, Optional, Tuple
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from collapse_engines import COLLAPSE_ENGINES
+from obj_model import OBJModel, GRAPH_BACKENDS, write_obj_file
+from obj_stream import iterate_line_blocks, parse_geometry
+
+"""
+Out-of-core simplification by vertex clustering (Lindstrom, Out-of-Core Simplification of Large Polygonal Models, 2000)
+for meshes too large for process_obj_file / stream_obj_file
+
+1. The OBJ is parsed once, chunk by chunk, and its positions and faces are appended to raw tables in a work directory
+2. The bounding box is split into a uniform grid of cubic cells, resolution cells along its longest side
+3. The faces are read back from the memory-mapped table in blocks, every face adds its area weighted plane quadric
+   to the cells of its three corners, the quadrics live in a memory-mapped (occupied cells x 14) table
+4. Each used cell gets one representative vertex that minimises its quadric, faces whose corners fall in three
+   different cells survive with the representatives as corners, all others collapse
+
+The cell table only has rows for the cells that hold a vertex, found by a first pass over the positions, a sorted array
+of those cell ids maps a cell to its row with a binary search, so the table grows with the surface (about resolution^2
+cells) rather than with the whole grid (resolution^3)
+Only the current chunk / block, the occupied cell ids, the cell table and the output mesh are touched at once, so peak memory
+is set by resolution rather than by the input size
+The result can be written directly or turned into an OBJModel whose graph reduce() reduces further
+
+Example: python vertex_clustering.py scan.obj --resolution 256 --output scan.clustered.obj --reduce-to 20000
+"""
+
+# Cell table columns: the 10 unique entries of the symmetric 4 x 4 quadric, position sum and vertex count
+QUADRIC_COLUMNS = slice(0, 10)
+POSITION_COLUMNS = slice(10, 13)
+COUNT_COLUMN = 13
+CELL_TABLE_WIDTH = 14
+
+UPPER_TRIANGLE = np.triu_indices(4)
+
+# Eigenvalues of a cell quadric below this fraction of the largest are treated as zero (flat or straight regions)
+SINGULAR_RATIO = 1e-3
+
+class ClusteredMesh:
+    def __init__(self, positions: np.ndarray, faces: np.ndarray, statistics):
+        self.positions = positions
+        self.faces = faces
+        self.statistics = statistics
+
+    def write(self, file_name: str):
+        with open(file_name, "w") as fp:
+            fp.write(f"# Generated by vertex_clustering.py at {time.time()}\n")
+            fp.write(f"# Clustered {self.statistics['input_faces']} faces into {len(self.faces)} on a {'x'.join(map(str, self.statistics['grid']))} grid\n")
+            fp.write("".join(f"v {x} {y} {z}\n" for x, y, z in self.positions.tolist()))
+            fp.write("".join(f"f {a + 1} {b + 1} {c + 1}\n" for a, b, c in self.faces.tolist()))
+
+    def to_model(self, file_name: str, backend: str = "array") -> OBJModel:
+        # Coarse base for the edge collapse path, file_name only names the outputs of the model
+        assert backend in GRAPH_BACKENDS.keys(), f"Unknown graph backend {backend}, expected one of {list(GRAPH_BACKENDS.keys())}"
+
+        graph = GRAPH_BACKENDS[backend]()
+        graph.add_mesh([str(i) for i in range(1, len(self.positions) + 1)], self.positions, self.faces)
+
+        return OBJModel(file_name, graph, [], [], {})
+
+def spool_geometry(file_name: str, directory: str, chunk_size: int) -> Tuple[int, int, np.ndarray, np.ndarray]:
+    # Appends every position and face to raw files in directory, returns the counts and the bounding box
+    vertex_count = 0
+    face_count = 0
+    lower = np.full(3, np.inf)
+    upper = np.full(3, -np.inf)
+
+    with open(os.path.join(directory, "positions.bin"), "wb") as positions_fp, open(os.path.join(directory, "faces.bin"), "wb") as faces_fp:
+        line_number = 1
+
+        for lines in iterate_line_blocks(file_name, chunk_size):
+            positions, faces = parse_geometry(lines, vertex_count, line_number)
+            line_number += len(lines)
+
+            if positions is not None:
+                positions_fp.write(np.ascontiguousarray(positions, dtype=np.float64).tobytes())
+                lower = np.minimum(lower, positions.min(axis=0))
+                upper = np.maximum(upper, positions.max(axis=0))
+                vertex_count += len(positions)
+
+            if faces is not None:
+                faces_fp.write(np.ascontiguousarray(faces, dtype=np.int64).tobytes())
+                face_count += len(faces)
+
+    return vertex_count, face_count, lower, upper
+
+def open_table(directory: str, name: str, count: int, width: int, dtype, mode: str = "r") -> np.ndarray:
+    # np.memmap refuses empty files
+    if count == 0:
+        return np.zeros((0, width), dtype=dtype)
+
+    return np.memmap(os.path.join(directory, name), dtype=dtype, mode=mode, shape=(count, width))
+
+def reduce_rows(cells: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Sums the rows of values that share a cell, returns (unique cells, sums)
+    order = np.argsort(cells, kind="stable")
+    cells = cells[order]
+    starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+
+    return cells[starts], np.add.reduceat(values[order], starts, axis=0)
+
+def face_quadrics(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    # Area weighted plane quadrics as their 10 unique entries, degenerate faces contribute nothing
+    normals = np.cross(b - a, c - a)
+    double_areas = np.linalg.norm(normals, axis=1)
+    valid = double_areas > 0
+    unit = np.zeros_like(normals)
+    unit[valid] = normals[valid] / double_areas[valid, None]
+
+    planes = np.concatenate([unit, -np.einsum("kd,kd->k", unit, a)[:, None]], axis=1)
+    quadrics = (double_areas / 2)[:, None, None] * planes[:, :, None] * planes[:, None, :]
+
+    return quadrics[:, UPPER_TRIANGLE[0], UPPER_TRIANGLE[1]]
+
+def representatives(rows: np.ndarray, cell_lower: np.ndarray, cell_size: float) -> np.ndarray:
+    # Point minimising each cell quadric, near singular directions keep the mean of the cell vertices
+    # (truncated pseudo-inverse around the mean), the result is clamped to the cell
+    quadrics = np.zeros((len(rows), 4, 4))
+    quadrics[:, UPPER_TRIANGLE[0], UPPER_TRIANGLE[1]] = rows[:, QUADRIC_COLUMNS]
+    quadrics[:, UPPER_TRIANGLE[1], UPPER_TRIANGLE[0]] = rows[:, QUADRIC_COLUMNS]
+
+    A = quadrics[:, :3, :3]
+    b = quadrics[:, :3, 3]
+    mean = rows[:, POSITION_COLUMNS] / np.maximum(rows[:, COUNT_COLUMN:], 1)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(A)
+    kept = eigenvalues > SINGULAR_RATIO * np.maximum(eigenvalues[:, -1:], 1e-300)
+    inverse = np.where(kept, 1 / np.where(kept, eigenvalues, 1), 0)
+
+    residual = -b - np.einsum("kij,kj->ki", A, mean)
+    step = np.einsum("kij,kj,kj->ki", eigenvectors, inverse, np.einsum("kji,kj->ki", eigenvectors, residual))
+
+    return np.clip(mean + step, cell_lower, cell_lower + cell_size)
+
+def cluster_obj_file(file_name: str, resolution: int = 128, block_size: int = 1 << 20, chunk_size: int = 1 << 22, work_directory: Optional[str] = None) -> ClusteredMesh:
+    assert resolution > 0, f"Expected a positive resolution, received {resolution}"
+
+    with tempfile.TemporaryDirectory(dir=work_directory) as directory:
+        vertex_count, face_count, lower, upper = spool_geometry(file_name, directory, chunk_size)
+        assert vertex_count > 0 and face_count > 0, f"{file_name} has no triangles"
+
+        # Cubic cells, resolution of them along the longest side of the bounding box
+        cell_size = max(float((upper - lower).max()), 1e-12) / resolution
+        grid = np.maximum(np.ceil((upper - lower) / cell_size).astype(np.int64), 1)
+
+        def cells_of(points):
+            index = np.clip(((points - lower) / cell_size).astype(np.int64), 0, grid - 1)
+            return (index[:, 0] * grid[1] + index[:, 1]) * grid[2] + index[:, 2]
+
+        positions = open_table(directory, "positions.bin", vertex_count, 3, np.float64)
+        faces = open_table(directory, "faces.bin", face_count, 3, np.int64)
+
+        # Every face corner is a vertex so the cells holding a vertex are all the table needs
+        occupied = np.zeros(0, dtype=np.int64)
+
+        for start in range(0, vertex_count, block_size):
+            occupied = np.union1d(occupied, cells_of(np.asarray(positions[start:start + block_size])))
+
+        def rows_of(cells):
+            return np.searchsorted(occupied, cells)
+
+        table = open_table(directory, "cells.bin", len(occupied), CELL_TABLE_WIDTH, np.float64, mode="w+")
+
+        # Mean position of every cell, the fallback for directions its quadric does not constrain
+        for start in range(0, vertex_count, block_size):
+            block = np.asarray(positions[start:start + block_size])
+            cells, sums = reduce_rows(cells_of(block), np.concatenate([block, np.ones((len(block), 1))], axis=1))
+            table[rows_of(cells), POSITION_COLUMNS.start:] += sums
+
+        kept = []
+
+        for start in range(0, face_count, block_size):
+            block = np.asarray(faces[start:start + block_size])
+            a, b, c = positions[block[:, 0]], positions[block[:, 1]], positions[block[:, 2]]
+            corner_cells = np.stack([cells_of(a), cells_of(b), cells_of(c)], axis=1)
+
+            quadrics = face_quadrics(a, b, c)
+            cells, sums = reduce_rows(corner_cells.ravel(), np.repeat(quadrics, 3, axis=0))
+            table[rows_of(cells), QUADRIC_COLUMNS] += sums
+
+            # A face survives when its corners land in three different cells
+            distinct = (corner_cells[:, 0] != corner_cells[:, 1]) & (corner_cells[:, 1] != corner_cells[:, 2]) & (corner_cells[:, 0] != corner_cells[:, 2])
+            kept.append(corner_cells[distinct])
+
+        kept = np.concatenate(kept)
+
+        # Several input faces can map onto the same cell triangle, the first one seen keeps its orientation
+        canonical = np.sort(kept, axis=1)
+        order = np.lexsort((canonical[:, 2], canonical[:, 1], canonical[:, 0]))
+        first = order[np.r_[True, np.any(canonical[order][1:] != canonical[order][:-1], axis=1)]] if len(order) > 0 else order
+        kept = kept[np.sort(first)]
+
+        used = np.unique(kept)
+        rows = np.asarray(table[rows_of(used)])
+        cell_index = np.stack([used // (grid[1] * grid[2]), (used // grid[2]) % grid[1], used % grid[2]], axis=1)
+        output_positions = representatives(rows, lower + cell_index * cell_size, cell_size)
+
+        statistics = {
+            "input_vertices": vertex_count,
+            "input_faces": face_count,
+            "grid": grid.tolist(),
+            "cell_size": cell_size,
+            "occupied_cells": len(occupied),
+            "output_vertices": len(used),
+            "output_faces": len(kept)
+        }
+
+        # The memory maps have to be released before the directory is removed on some platforms
+        del positions, faces, table
+
+    return ClusteredMesh(output_positions, np.searchsorted(used, kept).astype(np.int64), statistics)
+
+def main(arguments: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Out-of-core vertex clustering of a large .obj file")
+    parser.add_argument("input", help=".obj file to simplify")
+    parser.add_argument("--resolution", type=int, default=128, help="grid cells along the longest side of the bounding box")
+    parser.add_argument("--output", default=None, help="clustered .obj file, defaults to <input>.clustered.obj")
+    parser.add_argument("--work-directory", default=None, help="where the temporary tables are stored, defaults to the system temporary directory")
+    parser.add_argument("--block-size", type=int, default=1 << 20, help="faces and vertices processed per block")
+    parser.add_argument("--reduce-to", type=int, default=None, help="also reduce the clustered mesh to this many polygons with the edge collapse path")
+    parser.add_argument("--engine", default="queue", choices=list(COLLAPSE_ENGINES.keys()), help="collapse engine used by --reduce-to")
+    options = parser.parse_args(arguments)
+
+    start = time.time()
+    mesh = cluster_obj_file(options.input, options.resolution, options.block_size, work_directory=options.work_directory)
+    output = options.output if options.output is not None else '.'.join(options.input.split(".")[:-1]) + ".clustered.obj"
+    mesh.write(output)
+
+    print(f"Clustered {mesh.statistics['input_faces']} faces into {mesh.statistics['output_faces']} in {time.time() - start:.2f}s, written to {output}")
+
+    if options.reduce_to is not None and mesh.statistics["output_faces"] <= options.reduce_to:
+        print(f"The clustered mesh already has at most {options.reduce_to} polygons, nothing to reduce")
+    elif options.reduce_to is not None:
+        model = mesh.to_model(output)
+        model.reduce(None, lambda iterations, polygons: polygons <= options.reduce_to, engine=options.engine)
+        print(f"Reduced to {model.graph.polygon_count()} polygons, written to {write_obj_file(model, write_reduction_records=True)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
-from typing import Dict, List
+from typing import Any, Dict, List, Set, Tuple
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 class VertexData:
@@ -12,30 +11,112 @@ class VertexGraph:
         self.indices: List[str] = []
         self.index_data: Dict[str, VertexData] = {}
         self.edges = {}
+        self.quadrics: Dict[str, np.ndarray] = {}
+        # Face table (index buffer) with vertex to face incidence
+        # Faces keep their winding order, face_lookup dedupes faces over the same vertices
+        self.faces: Dict[int, Tuple[str, str, str]] = {}
+        self.face_lookup: Dict[Tuple[str, ...], int] = {}
+        self.vertex_faces: Dict[str, Set[int]] = {}
         self.m_count = 0
+        # Put in front of new midpoint names so graphs reduced apart (tiled_decimation.py) never reuse a name
+        self.midpoint_prefix = ""
+        self.f_count = 0
+        # Optimal placement by solving the quadric system, midpoints are used when disabled
+        self.inversion_enabled = False
+
+    def has_vertex(self, index):
+        return index in self.index_data
+
+    def get_coords(self, index):
+        return self.index_data[index].coords
+
+    def vertex_names(self):
+        return self.indices
+
+    def vertex_count(self):
+        return len(self.indices)
+
+    def get_face(self, face_id):
+        return self.faces[face_id]
+
+    def face_ids(self):
+        return self.faces.keys()
+
+    def face_ids_of(self, index):
+        return self.vertex_faces[index]
+
+    def gather_coords(self, indices):
+        return np.array([self.get_coords(index) for index in indices], dtype=np.float64).reshape(-1, 3)
+
+    def gather_quadrics(self, indices):
+        return np.array([self.get_quadric(index) for index in indices], dtype=np.float64).reshape(-1, 4, 4)
 
     def add_node(self, index, coords):
-        assert index not in self.indices
+        assert index not in self.index_data
         assert len(coords) == 3
 
         self.indices.append(index)
         self.index_data[index] = VertexData(coords)
         self.edges[index] = set()
+        self.vertex_faces[index] = set()
 
     def add_edge(self, index_one, index_two):
-        assert index_one in self.indices
-        assert index_two in self.indices
+        assert index_one in self.index_data
+        assert index_two in self.index_data
         assert index_one != index_two
 
         self.edges[index_one].add(index_two)
         self.edges[index_two].add(index_one)
+
+    def add_mesh(self, names, coords, faces):
+        # Bulk build from parallel arrays where faces index into names
+        for index, vertex_coords in zip(names, np.asarray(coords, dtype=np.float64).reshape(-1, 3).tolist()):
+            self.add_node(index, tuple(vertex_coords))
+
+        for a, b, c in np.asarray(faces).reshape(-1, 3).tolist():
+            self.add_face(names[a], names[b], names[c])
+
+    def add_face(self, a, b, c):
+        key = tuple(sorted((str(a), str(b), str(c))))
+
+        # e.g. front and back faces of the same triangle
+        if key in self.face_lookup:
+            return self.face_lookup[key]
+
+        self.add_edge(a, b)
+        self.add_edge(a, c)
+        self.add_edge(b, c)
+
+        face_id = self.f_count
+        self.f_count += 1
+
+        self.faces[face_id] = (a, b, c)
+        self.face_lookup[key] = face_id
+
+        for vertex in (a, b, c):
+            self.vertex_faces[vertex].add(face_id)
+
+        return face_id
+
+    def remove_face(self, face_id):
+        face = self.faces.pop(face_id)
+        del self.face_lookup[tuple(sorted(str(vertex) for vertex in face))]
+
+        for vertex in face:
+            self.vertex_faces[vertex].discard(face_id)
+
+    def polygon_count(self):
+        return len(self.faces)
     
     def get_neighbours(self, index):
-        assert index in self.indices
+        assert index in self.index_data
         return self.edges[index]
 
     def remove_node(self, index):
-        assert index in self.indices
+        assert index in self.index_data
+
+        for face_id in list(self.vertex_faces[index]):
+            self.remove_face(face_id)
         
         for neighbour in self.edges[index]:
             # i.e. midpoint
@@ -47,25 +128,33 @@ class VertexGraph:
         del self.edges[index]
         self.indices.remove(index)
         del self.index_data[index]
+        del self.vertex_faces[index]
+        self.quadrics.pop(index, None)
 
-    def collapse_edge(self, left, right):
-        assert left in self.indices
-        assert right in self.indices
+    def collapse_edge(self, left, right, midpoint_name=None):
+        # midpoint_name lets a replay recreate the name written in a reduction record, new names are m1, m2, ... after midpoint_prefix
+        assert left in self.index_data
+        assert right in self.index_data
 
         assert right in self.get_neighbours(left), "Nodes must be connected by an edge"
 
         left_data = self.index_data[left]
         left_x, left_y, left_z = left_data.coords
 
-        right_data = self.index_data[left]
+        right_data = self.index_data[right]
         right_x, right_y, right_z = right_data.coords
 
         midpoint_coords = ((left_x + right_x) / 2, (left_y + right_y) / 2, (left_z + right_z) / 2)
-        self.m_count += 1
-        midpoint_name = f"m{self.m_count}"
+        if midpoint_name is None:
+            self.m_count += 1
+            midpoint_name = f"{self.midpoint_prefix}m{self.m_count}"
 
         self.add_node(midpoint_name, midpoint_coords)
 
+        # The merged vertex inherits both sets of planes
+        if left in self.quadrics and right in self.quadrics:
+            self.quadrics[midpoint_name] = self.quadrics[left] + self.quadrics[right]
+
         for neighbour in self.get_neighbours(left):
             self.add_edge(midpoint_name, neighbour)
 
@@ -75,134 +164,184 @@ class VertexGraph:
             
             self.add_edge(midpoint_name, neighbour)
 
-        self.remove_node(left)
-        self.remove_node(right)
+        # Faces using both endpoints become degenerate, the rest are moved onto the midpoint
+        moved_faces = []
 
-        return midpoint_name
+        for face_id in list(self.vertex_faces[left] | self.vertex_faces[right]):
+            face = self.faces[face_id]
+            self.remove_face(face_id)
 
-    def compute_polygons(self, origin):
-        polygons = dict()
-        neighbours = self.get_neighbours(origin)
-        a_coords = np.array(self.index_data[origin].coords)
-        epsilon = 1e-7
+            if left in face and right in face:
+                continue
 
-        # Go to each neighbour, check if any of their neighbours are also neighbours of the origin
-        for neighbour in neighbours:
-            shared_neighbours = self.get_neighbours(neighbour) & neighbours - {neighbour}
+            moved_faces.append(tuple(midpoint_name if vertex in (left, right) else vertex for vertex in face))
 
-            for shared in shared_neighbours:
-                left = str(shared) if str(shared) < str(neighbour) else str(neighbour)
-                right = str(shared) if str(shared) > str(neighbour) else str(neighbour)
+        self.remove_node(left)
+        self.remove_node(right)
 
-                b_coords = np.array(self.index_data[shared].coords)
-                c_coords = np.array(self.index_data[neighbour].coords)
+        # Two moved faces can land on the same vertices, sorting picks the one that survives by content rather than
+        # by face id, ids are renumbered when a graph is rebuilt from a checkpoint
+        for face in sorted(moved_faces):
+            self.add_face(*face)
 
-                ab = b_coords - a_coords
-                ac = c_coords - a_coords
+        return midpoint_name
 
-                cross = np.cross(ab, ac)
-                cross_norm = np.linalg.norm(cross)
+    def compute_face_normal(self, face_id):
+        epsilon = 1e-7
+        a, b, c = self.get_face(face_id)
 
-                # Avoid a div by 0
-                normal_vec = cross / (cross_norm + epsilon)
+        a_coords = np.array(self.get_coords(a))
+        b_coords = np.array(self.get_coords(b))
+        c_coords = np.array(self.get_coords(c))
 
-                polygon = sorted((str(origin), left, right))
-                polygons[str(polygon)] = {
-                    "polygon": polygon,
-                    "normal": normal_vec
-                }
+        cross = np.cross(b_coords - a_coords, c_coords - a_coords)
+        cross_norm = np.linalg.norm(cross)
 
-        return polygons
+        # Avoid a div by 0
+        return cross / (cross_norm + epsilon)
 
-    def compute_all_polygons(self):
+    def _describe_faces(self, face_ids):
         polygons = dict()
 
-        for index in self.indices:
-            polygons = dict(polygons, **self.compute_polygons(index))
+        # polygon keeps the winding of the face, the sorted names only key the dictionary
+        for face_id in face_ids:
+            polygon = [str(vertex) for vertex in self.get_face(face_id)]
+            polygons[str(sorted(polygon))] = {
+                "polygon": polygon,
+                "normal": self.compute_face_normal(face_id)
+            }
 
         return polygons
 
+    def compute_polygons(self, origin):
+        assert self.has_vertex(origin)
+        return self._describe_faces(self.face_ids_of(origin))
+
+    def compute_all_polygons(self):
+        return self._describe_faces(self.face_ids())
+
     def compute_vertex_quadric_matrix(self, index):
-        assert index in self.indices
+        assert self.has_vertex(index)
 
         epsilon = 1e-7
         polygons = self.compute_polygons(index)
-        a_coords = np.array(self.index_data[index].coords)
-        Q_matrix = np.zeros((4, 4))
 
-        for polygon_data in polygons.values():
-            _, b, c = polygon_data["polygon"]
-            b_coords = np.array(self.index_data[b].coords)
-            c_coords = np.array(self.index_data[c].coords)
+        if len(polygons) == 0:
+            return np.zeros((4, 4))
 
-            ab = b_coords - a_coords
-            ac = c_coords - a_coords
+        a_coords = np.array(self.get_coords(index))
+        others = [[vertex for vertex in polygon_data["polygon"] if vertex != str(index)] for polygon_data in polygons.values()]
+        b_coords = np.array([self.get_coords(b) for b, _ in others])
+        c_coords = np.array([self.get_coords(c) for _, c in others])
 
-            cross = np.cross(ab, ac)
-            cross_norm = np.linalg.norm(cross)
+        cross = np.cross(b_coords - a_coords, c_coords - a_coords)
+        cross_norm = np.linalg.norm(cross, axis=1, keepdims=True)
 
-            # Avoid a div by 0
-            normal_vec = cross / (cross_norm + epsilon)
-            d = -np.dot(normal_vec, a_coords)
-            # a, b, c = normal_vec
-            plane_vec = np.asmatrix(np.append(normal_vec, d)).T
+        # Avoid a div by 0
+        normal_vecs = cross / (cross_norm + epsilon)
+        d = -normal_vecs @ a_coords
 
-            # Compute the Q matrix
-            K_p = plane_vec @ plane_vec.T
-            Q_matrix += K_p
+        # Each row is a plane (a, b, c, d), summing the outer products K_p = p p^T
+        # for every incident plane is the same as P^T P
+        planes = np.column_stack((normal_vecs, d))
+        return planes.T @ planes
 
-            # K_p = np.array([
-            #     [a ** 2, a * b, a * c, a * d],
-            #     [a * b, b ** 2, b * c, b * d],
-            #     [a * c, b * c, c ** 2, c * d],
-            #     [a * d, b * d, c * d, d ** 2]
-            # ])
+    def get_quadric(self, index):
+        # Quadrics are cached and merged on collapse (Garland-Heckbert) rather than recomputed
+        if index not in self.quadrics:
+            self.quadrics[index] = self.compute_vertex_quadric_matrix(index)
 
-        return Q_matrix
+        return self.quadrics[index]
 
-    def determine_preferred_collapsible_edge(self):
-        edge_pairs = set()
+    def cached_quadrics(self):
+        # Quadrics computed or merged so far by name, a checkpoint stores them as they are
+        return dict(self.quadrics)
+
+    def set_quadric(self, index, quadric):
+        assert self.has_vertex(index)
+        self.quadrics[index] = np.array(quadric, dtype=np.float64)
 
-        for start in self.edges.keys():
-            x, y, z = self.index_data[start].coords
+    def seed_quadrics(self):
+        for index in self.vertex_names():
+            self.get_quadric(index)
 
+    def compute_edge_pairs(self):
+        edge_pairs = set()
+
+        for start in self.vertex_names():
             for neighbour in self.get_neighbours(start):
                 left = str(start) if str(start) < str(neighbour) else str(neighbour)
                 right = str(start) if str(start) > str(neighbour) else str(neighbour)
 
                 edge_pairs.add((left, right))
 
-        # Get all quadric matrices
-        quadrics = {vertex: self.compute_vertex_quadric_matrix(vertex) for vertex in self.indices}
-        edge_errors = {}
+        return edge_pairs
+
+    def compute_edge_error(self, a, b):
+        # Same operations as one row of compute_edge_errors, so the exhaustive and batched engines score an edge
+        # bit for bit alike and pick the same collapses (near flat regions errors differ only by rounding otherwise)
+        combined_quadric = self.get_quadric(a) + self.get_quadric(b)
+
+        # The midpoint unless inversion is enabled and the quadric system can be solved
+        v_bar = np.ones(4)
+        v_bar[:3] = (np.asarray(self.get_coords(a), dtype=np.float64) + np.asarray(self.get_coords(b), dtype=np.float64)) / 2
+
+        if self.inversion_enabled:
+            partial_derivatives = combined_quadric.copy()
+            partial_derivatives[3] = [0.0, 0.0, 0.0, 1.0]
+
+            if np.abs(np.linalg.det(partial_derivatives)) > 1e-7:
+                v_bar = np.linalg.solve(partial_derivatives, np.array([[0.0], [0.0], [0.0], [1.0]]))[:, 0]
+
+        return float(np.einsum("i,ij,j->", v_bar, combined_quadric, v_bar))
+
+    def compute_edge_errors(self, edge_pairs):
+        # Batched equivalent of compute_edge_error over a list of (a, b) pairs
+        if len(edge_pairs) == 0:
+            return np.zeros(0)
+
+        a_names, b_names = zip(*edge_pairs)
+        combined_quadrics = self.gather_quadrics(a_names) + self.gather_quadrics(b_names)
+
+        v_bars = np.ones((len(edge_pairs), 4))
+        v_bars[:, :3] = (self.gather_coords(a_names) + self.gather_coords(b_names)) / 2
+
+        if self.inversion_enabled:
+            partial_derivatives = combined_quadrics.copy()
+            partial_derivatives[:, 3] = [0.0, 0.0, 0.0, 1.0]
+
+            # Singular systems keep the midpoint
+            invertible = np.abs(np.linalg.det(partial_derivatives)) > 1e-7
+
+            if np.any(invertible):
+                rhs = np.zeros((int(np.count_nonzero(invertible)), 4, 1))
+                rhs[:, 3] = 1.0
+                v_bars[invertible] = np.linalg.solve(partial_derivatives[invertible], rhs)[:, :, 0]
+
+        return np.einsum("ei,eij,ej->e", v_bars, combined_quadrics, v_bars)
+
+    def determine_preferred_collapsible_edge(self, batched=False, edge_pairs=None):
+        if edge_pairs is None:
+            edge_pairs = self.compute_edge_pairs()
+
+        # Equal errors go to the first pair by name rather than to the set order, which changes with PYTHONHASHSEED,
+        # so a checkpoint resumed in another process continues exactly like the uninterrupted run
+        edge_pairs = sorted(edge_pairs)
+
+        if batched:
+            if len(edge_pairs) == 0:
+                return False
+
+            return edge_pairs[int(np.argmin(self.compute_edge_errors(edge_pairs)))]
 
         smallest_error = None
         smallest_error_pair = None
 
-        inversion_enabled = False
-
         for a, b in edge_pairs:
-            combined_quadric = quadrics[a] + quadrics[b]
-            partial_derivatives = np.array([
-                combined_quadric[0],
-                combined_quadric[1],
-                combined_quadric[2],
-                [0.0, 0.0, 0.0, 1.0]
-            ])
-
-            # Just use the midpoint initially to test it works
-            is_invertible = np.abs(np.linalg.det(partial_derivatives)) > 1e-7 and inversion_enabled
-            v_bar = (np.array(self.index_data[a].coords) + np.array(self.index_data[b].coords)) / 2
-            v_bar = np.asmatrix(np.append(v_bar, 1)).T
-
-            if is_invertible:
-                v_bar = np.linalg.inv(partial_derivatives) @ np.asmatrix(np.array([0.0, 0.0, 0.0, 1.0])).T
-
-            quadric_error = v_bar.T @ combined_quadric @ v_bar
-            edge_errors[(a, b)] = quadric_error.item()
-
-            if smallest_error is None or quadric_error.item() < smallest_error:
-                smallest_error = quadric_error.item()
+            quadric_error = self.compute_edge_error(a, b)
+
+            if smallest_error is None or quadric_error < smallest_error:
+                smallest_error = quadric_error
                 smallest_error_pair = (a, b)
         
         if smallest_error_pair is None:
@@ -214,11 +353,12 @@ class VertexGraph:
         assert coords in self.index_data.values()
         return list(self.index_data.keys())[list(self.index_data.values()).index(coords)]
 
-    def split_vertex(self, vertex_name, a_name, a_coords, a_neighbours, b_name, b_coords, b_neighbours):
-        assert vertex_name in self.indices
-        assert a_name not in self.indices
-        assert b_name not in self.indices
+    def split_vertex(self, vertex_name, a_name, a_coords, a_neighbours, b_name, b_coords, b_neighbours, polygons=None):
+        assert self.has_vertex(vertex_name)
+        assert not self.has_vertex(a_name)
+        assert not self.has_vertex(b_name)
 
+        # Removing the node invalidates its merged quadric, a and b are recomputed on demand
         self.remove_node(vertex_name)
         self.add_node(a_name, a_coords)
         self.add_node(b_name, b_coords)
@@ -229,28 +369,45 @@ class VertexGraph:
         for b_neighbour in b_neighbours:
             self.add_edge(b_name, b_neighbour)
 
+        if polygons is not None:
+            for polygon in polygons:
+                self.add_face(*polygon)
+
+            return
+
+        # Without the recorded polygons fall back to treating mutually adjacent neighbours as faces
+        for name in (a_name, b_name):
+            neighbours = self.get_neighbours(name)
+
+            for neighbour in neighbours:
+                for shared in self.get_neighbours(neighbour) & neighbours - {neighbour}:
+                    self.add_face(name, neighbour, shared)
+
     def display(self, join=True, show_vertices=True, label_vertices=True):
+        # Imported here so headless tools (e.g. batch_decimate.py) never load a plotting backend
+        import matplotlib.pyplot as plt
+
         fig = plt.figure()
 
         # Plot a 3D scatter of the vertices
         ax = fig.add_subplot(projection="3d")
         marker = "." if show_vertices else "None"
-        ax.scatter(*zip(*[vertex_data.coords for vertex_data in self.index_data.values()]), marker=marker) # type: ignore
+        ax.scatter(*zip(*[self.get_coords(index) for index in self.vertex_names()]), marker=marker) # type: ignore
 
         if show_vertices and label_vertices:
-            for index in self.indices:
-                x, y, z = self.index_data[index].coords
+            for index in self.vertex_names():
+                x, y, z = self.get_coords(index)
                 ax.text(x, y, z, str(index), color="k") # type: ignore
 
-        print(f"Vertices: {len(self.index_data.keys())}")
+        print(f"Vertices: {self.vertex_count()}")
 
         # Determine scale
         x_scale = None
         y_scale = None
         z_scale = None
 
-        for vertex in self.index_data.values():
-            x, y, z = vertex.coords
+        for index in self.vertex_names():
+            x, y, z = self.get_coords(index)
 
             if x_scale is None or np.abs(x) > x_scale:
                 x_scale = np.abs(x)
@@ -268,11 +425,11 @@ class VertexGraph:
             plotted_edges = set()
             real_edge_count = 0
 
-            for start in self.edges.keys():
-                x, y, z = self.index_data[start].coords
+            for start in self.vertex_names():
+                x, y, z = self.get_coords(start)
 
                 for neighbour in self.get_neighbours(start):
-                    nx, ny, nz = self.index_data[neighbour].coords
+                    nx, ny, nz = self.get_coords(neighbour)
                     real_edge_count += 1
 
                     left = str(start) if str(start) < str(neighbour) else str(neighbour)
@@ -287,6 +444,31 @@ class VertexGraph:
             
             print(f"Edges: {len(plotted_edges)} ({real_edge_count})")
 
-        print(f"Polygons: {len(self.compute_all_polygons())}")
+        print(f"Polygons: {self.polygon_count()}")
 
         plt.show()
+
+def graph_to_arrays(graph: VertexGraph) -> Dict[str, Any]:
+    # Mesh of either backend as names, coords (float64), faces (rows of name indices in their winding) and edges
+    # Edges are kept as well, a collapse or split may leave an edge that no face uses
+    names = list(graph.vertex_names())
+    ids = {name: i for i, name in enumerate(names)}
+
+    return {
+        "names": names,
+        "coords": np.asarray(graph.gather_coords(names), dtype=np.float64).reshape(-1, 3),
+        "faces": np.array([[ids[vertex] for vertex in graph.get_face(face_id)] for face_id in graph.face_ids()], dtype=np.int64).reshape(-1, 3),
+        "edges": np.array([(ids[name], ids[neighbour]) for name in names for neighbour in graph.get_neighbours(name) if ids[name] < ids[neighbour]], dtype=np.int64).reshape(-1, 2)
+    }
+
+def graph_from_arrays(graph_type, arrays: Dict[str, Any]) -> VertexGraph:
+    # New graph_type (VertexGraph, ArrayVertexGraph) holding the mesh of graph_to_arrays, quadrics are not included
+    names = list(arrays["names"])
+
+    graph = graph_type()
+    graph.add_mesh(names, arrays["coords"], arrays["faces"])
+
+    for a, b in np.asarray(arrays["edges"]).tolist():
+        graph.add_edge(names[a], names[b])
+
+    return graph